@@ -0,0 +1,86 @@
+"""
+Compares encoded size and encode/decode speed of bit mask mode and adaptive mode over a sweep of
+densities of non-zero values, plus a clustered input mixing all-zero, sparse and dense regions.
+
+Usage (from the repository root):
+python -m benchmarks.adaptive_density [number of values] [adaptive chunk size]
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+from utils.arraytools import np
+from utils.chunktools import DEFAULT_ADAPTIVE_CHUNK_SIZE
+from utils.encoder import Encoder
+from utils.filetools import MODE_ADAPTIVE, MODE_BITMASK, FileConstructor, FileReader
+
+DENSITIES = [0.0, 0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 0.75, 0.9, 1.0]
+
+
+def random_values(num_values: int, density: float):
+    """
+    Creates float64 values where roughly density of them are non-zero
+    """
+    if np is not None:
+        values = np.random.random(num_values) + 1
+        values[np.random.random(num_values) >= density] = 0
+        return values
+
+    return [random.random() + 1 if random.random() < density else 0.0 for _ in range(num_values)]
+
+
+def clustered_values(num_values: int, region_size: int):
+    """
+    Creates float64 values in regions that are all zero, 1% dense or fully dense
+    """
+    regions = [random_values(min(region_size, num_values - start), random.choice([0.0, 0.01, 1.0]))
+               for start in range(0, num_values, region_size)]
+    if np is not None:
+        return np.concatenate(regions)
+
+    return [value for region in regions for value in region]
+
+
+def measure(decoded_file: str, encoded_file: str, mode: int, chunk_size: int):
+    """
+    Encodes decoded_file into encoded_file and decodes it again
+
+    Returns:
+    int: encoded file size
+    float: encode seconds
+    float: decode seconds
+    """
+    start = time.perf_counter()
+    Encoder.encode_bin_file(decoded_file, output=encoded_file, mode=mode, adaptive_chunk_size=chunk_size)
+    encode_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    FileReader.array_from_encoded(encoded_file)
+    decode_time = time.perf_counter() - start
+
+    return os.path.getsize(encoded_file), encode_time, decode_time
+
+
+if __name__ == "__main__":
+    num_values = int(sys.argv[1]) if len(sys.argv) > 1 else 4_000_000
+    chunk_size = int(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_ADAPTIVE_CHUNK_SIZE
+
+    inputs = [(f"{density:g}", random_values(num_values, density)) for density in DENSITIES]
+    inputs.append(("clustered", clustered_values(num_values, 4 * chunk_size)))
+
+    with tempfile.TemporaryDirectory() as directory:
+        decoded_file = os.path.join(directory, "decoded.bin")
+        encoded_file = os.path.join(directory, "encoded.bin")
+
+        print(f"{num_values} float64 values, adaptive chunk size {chunk_size}")
+        print(f"{'density':<10}{'mode':<10}{'ratio':>8}{'encode MB/s':>13}{'decode MB/s':>13}")
+
+        for name, values in inputs:
+            FileConstructor.list_to_binary_file(values, 'd', decoded_file)
+            decoded_size = os.path.getsize(decoded_file)
+
+            for mode_name, mode in (("bitmask", MODE_BITMASK), ("adaptive", MODE_ADAPTIVE)):
+                encoded_size, encode_time, decode_time = measure(decoded_file, encoded_file, mode, chunk_size)
+                print(f"{name:<10}{mode_name:<10}{encoded_size / decoded_size:>8.3f}"
+                      f"{decoded_size / 1e6 / encode_time:>13.1f}{decoded_size / 1e6 / decode_time:>13.1f}")
@@ -0,0 +1,65 @@
+"""
+Measures the total number of bytes read from disk by one compressor.py invocation.
+
+Usage (from the repository root, Linux only):
+python -m benchmarks.bytes_read [number of values] [density of non-zero values]
+"""
+import os
+import random
+import runpy
+import sys
+import tempfile
+from utils.filetools import FileConstructor
+
+COMPRESSOR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "compressor.py")
+
+
+def bytes_read_so_far():
+    """
+    Returns the number of bytes this process has read through read system calls (rchar in /proc/self/io)
+    """
+    with open("/proc/self/io") as f:
+        for line in f:
+            if line.startswith("rchar:"):
+                return int(line.split()[1])
+
+
+def measure(file_name: str):
+    """
+    Runs compressor.py on a file in this process and returns the bytes read and the size of the input file
+    """
+    file_size = os.path.getsize(file_name)
+    sys.argv = [COMPRESSOR, file_name]
+
+    #reading /proc/self/io is itself a read, so measure its cost and subtract it
+    start = bytes_read_so_far()
+    overhead = bytes_read_so_far() - start
+
+    start = bytes_read_so_far()
+    try:
+        runpy.run_path(COMPRESSOR, run_name="__main__")
+    except SystemExit:
+        pass
+    end = bytes_read_so_far()
+
+    return end - start - overhead, file_size
+
+
+if __name__ == "__main__":
+    num_values = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    density = float(sys.argv[2]) if len(sys.argv) > 2 else 0.1
+
+    values = [random.random() if random.random() < density else 0.0 for _ in range(num_values)]
+
+    with tempfile.TemporaryDirectory() as directory:
+        file_name = FileConstructor.list_to_binary_file(values, 'd', os.path.join(directory, "values.bin"))
+
+        #warm up so modules imported by compressor.py are not counted
+        measure(FileConstructor.list_to_binary_file([0.0], 'd', os.path.join(directory, "warmup.bin")))
+
+        #first run encodes the decoded file, second run decodes it again
+        results = [("encode", *measure(file_name)), ("decode", *measure(file_name))]
+
+    print(f"{'run':<8}{'input bytes':>14}{'bytes read':>14}{'ratio':>8}")
+    for run, read, size in results:
+        print(f"{run:<8}{size:>14}{read:>14}{read / size:>8.2f}")
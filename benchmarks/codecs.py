@@ -0,0 +1,91 @@
+"""
+Reports the compression ratio and throughput tradeoff of the secondary codecs (zlib, lzma, bz2) applied
+to the split, byte-shuffled mask and value streams of bit mask mode, against plain bit mask mode.
+Decoding is measured both for whole files and streamed frame by frame.
+
+Usage (from the repository root):
+python -m benchmarks.codecs [number of values]
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+from benchmarks.adaptive_density import random_values
+from utils.arraytools import np
+from utils.codectools import CODEC_BZ2, CODEC_LZMA, CODEC_NONE, CODEC_ZLIB
+from utils.decoder import Decoder
+from utils.encoder import Encoder
+from utils.filetools import FileConstructor, FileReader
+
+#(name, codec, level)
+CODECS = [("bitmask", CODEC_NONE, None), ("shuffle", CODEC_NONE, None),
+          ("zlib-1", CODEC_ZLIB, 1), ("zlib-6", CODEC_ZLIB, 6), ("zlib-9", CODEC_ZLIB, 9),
+          ("lzma-0", CODEC_LZMA, 0), ("lzma-6", CODEC_LZMA, 6),
+          ("bz2-1", CODEC_BZ2, 1), ("bz2-9", CODEC_BZ2, 9)]
+
+
+def quantized_values(num_values: int, density: float):
+    """
+    Creates float64 values with two decimals (as read from a sensor or a CSV file) where roughly density of them are non-zero
+    """
+    if np is not None:
+        values = np.round(np.random.normal(20, 5, num_values), 2)
+        values[np.random.random(num_values) >= density] = 0
+        return values
+
+    return [round(random.gauss(20, 5), 2) if random.random() < density else 0.0 for _ in range(num_values)]
+
+
+def measure(decoded_file: str, encoded_file: str, codec: int, level: int, split: bool):
+    """
+    Encodes decoded_file into encoded_file and decodes it whole and streamed
+
+    Returns:
+    int: encoded file size
+    float: encode seconds
+    float: decode seconds
+    float: streamed decode seconds
+    """
+    start = time.perf_counter()
+    if split:
+        Encoder.encode_bin_file(decoded_file, output=encoded_file, codec=codec, level=level)
+    else:
+        Encoder.encode_bin_file(decoded_file, output=encoded_file)
+    encode_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    FileReader.array_from_encoded(encoded_file)
+    decode_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    with open(encoded_file, 'rb') as f:
+        for _ in Decoder.iter_decode(f):
+            pass
+    stream_time = time.perf_counter() - start
+
+    return os.path.getsize(encoded_file), encode_time, decode_time, stream_time
+
+
+if __name__ == "__main__":
+    num_values = int(sys.argv[1]) if len(sys.argv) > 1 else 2_000_000
+
+    inputs = [("random 10%", random_values(num_values, 0.1)), ("quantized 10%", quantized_values(num_values, 0.1)),
+              ("quantized 50%", quantized_values(num_values, 0.5))]
+
+    with tempfile.TemporaryDirectory() as directory:
+        decoded_file = os.path.join(directory, "decoded.bin")
+        encoded_file = os.path.join(directory, "encoded.bin")
+
+        print(f"{num_values} float64 values")
+        print(f"{'input':<15}{'codec':<9}{'ratio':>8}{'encode MB/s':>13}{'decode MB/s':>13}{'stream MB/s':>13}")
+
+        for name, values in inputs:
+            FileConstructor.list_to_binary_file(values, 'd', decoded_file)
+            decoded_size = os.path.getsize(decoded_file)
+
+            for codec_name, codec, level in CODECS:
+                encoded_size, encode_time, decode_time, stream_time = measure(decoded_file, encoded_file, codec, level,
+                                                                              codec_name != "bitmask")
+                print(f"{name:<15}{codec_name:<9}{encoded_size / decoded_size:>8.3f}{decoded_size / 1e6 / encode_time:>13.1f}"
+                      f"{decoded_size / 1e6 / decode_time:>13.1f}{decoded_size / 1e6 / stream_time:>13.1f}")
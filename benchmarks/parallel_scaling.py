@@ -0,0 +1,64 @@
+"""
+Measures encode and decode time of ParallelCoder for 1 up to N worker processes.
+
+The file has no sidecar block index, so every decode starts with one serial scan for the positions of
+the masks (the workers reuse them). That scan does not get faster with more workers and bounds the
+decode speedup; with a saved BlockIndex, each worker finds the masks of its own segment instead.
+
+Usage (from the repository root):
+python -m benchmarks.parallel_scaling [number of values] [density of non-zero values] [max workers]
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+from utils.arraytools import ArrayTools, np
+from utils.filetools import FileConstructor
+from utils.paralleltools import ParallelCoder
+
+
+def random_values(num_values: int, density: float):
+    """
+    Creates float64 values where roughly density of them are non-zero
+    """
+    if np is not None:
+        values = np.random.random(num_values)
+        values[values >= density] = 0
+        return values / density if density else values
+
+    return [random.random() if random.random() < density else 0.0 for _ in range(num_values)]
+
+
+if __name__ == "__main__":
+    num_values = int(sys.argv[1]) if len(sys.argv) > 1 else 20_000_000
+    density = float(sys.argv[2]) if len(sys.argv) > 2 else 0.1
+    max_workers = int(sys.argv[3]) if len(sys.argv) > 3 else (os.cpu_count() or 1)
+
+    values = random_values(num_values, density)
+
+    with tempfile.TemporaryDirectory() as directory:
+        file_name = os.path.join(directory, "values.bin")
+        with open(file_name, 'wb') as f:
+            f.write(FileConstructor.create_first_byte(False, 'd'))
+            f.write(ArrayTools.to_bytes(values, 'd'))
+        decoded_size = os.path.getsize(file_name)
+
+        print(f"{num_values} values, density {density}, {decoded_size / 1e6:.1f} MB decoded")
+        print(f"{'workers':>8}{'encode s':>10}{'MB/s':>9}{'speedup':>9}{'decode s':>10}{'MB/s':>9}{'speedup':>9}")
+
+        baseline = None
+        for workers in range(1, max_workers + 1):
+            start = time.perf_counter()
+            ParallelCoder.encode_bin_file(file_name, workers)
+            encode_time = time.perf_counter() - start
+
+            start = time.perf_counter()
+            ParallelCoder.decode_bin_file(file_name, workers)
+            decode_time = time.perf_counter() - start
+
+            if baseline is None:
+                baseline = (encode_time, decode_time)
+
+            print(f"{workers:>8}{encode_time:>10.3f}{decoded_size / 1e6 / encode_time:>9.1f}{baseline[0] / encode_time:>9.2f}"
+                  f"{decode_time:>10.3f}{decoded_size / 1e6 / decode_time:>9.1f}{baseline[1] / decode_time:>9.2f}")
@@ -0,0 +1,101 @@
+"""
+Startup benchmark for the command line tools: measures the time taken to import compressor.py and viewer.py
+in fresh interpreters (with -X importtime, so interpreter startup is left out) and checks that heavy modules
+(NumPy, torch, multiprocessing) are not imported before they are used. Exits with status 1 if a tool is
+over its import time budget or imports a module it should not.
+
+Usage (from the repository root):
+python -m benchmarks.startup [--repeat 7] [--scale 1.0] [--top 5]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+#import time budget of every command line tool in milliseconds (measured at about 25 ms for compressor and
+#20 ms for viewer), with headroom for slower machines
+BUDGETS = {
+    "compressor": 60,
+    "viewer": 50,
+}
+
+#modules only imported once a tool needs them
+LAZY_MODULES = ["numpy", "torch", "multiprocessing"]
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def measure(module: str):
+    """
+    Imports a module in a fresh interpreter
+
+    Parameters:
+    module (str): name of the module
+
+    Returns:
+    float: cumulative import time of the module in milliseconds
+    dict: cumulative import time in milliseconds of every module imported
+    set: names of all modules loaded after the import
+    """
+    command = [sys.executable, "-X", "importtime", "-c", f"import sys, {module}; print(' '.join(sys.modules))"]
+    process = subprocess.run(command, cwd=ROOT, capture_output=True, text=True)
+    if process.returncode:
+        raise Exception(f"Importing {module} failed:\n{process.stderr}")
+
+    #lines read "import time: self [us] | cumulative | imported package", nesting shown by indentation
+    times = {}
+    for line in process.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        times[name.strip()] = int(cumulative) / 1000
+
+    return times[module], times, set(process.stdout.split())
+
+
+def check(module: str, repeat: int, scale: float, top: int):
+    """
+    Measures the import time of a tool and checks its budget and lazily imported modules
+
+    Returns:
+    list: problems found (empty if the tool is within its budget)
+    """
+    samples = []
+    for _ in range(repeat):
+        milliseconds, times, loaded = measure(module)
+        samples.append(milliseconds)
+
+    median = statistics.median(samples)
+    budget = BUDGETS[module] * scale
+    print(f"{module:<12} {median:7.1f} ms (budget {budget:.0f} ms, min {min(samples):.1f}, max {max(samples):.1f})")
+
+    slowest = sorted((name for name in times if name != module), key=times.get, reverse=True)[:top]
+    for name in slowest:
+        print(f"    {name:<32} {times[name]:7.1f} ms")
+
+    problems = []
+    if median > budget:
+        problems.append(f"{module} takes {median:.1f} ms to import, over its budget of {budget:.0f} ms")
+    for name in LAZY_MODULES:
+        if name in loaded:
+            problems.append(f"{module} imports {name} at startup")
+
+    return problems
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Checks the import time of the command line tools against their budgets")
+    parser.add_argument("--repeat", type=int, default=7, help="fresh interpreters started per tool (the median is used)")
+    parser.add_argument("--scale", type=float, default=1.0, help="factor applied to every budget (e.g. 2 on slow machines)")
+    parser.add_argument("--top", type=int, default=5, help="number of slowest imports shown per tool")
+    arguments = parser.parse_args()
+
+    problems = []
+    for module in BUDGETS:
+        problems += check(module, arguments.repeat, arguments.scale, arguments.top)
+
+    for problem in problems:
+        print(f"FAILED: {problem}")
+
+    sys.exit(1 if problems else 0)
@@ -0,0 +1,402 @@
+"""
+Reproducible benchmark suite for the main encode, decode, conversion, torch and viewer paths. Inputs are
+generated from a fixed seed for every data type, density of non-zero values and size. Every case runs in
+a fresh subprocess, so its peak resident memory is its own. Results are written to JSON, and two result
+files can be compared to flag regressions.
+
+Usage (from the repository root):
+python -m benchmarks.suite run [--output results.json] [--sizes 1000,1000000] [--densities 0,0.01,0.5,1]
+                               [--dtypes d,f,i] [--paths encode,decode] [--modes bitmask,adaptive] [--min-time 0.2]
+python -m benchmarks.suite run --full
+python -m benchmarks.suite compare old.json new.json [--threshold 0.1] [--rss-threshold 0.2]
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import runpy
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+from utils.arraytools import np
+from utils.encoder import Encoder
+from utils.filetools import MODE_ADAPTIVE, MODE_BITMASK, MODE_BITMASK64, FileConstructor, FileConverter, FileReader
+from utils.typetools import BFLOAT16, DataHelper
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+#every data type DataHelper can store
+DTYPES = ['b', 'h', 'i', 'l', 'B', 'H', 'I', 'L', '?', 'e', 'f', 'd', BFLOAT16]
+
+DEFAULT_SIZES = [1_000, 1_000_000]
+FULL_SIZES = [1_000, 100_000, 1_000_000, 10_000_000, 100_000_000]
+DENSITIES = [0.0, 0.001, 0.01, 0.1, 0.5, 0.9, 1.0]
+
+MODES = {"bitmask": MODE_BITMASK, "adaptive": MODE_ADAPTIVE, "bitmask64": MODE_BITMASK64}
+
+#paths measured, and the input file each one reads
+PATHS = {
+    "encode": "decoded",
+    "decode": "encoded",
+    "decode_array": "encoded",
+    "read_decoded": "decoded",
+    "csv": "csv",
+    "torch": "encoded",
+    "viewer": "encoded",
+}
+
+#paths whose speed does not depend on the encoding mode
+MODELESS_PATHS = ("read_decoded", "csv")
+
+#CSV text is an order of magnitude larger than binary values, so the CSV path stops at this size
+MAX_CSV_SIZE = 10_000_000
+
+#seed of the generated values, so runs on different trees measure the same inputs
+SEED = 20240501
+
+VIEWER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "viewer.py")
+
+
+def generate(chr_rep: str, num_values: int, density: float, seed: int=SEED):
+    """
+    Creates values of a data type where roughly density of them are non-zero
+
+    Parameters:
+    chr_rep (str): struct module character representation of data type, or BFLOAT16
+    num_values (int): number of values
+    density (float): fraction of non-zero values
+    seed (int): seed of the random values
+
+    Returns:
+    numpy.ndarray: values (16-bit patterns for bfloat16), list if NumPy is not installed
+    """
+    storage_letter = DataHelper.storage_letter(chr_rep)
+    num_type = DataHelper.type_from_letter(chr_rep)
+
+    if np is None:
+        return _generate_python(chr_rep, num_values, density, seed)
+
+    rng = np.random.default_rng(seed)
+    non_zero = rng.random(num_values) < density
+    count = int(non_zero.sum())
+    values = np.zeros(num_values, dtype=storage_letter)
+
+    if num_type == 'bool':
+        values[non_zero] = True
+    elif chr_rep == BFLOAT16:
+        #upper half of float32 values, with the lowest bit set so no pattern is zero
+        values[non_zero] = (rng.normal(0, 100, count).astype(np.float32).view(np.uint32) >> 16).astype(np.uint16) | 1
+    elif num_type == 'float':
+        #two decimals, as read from a sensor or a CSV file
+        float_values = np.round(rng.normal(0, 100, count), 2)
+        float_values[float_values == 0] = 1
+        values[non_zero] = float_values
+    else:
+        high = min(int(np.iinfo(values.dtype).max), 1000)
+        int_values = rng.integers(1, high + 1, count)
+        if DataHelper.is_signed(chr_rep):
+            int_values *= rng.choice([-1, 1], count)
+        values[non_zero] = int_values
+
+    return values
+
+
+def _generate_python(chr_rep: str, num_values: int, density: float, seed: int):
+    """
+    Pure Python fallback for generate used when NumPy is not installed
+    """
+    rng = random.Random(seed)
+    num_type = DataHelper.type_from_letter(chr_rep)
+
+    if num_type == 'bool':
+        return [rng.random() < density for _ in range(num_values)]
+    if chr_rep == BFLOAT16:
+        return [(struct.unpack('<I', struct.pack('<f', rng.gauss(0, 100)))[0] >> 16) | 1 if rng.random() < density else 0
+                for _ in range(num_values)]
+    if num_type == 'float':
+        return [round(rng.gauss(0, 100), 2) or 1.0 if rng.random() < density else 0.0 for _ in range(num_values)]
+
+    high = min(2 ** (8 * struct.calcsize(chr_rep) - DataHelper.is_signed(chr_rep)) - 1, 1000)
+    sign = (lambda: rng.choice((-1, 1))) if DataHelper.is_signed(chr_rep) else (lambda: 1)
+    return [rng.randint(1, high) * sign() if rng.random() < density else 0 for _ in range(num_values)]
+
+
+def write_inputs(directory: str, chr_rep: str, num_values: int, density: float, modes: list, csv: bool):
+    """
+    Writes the decoded file, one encoded file per mode and optionally a CSV file of the generated values
+
+    Returns:
+    dict: input file names by kind ("decoded", "csv" and the encoded file of every mode by mode name)
+    dict: compression ratio (encoded size / decoded size) by mode name
+    """
+    values = generate(chr_rep, num_values, density)
+    files = {"decoded": os.path.join(directory, "decoded.bin")}
+    FileConstructor.list_to_binary_file(values, chr_rep, files["decoded"])
+    decoded_size = os.path.getsize(files["decoded"])
+
+    ratios = {}
+    for mode_name in modes:
+        files[mode_name] = os.path.join(directory, f"encoded_{mode_name}.bin")
+        Encoder.encode_bin_file(files["decoded"], output=files[mode_name], mode=MODES[mode_name])
+        ratios[mode_name] = os.path.getsize(files[mode_name]) / decoded_size
+
+    if csv:
+        files["csv"] = os.path.join(directory, "values.csv")
+        with open(files["csv"], 'w') as f:
+            if np is not None:
+                np.savetxt(f, values, fmt="%.2f" if DataHelper.type_from_letter(chr_rep) == 'float' else "%d")
+            else:
+                f.writelines(f"{value}\n" for value in values)
+
+    return files, ratios
+
+
+def operation(path: str, file_name: str, chr_rep: str, mode: int, output: str):
+    """
+    Returns a function running one benchmarked path on an input file
+    """
+    if path == "encode":
+        return lambda: Encoder.encode_bin_file(file_name, output=output, mode=mode)
+    if path == "decode":
+        return lambda: FileReader.list_from_encoded(file_name)
+    if path == "decode_array":
+        return lambda: FileReader.array_from_encoded(file_name)
+    if path == "read_decoded":
+        return lambda: FileReader.list_from_decoded(file_name)
+    if path == "csv":
+        return lambda: FileConverter.csv_to_binary_file(file_name, chr_rep, output)
+    if path == "torch":
+        from utils.torchtools import TorchConverter
+        return lambda: TorchConverter.binary_to_tensor(file_name)
+    if path == "viewer":
+        return lambda: run_viewer(file_name)
+
+    raise Exception(f"Unknown benchmark path {path!r}")
+
+
+def run_viewer(file_name: str):
+    """
+    Runs viewer.py on the first 100 values of a file, discarding what it prints
+    """
+    arguments = sys.argv
+    sys.argv = [VIEWER, file_name, "0", "100"]
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            runpy.run_path(VIEWER, run_name="__main__")
+    finally:
+        sys.argv = arguments
+
+
+def peak_rss():
+    """
+    Returns the peak resident memory of this process in bytes (None where the resource module is missing)
+    """
+    if resource is None:
+        return None
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def run_case(case: dict):
+    """
+    Runs one case in this process, repeating it until min_time has passed, and returns its best time
+    and peak resident memory
+    """
+    output = os.path.join(os.path.dirname(case["file"]), "output.bin")
+    run = operation(case["path"], case["file"], case["dtype"], MODES[case["mode"]], output)
+    baseline_rss = peak_rss()
+
+    times = []
+    started = time.perf_counter()
+    while len(times) < case["max_repeat"] and (not times or time.perf_counter() - started < case["min_time"]):
+        start = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - start)
+
+    return {"seconds": min(times), "repeat": len(times), "peak_rss": peak_rss(), "baseline_rss": baseline_rss}
+
+
+def spawn_case(case: dict):
+    """
+    Runs one case in a fresh Python process
+
+    Returns:
+    dict: measurements of run_case, or an "error" message
+    """
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    completed = subprocess.run([sys.executable, "-m", "benchmarks.suite", "case", json.dumps(case)], cwd=root,
+                               capture_output=True, text=True)
+    if completed.returncode:
+        lines = completed.stderr.strip().splitlines()
+        return {"error": lines[-1] if lines else f"exit code {completed.returncode}"}
+
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def environment():
+    """
+    Describes the machine and tree a run was made on
+    """
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=root, capture_output=True, text=True,
+                                check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    return {"python": platform.python_version(), "numpy": np.__version__ if np is not None else None,
+            "platform": platform.platform(), "cpus": os.cpu_count(), "commit": commit, "seed": SEED,
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S")}
+
+
+def run(arguments):
+    sizes = FULL_SIZES if arguments.full else [int(float(size)) for size in arguments.sizes.split(',')]
+    densities = [float(density) for density in arguments.densities.split(',')]
+    dtypes = arguments.dtypes.split(',') if arguments.dtypes else DTYPES
+    paths = arguments.paths.split(',')
+    modes = arguments.modes.split(',')
+    for path in paths:
+        if path not in PATHS:
+            raise Exception(f"Unknown benchmark path {path!r}, choose from {', '.join(PATHS)}")
+
+    results = []
+    print(f"{'path':<13}{'type':<3}{'density':>7}{'values':>11}  {'mode':<10}{'MB/s':>10}{'Melem/s':>10}{'RSS MB':>9}{'ratio':>8}")
+    with tempfile.TemporaryDirectory() as directory:
+        for num_values in sizes:
+            for chr_rep in dtypes:
+                #CSV cells cannot be parsed to booleans or bfloat16
+                csv = "csv" in paths and num_values <= MAX_CSV_SIZE and chr_rep not in ('?', BFLOAT16)
+                decoded_size = num_values * struct.calcsize(DataHelper.storage_letter(chr_rep))
+
+                for density in densities:
+                    files, ratios = write_inputs(directory, chr_rep, num_values, density, modes, csv)
+
+                    for path in paths:
+                        if path == "csv" and not csv:
+                            continue
+
+                        for mode_name in (modes[:1] if path in MODELESS_PATHS else modes):
+                            kind = PATHS[path]
+                            case = {"path": path, "dtype": chr_rep, "density": density, "size": num_values,
+                                    "mode": mode_name, "file": files[mode_name if kind == "encoded" else kind],
+                                    "min_time": arguments.min_time, "max_repeat": arguments.max_repeat}
+
+                            measured = spawn_case(case)
+                            result = {key: case[key] for key in ("path", "dtype", "density", "size", "mode")}
+                            result["ratio"] = ratios[mode_name]
+                            result.update(measured)
+                            if "seconds" in measured:
+                                result["mb_per_s"] = decoded_size / 1e6 / measured["seconds"]
+                                result["elements_per_s"] = num_values / measured["seconds"]
+                            results.append(result)
+                            report(result)
+
+    with open(arguments.output, 'w') as f:
+        json.dump({"environment": environment(), "results": results}, f, indent=1)
+    print(f"{len(results)} results written to {arguments.output}")
+
+
+def report(result: dict):
+    """
+    Prints one result as a table row
+    """
+    name = f"{result['path']:<13}{result['dtype']:<3}{result['density']:>7g}{result['size']:>11}  {result['mode']:<10}"
+    if "error" in result:
+        print(f"{name}ERROR {result['error']}")
+        return
+
+    rss = f"{result['peak_rss'] / 1e6:>9.1f}" if result["peak_rss"] is not None else f"{'-':>9}"
+    print(f"{name}{result['mb_per_s']:>10.1f}{result['elements_per_s'] / 1e6:>10.2f}{rss}{result['ratio']:>8.3f}")
+
+
+def result_key(result: dict):
+    return result["path"], result["dtype"], result["density"], result["size"], result["mode"]
+
+
+def compare(arguments):
+    """
+    Flags cases that got slower, used more memory or compressed worse. Exits with status 1 if any did.
+    """
+    with open(arguments.old) as f:
+        old_results = {result_key(result): result for result in json.load(f)["results"]}
+    with open(arguments.new) as f:
+        new_results = {result_key(result): result for result in json.load(f)["results"]}
+
+    regressions = 0
+    print(f"{'case':<52}{'old MB/s':>10}{'new MB/s':>10}{'change':>9}{'RSS':>9}{'ratio':>9}")
+    for key, new in new_results.items():
+        old = old_results.get(key)
+        if old is None or "seconds" not in old or "seconds" not in new:
+            continue
+
+        flags = []
+        speed_change = new["mb_per_s"] / old["mb_per_s"] - 1
+        if speed_change < -arguments.threshold:
+            flags.append("slower")
+
+        rss_change = 0.0
+        if old["peak_rss"] and new["peak_rss"]:
+            rss_change = new["peak_rss"] / old["peak_rss"] - 1
+            if rss_change > arguments.rss_threshold:
+                flags.append("memory")
+
+        #encoded sizes are deterministic, so any growth is a change in the format or encoder
+        ratio_change = new["ratio"] - old["ratio"]
+        if ratio_change > 1e-9:
+            flags.append("ratio")
+
+        if flags or arguments.all:
+            name = f"{key[0]} {key[1]} {key[2]:g} {key[3]} {key[4]}"
+            print(f"{name:<52}{old['mb_per_s']:>10.1f}{new['mb_per_s']:>10.1f}{speed_change:>+9.1%}{rss_change:>+9.1%}"
+                  f"{ratio_change:>+9.4f}  {' '.join(flags)}")
+        regressions += bool(flags)
+
+    missing = len(old_results.keys() - new_results.keys())
+    print(f"{regressions} regressions in {len(new_results)} cases" + (f", {missing} cases missing" if missing else ""))
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks encode, decode, conversion, torch and viewer paths")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="run the benchmarks and write the results to JSON")
+    run_parser.add_argument("-o", "--output", default="benchmark_results.json", help="JSON file the results are written to")
+    run_parser.add_argument("--sizes", default=','.join(str(size) for size in DEFAULT_SIZES),
+                            help="comma separated numbers of values")
+    run_parser.add_argument("--full", action="store_true", help="sizes from 1K to 100M values")
+    run_parser.add_argument("--densities", default=','.join(str(density) for density in DENSITIES),
+                            help="comma separated fractions of non-zero values")
+    run_parser.add_argument("--dtypes", default=None, help="comma separated type letters (defaults to all)")
+    run_parser.add_argument("--paths", default=','.join(PATHS), help="comma separated paths to measure")
+    run_parser.add_argument("--modes", default="bitmask", help=f"comma separated encoding modes ({', '.join(MODES)})")
+    run_parser.add_argument("--min-time", type=float, default=0.2, help="seconds every case is repeated for")
+    run_parser.add_argument("--max-repeat", type=int, default=20, help="maximum repetitions of a case")
+
+    compare_parser = commands.add_parser("compare", help="flag regressions between two result files")
+    compare_parser.add_argument("old", help="results of the baseline run")
+    compare_parser.add_argument("new", help="results of the run to check")
+    compare_parser.add_argument("--threshold", type=float, default=0.1, help="throughput drop flagged as a regression")
+    compare_parser.add_argument("--rss-threshold", type=float, default=0.2, help="peak memory growth flagged as a regression")
+    compare_parser.add_argument("--all", action="store_true", help="show every case, not only regressions")
+
+    case_parser = commands.add_parser("case", help=argparse.SUPPRESS)
+    case_parser.add_argument("case")
+
+    arguments = parser.parse_args()
+    if arguments.command == "run":
+        run(arguments)
+    elif arguments.command == "compare":
+        compare(arguments)
+    else:
+        print(json.dumps(run_case(json.loads(arguments.case))))
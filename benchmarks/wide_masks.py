@@ -0,0 +1,62 @@
+"""
+Compares 8-bit masks (bit mask mode) with 64-bit masks and run-length coded empty masks (bitmask64
+mode) on sparse data: encoded size, number of blocks the decoder walks, and encode/decode speed.
+
+Usage (from the repository root):
+python -m benchmarks.wide_masks [number of values]
+"""
+import os
+import struct
+import sys
+import tempfile
+import time
+from benchmarks.adaptive_density import random_values
+from utils.encoder import Encoder
+from utils.filetools import MODE_BITMASK, MODE_BITMASK64, FileConstructor, FileReader
+from utils.masktools import MaskTools
+from utils.widemasktools import WideMaskTools
+
+DENSITIES = [0.3, 0.1, 0.01, 0.001, 0.0001]
+
+
+def count_blocks(file_name: str):
+    """
+    Returns the number of blocks (masks or runs of empty masks) in an encoded file
+    """
+    metadata = FileReader.metadata_from_binary(file_name)
+    with open(file_name, 'rb') as f:
+        f.seek(metadata.header_size)
+        payload = f.read()
+
+    if metadata.mode == MODE_BITMASK64:
+        return len(WideMaskTools.complete_blocks(payload, metadata.num_size)[0])
+
+    return len(MaskTools.mask_offsets(payload, metadata.num_size))
+
+
+if __name__ == "__main__":
+    num_values = int(sys.argv[1]) if len(sys.argv) > 1 else 4_000_000
+
+    with tempfile.TemporaryDirectory() as directory:
+        decoded_file = os.path.join(directory, "decoded.bin")
+        encoded_file = os.path.join(directory, "encoded.bin")
+
+        print(f"{num_values} float64 values")
+        print(f"{'density':<10}{'mode':<11}{'ratio':>8}{'blocks':>10}{'encode MB/s':>13}{'decode MB/s':>13}")
+
+        for density in DENSITIES:
+            FileConstructor.list_to_binary_file(random_values(num_values, density), 'd', decoded_file)
+            decoded_size = num_values * struct.calcsize('d')
+
+            for mode_name, mode in (("bitmask", MODE_BITMASK), ("bitmask64", MODE_BITMASK64)):
+                start = time.perf_counter()
+                Encoder.encode_bin_file(decoded_file, output=encoded_file, mode=mode)
+                encode_time = time.perf_counter() - start
+
+                start = time.perf_counter()
+                FileReader.array_from_encoded(encoded_file)
+                decode_time = time.perf_counter() - start
+
+                ratio = os.path.getsize(encoded_file) / decoded_size
+                print(f"{density:<10g}{mode_name:<11}{ratio:>8.4f}{count_blocks(encoded_file):>10}"
+                      f"{decoded_size / 1e6 / encode_time:>13.1f}{decoded_size / 1e6 / decode_time:>13.1f}")
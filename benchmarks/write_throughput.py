@@ -0,0 +1,63 @@
+"""
+Compares decoded binary file write throughput of FileConstructor.list_to_binary_file with the
+previous implementation, which grew a bytes object with += once per value.
+
+Usage (from the repository root):
+python -m benchmarks.write_throughput [number of values] [max values for previous implementation]
+
+The previous implementation is quadratic, so it only runs up to the given limit (default 50000).
+"""
+import os
+import struct
+import sys
+import tempfile
+import time
+from utils.arraytools import np
+from utils.filetools import FileConstructor
+
+
+def previous_list_to_binary_file(values: list, chr_rep: str, output_file_name: str):
+    """
+    Write loop of list_to_binary_file before it packed values in one call
+    """
+    bytes_string = FileConstructor.create_first_byte(False, chr_rep)
+    for value in values:
+        bytes_string += struct.pack(chr_rep, value)
+
+    with open(output_file_name, 'wb') as f:
+        f.write(bytes_string)
+
+
+def timed(function, *args):
+    """
+    Returns seconds taken by function(*args)
+    """
+    start = time.perf_counter()
+    function(*args)
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    num_values = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000_000
+    previous_limit = int(sys.argv[2]) if len(sys.argv) > 2 else 50_000
+
+    values_list = [float(i % 7) for i in range(num_values)]
+    inputs = [("list", values_list)]
+    if np is not None:
+        inputs.append(("numpy", np.array(values_list)))
+
+    with tempfile.TemporaryDirectory() as directory:
+        file_name = os.path.join(directory, "values.bin")
+        size_mb = num_values * struct.calcsize('d') / 1e6
+
+        print(f"{'writer':<12}{'input':<8}{'values':>12}{'seconds':>10}{'MB/s':>10}{'values/s':>14}")
+
+        if num_values <= previous_limit:
+            seconds = timed(previous_list_to_binary_file, values_list, 'd', file_name)
+            print(f"{'previous':<12}{'list':<8}{num_values:>12}{seconds:>10.3f}{size_mb / seconds:>10.1f}{num_values / seconds:>14.0f}")
+        else:
+            print(f"{'previous':<12}{'list':<8}{num_values:>12}   skipped (above limit of {previous_limit} values)")
+
+        for input_name, values in inputs:
+            seconds = timed(FileConstructor.list_to_binary_file, values, 'd', file_name)
+            print(f"{'current':<12}{input_name:<8}{num_values:>12}{seconds:>10.3f}{size_mb / seconds:>10.1f}{num_values / seconds:>14.0f}")
@@ -1,36 +1,269 @@
+import argparse
+import glob
+import os
 import sys
+import time
+from utils.codectools import CODEC_NAMES, CODEC_NONE
 from utils.encoder import Encoder
 from utils.decoder import Decoder
-from utils.filetools import *
+from utils.filetools import MODE_ADAPTIVE, MODE_BITMASK, MODE_BITMASK64, FileReader
+from utils.stattools import StatTools
+
+#file extensions picked up when a directory is given
+SUPPORTED_EXTENSIONS = (".bin", ".csv")
+
+#encoding modes selectable on the command line
+MODES = {"bitmask": MODE_BITMASK, "adaptive": MODE_ADAPTIVE, "bitmask64": MODE_BITMASK64}
+
+
+def expand_paths(paths: list):
+    """
+    Expands files, directories (searched recursively) and glob patterns into a list of files
+
+    Parameters:
+    paths (list): file names, directory names or glob patterns
+
+    Returns:
+    list: file names in the order given, without duplicates
+    """
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for directory, _, names in os.walk(path):
+                files += [os.path.join(directory, name) for name in sorted(names) if name.endswith(SUPPORTED_EXTENSIONS)]
+        elif glob.has_magic(path):
+            files += sorted(glob.glob(path, recursive=True))
+        else:
+            files.append(path)
+
+    return list(dict.fromkeys(files))
+
+
+def output_path(file_name: str, output: str=None, many: bool=False):
+    """
+    Returns the file a processed file is written to
+
+    Parameters:
+    file_name (str): file to process
+    output (str): output file, or directory if many files are processed or it is an existing directory.
+                  None writes binary files in place and CSV files next to the input.
+    many (bool): whether several files are processed in the same run
+
+    Returns:
+    str: output file name, or None for the default
+    """
+    if output is None:
+        return None
+
+    if many or os.path.isdir(output):
+        os.makedirs(output, exist_ok=True)
+        name = os.path.basename(file_name)
+        if name.endswith(".csv"):
+            name = os.path.splitext(name)[0] + ".bin"
+        return os.path.join(output, name)
+
+    return output
+
+
+def process_file(file_name: str, chr_rep: str='d', strict: bool=False, keep_decoded: bool=False, output: str=None,
+                 fsync: bool=False, mode: int=MODE_BITMASK, codec: int=CODEC_NONE, level: int=None, stats: bool=False):
+    """
+    Encodes a decoded binary file, decodes an encoded binary file or converts a CSV file to an encoded binary file.
+    Output files are written to a temporary file and then moved into place, so an interrupted run never leaves
+    a truncated file behind.
+
+    Parameters:
+    file_name (str): file to process
+    chr_rep (str): struct module character representation of data type for CSV files
+    strict (bool): fail on non-numerical CSV cells instead of skipping them
+    keep_decoded (bool): also write a decoded binary file (name ending in _decoded.bin) for CSV files
+    output (str): file to write, binary files are replaced and CSV files get a .bin file next to them if not provided
+    fsync (bool): flush output files to disk before they replace existing files
+    mode (int): encoding mode of encoded files (MODE_BITMASK, MODE_ADAPTIVE or MODE_BITMASK64)
+    codec (int): secondary codec of encoded files in bit mask mode (CODEC_NONE, CODEC_ZLIB, CODEC_LZMA or CODEC_BZ2)
+    level (int): compression level of the codec
+    stats (bool): instrument the pipeline (see StatTools) and add the report of the file under "stats"
+
+    Returns:
+    dict: action, input file, output file, sizes in bytes and time in seconds
+    """
+    #enabled here so worker processes instrument their files too
+    if stats:
+        StatTools.enable()
+
+    start = time.perf_counter()
+    input_size = os.path.getsize(file_name)
+
+    with StatTools.operation("process", file_name) as report:
+        file_type, metadata = FileReader.get_file_info(file_name)
+        output_file = output or file_name
+
+        if file_type == "encoded":
+            action = "decode"
+            Decoder.decode_bin_file(file_name, metadata, output_file, fsync)
+        elif file_type == "decoded":
+            action = "encode"
+            Encoder.encode_bin_file(file_name, metadata, output=output_file, fsync=fsync, mode=mode, codec=codec, level=level)
+        elif file_type == "csv":
+            #parse and encode in one pass
+            action = "convert"
+            decoded_file = os.path.splitext(output or file_name)[0] + "_decoded.bin" if keep_decoded else None
+            output_file = Encoder.encode_csv_file(file_name, chr_rep, output, decoded_file, strict=strict, fsync=fsync,
+                                                  mode=mode, codec=codec, level=level)
+        else:
+            raise Exception("Invalid file.")
+
+        if report is not None:
+            report.operation = action
+
+    result = {
+        "action": action,
+        "file": file_name,
+        "output": output_file,
+        "input_size": input_size,
+        "output_size": os.path.getsize(output_file),
+        "seconds": time.perf_counter() - start
+    }
+    if stats and report is not None:
+        result["stats"] = report.as_dict()
+
+    return result
+
+
+def format_stats(stats: dict):
+    """
+    Formats the pipeline report of a file as one line: time per stage, bytes moved and density of non-zero values
+    """
+    stages = ", ".join(f"{name} {seconds * 1000:.1f} ms" for name, seconds in stats["stages"].items())
+    return (f"         stages: {stages} | read {stats['bytes_read']} B, wrote {stats['bytes_written']} B, "
+            f"{stats['elements']} values, density {stats['density']:.3f}")
+
+
+def run_batch(files: list, chr_rep: str='d', jobs: int=1, use_threads: bool=False, strict: bool=False, keep_decoded: bool=False,
+              output: str=None, fsync: bool=False, mode: int=MODE_BITMASK, codec: int=CODEC_NONE, level: int=None,
+              stats: bool=False):
+    """
+    Processes files with a bounded pool of workers, printing a line per file as it finishes.
+    A failing file is reported and does not stop the others.
+
+    Parameters:
+    files (list): files to process
+    chr_rep (str): struct module character representation of data type for CSV files
+    jobs (int): maximum number of files processed at the same time
+    use_threads (bool): use a thread pool instead of a process pool
+    strict (bool): fail on non-numerical CSV cells instead of skipping them
+    keep_decoded (bool): also write decoded binary files for CSV files
+    output (str): output file for a single file, or directory for the output files of several files
+    fsync (bool): flush output files to disk before they replace existing files
+    mode (int): encoding mode of encoded files (MODE_BITMASK, MODE_ADAPTIVE or MODE_BITMASK64)
+    codec (int): secondary codec of encoded files in bit mask mode
+    level (int): compression level of the codec
+    stats (bool): print the per-stage pipeline report of every file
+
+    Returns:
+    list: result dictionaries of processed files
+    list: (file, error message) for files that failed
+    """
+    results = []
+    failures = []
+    options = {file_name: (chr_rep, strict, keep_decoded, output_path(file_name, output, len(files) > 1), fsync, mode,
+                          codec, level, stats)
+               for file_name in files}
+
+    def report(file_name, result=None, error=None):
+        if error is not None:
+            failures.append((file_name, error))
+            print(f"FAILED   {file_name}: {error}")
+            return
+
+        results.append(result)
+        ratio = result["output_size"] / result["input_size"] if result["input_size"] else 0
+        throughput = result["input_size"] / 1e6 / result["seconds"] if result["seconds"] else 0
+        print(f"{result['action']:<8} {result['output']}: {result['input_size']} -> {result['output_size']} bytes "
+              f"(ratio {ratio:.3f}, {throughput:.1f} MB/s)")
+        if "stats" in result:
+            print(format_stats(result["stats"]))
+
+    if jobs <= 1:
+        for file_name in files:
+            try:
+                report(file_name, process_file(file_name, *options[file_name]))
+            except Exception as error:
+                report(file_name, error=str(error))
+        return results, failures
+
+    #worker pools (and multiprocessing) are only imported for parallel batches, keeping startup fast
+    from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+
+    executor_type = ThreadPoolExecutor if use_threads else ProcessPoolExecutor
+    with executor_type(max_workers=jobs) as executor:
+        futures = {executor.submit(process_file, file_name, *options[file_name]): file_name for file_name in files}
+        for future in as_completed(futures):
+            try:
+                report(futures[future], future.result())
+            except Exception as error:
+                report(futures[future], error=str(error))
+
+    return results, failures
+
+
+def print_summary(results: list, failures: list, seconds: float):
+    """
+    Prints totals for a batch: number of files, aggregate compression ratio, throughput and failures
+    """
+    input_size = sum(result["input_size"] for result in results)
+    output_size = sum(result["output_size"] for result in results)
+    ratio = output_size / input_size if input_size else 0
+    throughput = input_size / 1e6 / seconds if seconds else 0
+
+    print(f"Processed {len(results)} file(s), {len(failures)} failed, in {seconds:.2f} s")
+    print(f"Total: {input_size} -> {output_size} bytes (ratio {ratio:.3f}, {throughput:.1f} MB/s)")
+    for file_name, error in failures:
+        print(f"Failed: {file_name}: {error}")
+
+
+def parse_arguments(argv: list):
+    """
+    Parses command line arguments. A trailing 'i' (that is not a file) selects integers for CSV
+    files, as in earlier versions of this tool.
+    """
+    parser = argparse.ArgumentParser(description="Bit mask encode, decode or convert files.")
+    parser.add_argument("paths", nargs="+", help="files, directories or glob patterns (.bin and .csv)")
+    parser.add_argument("-t", "--type", default="d", help="struct data type character for CSV files (default: d)")
+    parser.add_argument("--strict", action="store_true", help="fail on non-numerical CSV cells instead of skipping them")
+    parser.add_argument("--keep-decoded", action="store_true", help="also write a decoded .bin file for CSV files")
+    parser.add_argument("-j", "--jobs", type=int, default=1, help="number of files processed at the same time")
+    parser.add_argument("--threads", action="store_true", help="use threads instead of processes for --jobs")
+    parser.add_argument("-o", "--output", help="output file, or directory when several files are given "
+                                               "(default: replace binary files, write CSV output next to input)")
+    parser.add_argument("--fsync", action="store_true", help="flush output files to disk before replacing files")
+    parser.add_argument("-m", "--mode", choices=MODES, default="bitmask",
+                        help="encoding mode: bitmask, adaptive to store dense chunks raw and skip all-zero chunks, "
+                             "or bitmask64 for 64-bit masks with run-length coded zero runs")
+    parser.add_argument("-c", "--codec", choices=CODEC_NAMES, default="none",
+                        help="secondary codec for bitmask mode: masks and byte-shuffled values are compressed separately")
+    parser.add_argument("-l", "--level", type=int, help="compression level of the codec (default: codec default)")
+    parser.add_argument("--stats", action="store_true",
+                        help="print time per pipeline stage, bytes read and written and density of every file")
+    args = parser.parse_args(argv)
+
+    if len(args.paths) > 1 and args.paths[-1] == "i" and not os.path.exists("i"):
+        args.paths.pop()
+        args.type = "i"
+
+    return args
+
 
 if __name__ == "__main__":
-    file_name = sys.argv[1]
-    file_type = FileReader.get_file_type(file_name)
-
-    if file_type == "encoded":
-        print("Decoding encoded file")
-        Decoder.decode_bin_file(file_name)
-        print("Decoding complete")
-    elif file_type == "decoded":
-        print("Encoding decoded file")
-        Encoder.encode_bin_file(file_name)
-        print("Encoding complete")
-    elif file_type == "csv":
-        #convert to binary
-        print("Converting CSV to bin and encoding")
-        try:
-            if sys.argv[2] == 'i':
-                new_file = FileConverter.csv_to_binary_file(file_name, 'i')
-        except IndexError:
-                new_file = FileConverter.csv_to_binary_file(file_name)
-        
-        print("Created: " + new_file)
-
-        #encode file 
-        print("Encoding file: " + new_file)
-        Encoder.encode_bin_file(new_file)
-    else:
-        print("Invalid file.")
-
-
-    
+    args = parse_arguments(sys.argv[1:])
+    files = expand_paths(args.paths)
+
+    start = time.perf_counter()
+    results, failures = run_batch(files, args.type, args.jobs, args.threads, args.strict, args.keep_decoded,
+                                  args.output, args.fsync, MODES[args.mode], CODEC_NAMES[args.codec], args.level,
+                                  args.stats)
+
+    if len(files) > 1 or failures:
+        print_summary(results, failures, time.perf_counter() - start)
+
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,15 @@
+import sys
+import pytest
+
+
+@pytest.fixture(params=[True, False], ids=["numpy", "python"])
+def numpy_path(request, monkeypatch):
+    """
+    Runs a test with NumPy and again with the pure Python fallbacks, by hiding NumPy from every module
+    """
+    if not request.param:
+        for name, module in list(sys.modules.items()):
+            if name.startswith("utils.") and getattr(module, "np", None) is not None:
+                monkeypatch.setattr(module, "np", None)
+
+    return request.param
@@ -0,0 +1,107 @@
+import random
+import struct
+from utils.codectools import CODEC_BZ2, CODEC_LZMA, CODEC_ZLIB
+from utils.filetools import MODE_ADAPTIVE, MODE_BITMASK, MODE_BITMASK64, FileConstructor, FileReader
+from utils.typetools import BFLOAT16, DataHelper
+
+#every data type DataHelper can store
+DTYPES = ['b', 'h', 'i', 'l', 'q', 'B', 'H', 'I', 'L', 'Q', '?', 'e', 'f', 'd', BFLOAT16]
+
+#encoding options of every mode and codec, small adaptive chunks so files hold many of them
+ENCODINGS = [
+    {"mode": MODE_BITMASK},
+    {"mode": MODE_ADAPTIVE, "adaptive_chunk_size": 64},
+    {"mode": MODE_BITMASK64},
+    {"mode": MODE_BITMASK, "codec": CODEC_ZLIB},
+    {"mode": MODE_BITMASK, "codec": CODEC_LZMA},
+    {"mode": MODE_BITMASK, "codec": CODEC_BZ2},
+]
+ENCODING_IDS = ["bitmask", "adaptive", "bitmask64", "zlib", "lzma", "bz2"]
+
+
+def sample_values(chr_rep: str, count: int, density: float=0.3, seed: int=0):
+    """
+    Creates a list of values of a data type where roughly density of them are non-zero
+
+    Parameters:
+    chr_rep (str): struct module character representation of data type, or BFLOAT16 for 16-bit patterns
+    count (int): number of values
+    density (float): fraction of non-zero values
+    seed (int): seed of the random values
+
+    Returns:
+    list: values exactly representable in the data type
+    """
+    generator = random.Random(f"{chr_rep}-{count}-{density}-{seed}")
+    num_type = DataHelper.type_from_letter(chr_rep)
+    signed = DataHelper.is_signed(chr_rep) and chr_rep != BFLOAT16
+
+    values = []
+    for _ in range(count):
+        if generator.random() >= density:
+            values.append(False if num_type == 'bool' else 0.0 if num_type == 'float' and chr_rep != BFLOAT16 else 0)
+        elif num_type == 'bool':
+            values.append(True)
+        elif chr_rep == BFLOAT16:
+            values.append(generator.randrange(1, 1 << 16))
+        elif num_type == 'float':
+            values.append(generator.randrange(-2048, 2048) / 8 or 1.0)
+        else:
+            limit = 1 << (8 * struct.calcsize(chr_rep) - 1)
+            values.append(generator.randrange(-limit if signed else 1, limit) or 1)
+
+    return values
+
+
+
+def banded_values(chr_rep: str, count: int, band: int=300, seed: int=0):
+    """
+    Creates a list of values alternating between bands of zeros, dense values and sparse values, so
+    every encoding mode meets all of its cases (zero, raw and bit mask chunks, long runs of empty masks)
+
+    Parameters:
+    chr_rep (str): struct module character representation of data type, or BFLOAT16 for 16-bit patterns
+    count (int): number of values
+    band (int): number of values per band
+    seed (int): seed of the random values
+
+    Returns:
+    list: values exactly representable in the data type
+    """
+    densities = [0.0, 1.0, 0.02]
+    values = []
+    for number, start in enumerate(range(0, count, band)):
+        values += sample_values(chr_rep, min(band, count - start), densities[number % 3], seed + number)
+
+    return values
+
+def write_decoded(file_name: str, values, chr_rep: str):
+    """
+    Writes values to a decoded binary file, one value at a time, with a legacy 1-byte header for the
+    types it can store (an extended header otherwise)
+
+    Returns:
+    str: file_name
+    """
+    storage_letter = DataHelper.storage_letter(chr_rep)
+    payload = b''.join(struct.pack(storage_letter, value) for value in values)
+    with open(file_name, 'wb') as f:
+        if chr_rep in DataHelper._int_letter_from_metadata + DataHelper._float_letter_from_metadata:
+            f.write(FileConstructor.create_first_byte(False, chr_rep))
+        else:
+            f.write(FileConstructor.create_header(False, chr_rep, len(values), payload))
+        f.write(payload)
+
+    return file_name
+
+
+def read_payload(file_name: str):
+    """
+    Reads the bytes stored after the header of a binary file
+
+    Returns:
+    bytes: packed or encoded values
+    """
+    metadata = FileReader.metadata_from_binary(file_name)
+    with open(file_name, 'rb') as f:
+        return f.read()[metadata.header_size:]
@@ -0,0 +1,134 @@
+import builtins
+import io
+import json
+import struct
+import zlib
+import pytest
+from tests.helpers import DTYPES, ENCODING_IDS, ENCODINGS, banded_values, sample_values
+from utils import archivetools
+from utils.archivetools import ArchiveReader, ArchiveWriter
+from utils.arraytools import ArrayTools
+
+#entries of several types and shapes, including an empty one
+ENTRIES = [("weight", 'f', (30, 40)), ("bias", 'd', (40,)), ("steps", 'q', (1,)), ("mask", '?', (7, 3)),
+           ("empty", 'h', (0, 5))]
+
+
+def write_archive(file_name: str, workers: int=1, **encoding):
+    entries = {}
+    with ArchiveWriter(file_name, workers, **encoding) as archive:
+        for name, chr_rep, shape in ENTRIES:
+            count = 1
+            for dimension in shape:
+                count *= dimension
+            entries[name] = banded_values(chr_rep, count, band=50)
+            archive.add(name, entries[name], chr_rep, shape)
+
+    return entries
+
+
+def archive_encoding(encoding):
+    #archives use the default adaptive chunk size
+    return {key: value for key, value in encoding.items() if key != "adaptive_chunk_size"}
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+@pytest.mark.parametrize("encoding", ENCODINGS, ids=ENCODING_IDS)
+def test_round_trip(tmp_path, numpy_path, encoding, workers):
+    file_name = str(tmp_path / "state.bmar")
+    entries = write_archive(file_name, workers, **archive_encoding(encoding))
+
+    with ArchiveReader(file_name) as archive:
+        assert archive.names() == [name for name, _, _ in ENTRIES]
+        for name, chr_rep, shape in ENTRIES:
+            values = archive.load(name)
+            assert archive.shape(name) == shape
+            assert archive.metadata(name).type_letter == chr_rep
+            if archivetools.np is not None:
+                assert values.shape == shape
+            assert ArrayTools.to_list(values.reshape(-1) if archivetools.np is not None else values) == entries[name]
+
+
+@pytest.mark.parametrize("chr_rep", DTYPES)
+def test_every_type(tmp_path, numpy_path, chr_rep):
+    values = sample_values(chr_rep, 203)
+    output = io.BytesIO()
+    with ArchiveWriter(output, 1) as archive:
+        archive.add("values", values, chr_rep)
+
+    file_name = tmp_path / "values.bmar"
+    file_name.write_bytes(output.getvalue())
+    with ArchiveReader(str(file_name)) as archive:
+        assert ArrayTools.to_list(archive.load("values")) == values
+
+
+def test_entries_are_checked_when_added(tmp_path):
+    with pytest.raises(Exception, match="does not match"):
+        with ArchiveWriter(str(tmp_path / "shape.bmar"), 1) as archive:
+            archive.add("values", [1, 2, 3], 'i', (2, 2))
+
+    with pytest.raises(Exception, match="already has an entry"):
+        with ArchiveWriter(str(tmp_path / "names.bmar"), 1) as archive:
+            archive.add("values", [1, 2, 3], 'i')
+            archive.add("values", [1, 2, 3], 'i')
+
+    #an archive given by name is discarded when writing fails
+    assert list(tmp_path.iterdir()) == []
+
+
+@pytest.mark.parametrize("size", [0, 8, -1, -30])
+def test_truncated_archive_is_rejected(tmp_path, size):
+    file_name = tmp_path / "state.bmar"
+    write_archive(str(file_name))
+    data = file_name.read_bytes()
+    file_name.write_bytes(data[:size] if size else b'')
+
+    with pytest.raises(Exception, match="tensor archive"):
+        ArchiveReader(str(file_name))
+
+
+def test_corrupted_entry_is_rejected(tmp_path):
+    file_name = tmp_path / "state.bmar"
+    write_archive(str(file_name))
+    data = bytearray(file_name.read_bytes())
+    with ArchiveReader(str(file_name)) as archive:
+        entry = archive.entries["bias"]
+    data[entry["offset"] + entry["size"] - 1] ^= 1
+    file_name.write_bytes(bytes(data))
+
+    with ArchiveReader(str(file_name)) as archive:
+        archive.load("weight")
+        with pytest.raises(Exception, match="Checksum mismatch"):
+            archive.load("bias")
+
+
+def test_unreadable_table_of_contents_closes_file(tmp_path, monkeypatch):
+    #the table of contents passes its checksum but is not valid JSON
+    file_name = tmp_path / "state.bmar"
+    toc = b'{"entries": ['
+    preamble = struct.pack('<4sB3x', b'BMAR', 1)
+    file_name.write_bytes(preamble + toc + struct.pack('<QQI4s', len(preamble), len(toc), zlib.crc32(toc), b'BMAR'))
+
+    opened = []
+
+    def tracking_open(*arguments, **options):
+        opened.append(builtins.open(*arguments, **options))
+        return opened[-1]
+
+    monkeypatch.setattr(archivetools, "open", tracking_open, raising=False)
+    with pytest.raises(json.JSONDecodeError):
+        ArchiveReader(str(file_name))
+
+    assert len(opened) == 1 and opened[0].closed
+
+
+@pytest.mark.parametrize("encoding", ENCODINGS, ids=ENCODING_IDS)
+def test_load_sparse_matches_load(tmp_path, numpy_path, encoding):
+    file_name = str(tmp_path / "archive.bmar")
+    entries = write_archive(file_name, **archive_encoding(encoding))
+
+    with ArchiveReader(file_name) as archive:
+        for name, _, _ in ENTRIES:
+            indices, values = archive.load_sparse(name)
+            assert list(indices) == [index for index, value in enumerate(entries[name]) if value != 0]
+            assert list(values) == [value for value in entries[name] if value != 0]
@@ -0,0 +1,125 @@
+import asyncio
+import shutil
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import pytest
+from tests.helpers import ENCODING_IDS, ENCODINGS, banded_values, sample_values, write_decoded
+from tests.test_filetools import flip_last_byte
+from utils.arraytools import ArrayTools
+from utils.asynctools import AsyncCoder
+from utils.decoder import Decoder
+from utils.encoder import Encoder
+from utils.filetools import FileReader
+
+
+def read_bytes(file_name: str):
+    with open(file_name, 'rb') as f:
+        return f.read()
+
+
+@pytest.fixture(params=["default", "threads", "processes"])
+def executor(request):
+    """
+    CPU executor of an AsyncCoder: the event loop's default thread pool, a thread pool or a process pool
+    """
+    if request.param == "default":
+        yield None
+        return
+
+    executor_type = ThreadPoolExecutor if request.param == "threads" else ProcessPoolExecutor
+    with executor_type(max_workers=2) as pool:
+        yield pool
+
+
+def run(executor, method: str, *args, chunk_size: int=64, **kwargs):
+    async def main():
+        async with AsyncCoder(executor=executor, chunk_size=chunk_size) as coder:
+            return await getattr(coder, method)(*args, **kwargs)
+
+    return asyncio.run(main())
+
+
+@pytest.mark.parametrize("encoding", ENCODINGS, ids=ENCODING_IDS)
+def test_encode_matches_encoder(tmp_path, executor, encoding):
+    #small chunks so runs of empty 64-bit masks span many of them
+    values = banded_values('i', 5003) + [0] * 3000
+    serial_file = write_decoded(str(tmp_path / "serial.bin"), values, 'i')
+    async_file = str(tmp_path / "async.bin")
+    shutil.copyfile(serial_file, async_file)
+
+    Encoder.encode_bin_file(serial_file, **encoding)
+
+    assert run(executor, "encode_bin_file", async_file, **encoding) == len(values)
+    assert read_bytes(async_file) == read_bytes(serial_file)
+
+
+@pytest.mark.parametrize("encoding", ENCODINGS, ids=ENCODING_IDS)
+def test_decode_matches_decoder(tmp_path, executor, encoding):
+    values = banded_values('d', 5003) + [0.0] * 3000
+    file_name = write_decoded(str(tmp_path / "values.bin"), values, 'd')
+    Encoder.encode_bin_file(file_name, **encoding)
+    serial_file = str(tmp_path / "serial.bin")
+    Decoder.decode_bin_file(file_name, output=serial_file)
+
+    assert run(executor, "decode_bin_file", file_name) == len(values)
+    assert read_bytes(file_name) == read_bytes(serial_file)
+    assert FileReader.list_from_decoded(file_name) == values
+
+
+@pytest.mark.parametrize("encoding", ENCODINGS, ids=ENCODING_IDS)
+def test_array_from_encoded(tmp_path, executor, encoding):
+    values = banded_values('h', 2001)
+    file_name = write_decoded(str(tmp_path / "values.bin"), values, 'h')
+    Encoder.encode_bin_file(file_name, **encoding)
+
+    assert ArrayTools.to_list(run(executor, "array_from_encoded", file_name)) == values
+
+
+def test_round_trip_to_other_output(tmp_path, executor):
+    values = sample_values('f', 1000)
+    file_name = write_decoded(str(tmp_path / "values.bin"), values, 'f')
+    source = read_bytes(file_name)
+    encoded_file = str(tmp_path / "encoded.bin")
+    decoded_file = str(tmp_path / "decoded.bin")
+
+    run(executor, "encode_bin_file", file_name, encoded_file)
+    run(executor, "decode_bin_file", encoded_file, decoded_file)
+
+    assert read_bytes(file_name) == source
+    assert FileReader.list_from_decoded(decoded_file) == values
+
+
+def test_many_files_at_once(tmp_path):
+    file_names = [write_decoded(str(tmp_path / f"{number}.bin"), sample_values('i', 500, seed=number), 'i')
+                  for number in range(10)]
+    expected = [FileReader.list_from_decoded(file_name) for file_name in file_names]
+
+    async def main():
+        async with AsyncCoder(max_concurrent=3, chunk_size=64) as coder:
+            await asyncio.gather(*(coder.encode_bin_file(file_name) for file_name in file_names))
+            return await asyncio.gather(*(coder.array_from_encoded(file_name) for file_name in file_names))
+
+    assert [ArrayTools.to_list(values) for values in asyncio.run(main())] == expected
+
+
+def test_corrupted_file_is_rejected(tmp_path, executor):
+    file_name = write_decoded(str(tmp_path / "values.bin"), sample_values('i', 1000), 'i')
+    Encoder.encode_bin_file(file_name)
+    flip_last_byte(file_name)
+    corrupted = read_bytes(file_name)
+
+    with pytest.raises(Exception, match="Checksum mismatch"):
+        run(executor, "decode_bin_file", file_name)
+    assert read_bytes(file_name) == corrupted
+
+
+def test_wrong_input_is_rejected(tmp_path):
+    file_name = write_decoded(str(tmp_path / "values.bin"), sample_values('i', 100), 'i')
+
+    with pytest.raises(Exception, match="not a bit mask encoded"):
+        run(None, "decode_bin_file", file_name)
+    with pytest.raises(Exception, match="multiple of 8"):
+        AsyncCoder(chunk_size=12)
+
+    Encoder.encode_bin_file(file_name)
+    with pytest.raises(Exception, match="not a bit mask decoded"):
+        run(None, "encode_bin_file", file_name)
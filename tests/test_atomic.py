@@ -0,0 +1,94 @@
+import os
+import pytest
+from tests.helpers import sample_values, write_decoded
+from utils import decoder, encoder
+from utils.decoder import Decoder
+from utils.encoder import Encoder
+from utils.filetools import FileConstructor, FileReader
+
+
+def directory_listing(tmp_path):
+    return sorted(os.listdir(tmp_path))
+
+
+def test_atomic_output_replaces_file(tmp_path):
+    file_name = str(tmp_path / "out.bin")
+    with open(file_name, 'wb') as f:
+        f.write(b'old')
+
+    with FileConstructor.atomic_output(file_name, fsync=True) as f:
+        f.write(b'new')
+
+    assert open(file_name, 'rb').read() == b'new'
+    assert directory_listing(tmp_path) == ["out.bin"]
+
+
+def test_atomic_output_failure_leaves_file(tmp_path):
+    file_name = str(tmp_path / "out.bin")
+    with open(file_name, 'wb') as f:
+        f.write(b'old')
+
+    with pytest.raises(RuntimeError):
+        with FileConstructor.atomic_output(file_name) as f:
+            f.write(b'partial')
+            raise RuntimeError("interrupted")
+
+    assert open(file_name, 'rb').read() == b'old'
+    assert directory_listing(tmp_path) == ["out.bin"]
+
+
+def test_encode_failing_partway_leaves_source(tmp_path, monkeypatch):
+    file_name = write_decoded(str(tmp_path / "values.bin"), sample_values('i', 1000), 'i')
+    source = open(file_name, 'rb').read()
+
+    #the first byte is written before the encoded bytes make the write fail
+    monkeypatch.setattr(encoder.MaskTools, "encode", lambda values, chr_rep: object())
+    with pytest.raises(TypeError):
+        Encoder.encode_bin_file(file_name)
+
+    assert open(file_name, 'rb').read() == source
+    assert directory_listing(tmp_path) == ["values.bin"]
+
+
+def test_decode_failing_partway_leaves_source(tmp_path, monkeypatch):
+    file_name = write_decoded(str(tmp_path / "values.bin"), sample_values('i', 1000), 'i')
+    Encoder.encode_bin_file(file_name)
+    source = open(file_name, 'rb').read()
+
+    def fail(values, chr_rep):
+        raise RuntimeError("interrupted")
+
+    monkeypatch.setattr(decoder.ArrayTools, "to_bytes", fail)
+    with pytest.raises(RuntimeError):
+        Decoder.decode_bin_file(file_name)
+
+    assert open(file_name, 'rb').read() == source
+    assert directory_listing(tmp_path) == ["values.bin"]
+
+
+def test_csv_encoding_failing_partway_leaves_output(tmp_path):
+    csv_file = tmp_path / "values.csv"
+    csv_file.write_text("1,2,3\n4,5,6\n7,x,9\n")
+    output = str(tmp_path / "values.bin")
+    with open(output, 'wb') as f:
+        f.write(b'old')
+
+    #the bad cell is only reached after earlier chunks were encoded
+    with pytest.raises(Exception, match="Non-numerical"):
+        Encoder.encode_csv_file(str(csv_file), 'i', output, str(tmp_path / "decoded.bin"), strict=True, chunk_size=1)
+
+    assert open(output, 'rb').read() == b'old'
+    assert directory_listing(tmp_path) == ["values.bin", "values.csv"]
+
+
+def test_explicit_output_keeps_source(tmp_path):
+    file_name = write_decoded(str(tmp_path / "values.bin"), sample_values('d', 100), 'd')
+    source = open(file_name, 'rb').read()
+    encoded = str(tmp_path / "encoded.bin")
+    decoded = str(tmp_path / "decoded.bin")
+
+    Encoder.encode_bin_file(file_name, output=encoded)
+    Decoder.decode_bin_file(encoded, output=decoded)
+
+    assert open(file_name, 'rb').read() == source
+    assert FileReader.list_from_decoded(decoded) == FileReader.list_from_decoded(file_name)
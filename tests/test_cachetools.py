@@ -0,0 +1,159 @@
+import os
+import pytest
+from tests.helpers import sample_values, write_decoded
+from utils import cachetools
+from utils.arraytools import ArrayTools
+from utils.cachetools import DecodedCache
+from utils.encoder import Encoder
+from utils.filetools import FileReader
+
+
+def encoded_file(file_name: str, values, chr_rep: str='i'):
+    write_decoded(file_name, values, chr_rep)
+    Encoder.encode_bin_file(file_name)
+    return file_name
+
+
+def rewrite(file_name: str, values, chr_rep: str='i'):
+    """
+    Replaces the contents of an encoded file, moving its modification time so the change is seen even
+    on file systems with coarse timestamps
+    """
+    info = os.stat(file_name)
+    encoded_file(file_name, values, chr_rep)
+    os.utime(file_name, ns=(info.st_atime_ns, info.st_mtime_ns + 1_000_000_000))
+
+
+def test_hits_and_misses(tmp_path, numpy_path):
+    values = sample_values('i', 1000)
+    file_name = encoded_file(str(tmp_path / "values.bin"), values)
+    cache = DecodedCache()
+
+    first = cache.get_array(file_name)
+    second = cache.get_array(file_name)
+
+    assert ArrayTools.to_list(first) == ArrayTools.to_list(second) == values
+    assert cache.stats() == {"hits": 1, "disk_hits": 0, "misses": 1, "evictions": 0, "entries": 1, "bytes": 4000}
+
+
+def test_least_recently_used_are_evicted(tmp_path):
+    file_names = [encoded_file(str(tmp_path / f"{name}.bin"), sample_values('d', 100, seed=number), 'd')
+                  for number, name in enumerate("abc")]
+    #room for two arrays of 800 bytes
+    cache = DecodedCache(memory_budget=1600)
+
+    cache.get_array(file_names[0])
+    cache.get_array(file_names[1])
+    cache.get_array(file_names[0])
+    cache.get_array(file_names[2])
+
+    assert (cache.size, cache.evictions) == (1600, 1)
+    assert [key[0] for key in cache._entries] == [os.path.realpath(file_names[0]), os.path.realpath(file_names[2])]
+
+    cache.get_array(file_names[1])
+    assert cache.stats()["misses"] == 4
+
+
+def test_arrays_over_budget_are_not_kept(tmp_path):
+    file_name = encoded_file(str(tmp_path / "values.bin"), sample_values('i', 1000))
+    cache = DecodedCache(memory_budget=100)
+
+    cache.get_array(file_name)
+    cache.get_array(file_name)
+
+    assert cache.stats() == {"hits": 0, "disk_hits": 0, "misses": 2, "evictions": 0, "entries": 0, "bytes": 0}
+
+
+def test_changed_file_is_decoded_again(tmp_path, numpy_path):
+    file_name = encoded_file(str(tmp_path / "values.bin"), sample_values('i', 1000))
+    cache = DecodedCache()
+    cache.get_array(file_name)
+
+    new_values = sample_values('i', 1000, seed=1)
+    rewrite(file_name, new_values)
+
+    assert ArrayTools.to_list(cache.get_array(file_name)) == new_values
+    assert cache.stats()["misses"] == 2
+
+
+def test_cached_arrays_are_shared_and_read_only(tmp_path, numpy_path):
+    file_name = encoded_file(str(tmp_path / "values.bin"), sample_values('i', 100))
+    cache = DecodedCache()
+
+    first = cache.get_array(file_name)
+    second = cache.get_array(file_name)
+
+    if cachetools.np is None:
+        #arrays of the array module cannot be made read-only, every caller gets its own copy
+        first[0] += 1
+        assert second[0] == first[0] - 1
+        return
+
+    assert first is second
+    assert not first.flags.writeable
+    with pytest.raises(ValueError):
+        first[0] = 1
+
+
+def test_disk_cache_is_shared_between_caches(tmp_path, numpy_path):
+    values = sample_values('f', 1000)
+    file_name = encoded_file(str(tmp_path / "values.bin"), values, 'f')
+    cache_dir = str(tmp_path / "cache")
+
+    DecodedCache(cache_dir=cache_dir).get_array(file_name)
+    cached_files = os.listdir(cache_dir)
+    cache = DecodedCache(cache_dir=cache_dir)
+
+    assert ArrayTools.to_list(cache.get_array(file_name)) == values
+    assert cache.stats()["disk_hits"] == 1
+    assert len(cached_files) == 1
+    assert FileReader.list_from_decoded(os.path.join(cache_dir, cached_files[0])) == values
+
+
+def test_disk_cache_replaces_stale_versions(tmp_path):
+    file_name = encoded_file(str(tmp_path / "values.bin"), sample_values('i', 500))
+    cache_dir = str(tmp_path / "cache")
+    DecodedCache(cache_dir=cache_dir).get_array(file_name)
+    stale_files = os.listdir(cache_dir)
+
+    new_values = sample_values('i', 500, seed=1)
+    rewrite(file_name, new_values)
+    cache = DecodedCache(cache_dir=cache_dir)
+
+    assert ArrayTools.to_list(cache.get_array(file_name)) == new_values
+    assert cache.stats()["misses"] == 1
+    assert len(os.listdir(cache_dir)) == 1 and os.listdir(cache_dir) != stale_files
+
+
+def test_unreadable_disk_cache_is_decoded_again(tmp_path):
+    values = sample_values('i', 500)
+    file_name = encoded_file(str(tmp_path / "values.bin"), values)
+    cache_dir = str(tmp_path / "cache")
+    DecodedCache(cache_dir=cache_dir).get_array(file_name)
+    for name in os.listdir(cache_dir):
+        with open(os.path.join(cache_dir, name), 'r+b') as f:
+            f.truncate(os.path.getsize(f.name) - 4)
+
+    cache = DecodedCache(cache_dir=cache_dir)
+
+    assert ArrayTools.to_list(cache.get_array(file_name)) == values
+    assert cache.stats()["misses"] == 1
+
+
+def test_decoded_files_are_not_written_to_disk(tmp_path):
+    values = sample_values('i', 500)
+    file_name = write_decoded(str(tmp_path / "values.bin"), values, 'i')
+    cache_dir = str(tmp_path / "cache")
+
+    assert ArrayTools.to_list(DecodedCache(cache_dir=cache_dir).get_array(file_name)) == values
+    assert os.listdir(cache_dir) == []
+
+
+def test_clear(tmp_path):
+    file_name = encoded_file(str(tmp_path / "values.bin"), sample_values('i', 100))
+    cache = DecodedCache()
+    cache.get_array(file_name)
+
+    cache.clear()
+
+    assert cache.stats() == {"hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0, "entries": 0, "bytes": 0}
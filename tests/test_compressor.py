@@ -0,0 +1,108 @@
+import os
+import re
+import subprocess
+import sys
+import pytest
+from tests.helpers import sample_values, write_decoded
+from utils.filetools import FileReader
+import compressor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run_compressor(*arguments):
+    return subprocess.run([sys.executable, os.path.join(ROOT, "compressor.py"), *arguments], cwd=ROOT,
+                          capture_output=True, text=True)
+
+
+def test_expand_paths(tmp_path):
+    (tmp_path / "nested").mkdir()
+    for name in ["b.bin", "a.csv", "notes.txt", "nested/c.bin"]:
+        (tmp_path / name).write_bytes(b'')
+
+    files = compressor.expand_paths([str(tmp_path), str(tmp_path / "*.bin"), str(tmp_path / "missing.bin")])
+
+    #directories are searched recursively for supported files, duplicates are dropped
+    assert files == [str(tmp_path / "a.csv"), str(tmp_path / "b.bin"), str(tmp_path / "nested" / "c.bin"),
+                     str(tmp_path / "missing.bin")]
+
+
+def test_trailing_i_selects_integers(tmp_path):
+    assert compressor.parse_arguments(["values.csv", "i"]).type == "i"
+    assert compressor.parse_arguments(["values.csv"]).type == "d"
+    assert compressor.parse_arguments(["a.bin", "b.bin"]).paths == ["a.bin", "b.bin"]
+
+
+def test_run_batch_continues_after_failure(tmp_path):
+    good = write_decoded(str(tmp_path / "good.bin"), sample_values('i', 100), 'i')
+    bad = str(tmp_path / "bad.bin")
+    with open(bad, 'wb') as f:
+        f.write(b'')
+
+    results, failures = compressor.run_batch([bad, good])
+
+    assert [result["file"] for result in results] == [good]
+    assert [file_name for file_name, _ in failures] == [bad]
+    assert FileReader.metadata_from_binary(good).is_encoded
+
+
+@pytest.mark.parametrize("jobs", ["1", "2"])
+def test_exit_status(tmp_path, jobs):
+    for name in ["a", "b"]:
+        write_decoded(str(tmp_path / f"{name}.bin"), sample_values('i', 100), 'i')
+
+    process = run_compressor("-j", jobs, str(tmp_path))
+    assert process.returncode == 0, process.stderr
+    assert "Processed 2 file(s), 0 failed" in process.stdout
+
+    #a failing file is reported and the other files are still processed
+    (tmp_path / "c.bin").write_bytes(b'')
+    process = run_compressor("-j", jobs, str(tmp_path / "*.bin"))
+    assert process.returncode == 1
+    assert "Processed 2 file(s), 1 failed" in process.stdout
+    #files encoded by the first run are decoded by the second
+    assert not any(FileReader.metadata_from_binary(str(tmp_path / f"{name}.bin")).is_encoded for name in ["a", "b"])
+
+
+def test_output_directory(tmp_path):
+    source = tmp_path / "source"
+    source.mkdir()
+    for name in ["a", "b"]:
+        write_decoded(str(source / f"{name}.bin"), sample_values('i', 100), 'i')
+    (source / "c.csv").write_text("1,0,2\n")
+
+    process = run_compressor("-o", str(tmp_path / "out"), str(source))
+
+    assert process.returncode == 0, process.stderr
+    #inputs are left as they are, outputs keep their names with CSV files getting a .bin name
+    assert sorted(os.listdir(tmp_path / "out")) == ["a.bin", "b.bin", "c.bin"]
+    assert not FileReader.metadata_from_binary(str(source / "a.bin")).is_encoded
+    assert all(FileReader.metadata_from_binary(str(tmp_path / "out" / name)).is_encoded
+               for name in ["a.bin", "b.bin", "c.bin"])
+
+
+@pytest.mark.parametrize("jobs", ["1", "2"])
+def test_stats_output(tmp_path, jobs):
+    values = sample_values('i', 1000, density=0.25)
+    file_name = write_decoded(str(tmp_path / "values.bin"), values, 'i')
+    decoded_size = os.path.getsize(file_name)
+
+    result = run_compressor(file_name, "--stats", "-j", jobs)
+    encoded_size = os.path.getsize(file_name)
+
+    assert result.returncode == 0
+    summary, stats = result.stdout.splitlines()
+    assert summary.startswith(f"encode   {file_name}: {decoded_size} -> {encoded_size} bytes")
+    match = re.fullmatch(r"\s+stages: (.*) \| read (\d+) B, wrote (\d+) B, (\d+) values, density ([\d.]+)", stats)
+    assert [name.rsplit(" ", 2)[0] for name in match.group(1).split(", ")] == ["metadata", "read", "verify", "encode",
+                                                                              "header", "write"]
+    assert [int(match.group(number)) for number in range(2, 5)] == [decoded_size, encoded_size, len(values)]
+    assert float(match.group(5)) == pytest.approx(sum(1 for value in values if value != 0) / len(values), abs=0.001)
+
+
+def test_no_stats_by_default(tmp_path):
+    file_name = write_decoded(str(tmp_path / "values.bin"), sample_values('i', 100), 'i')
+
+    result = compressor.process_file(file_name)
+
+    assert "stats" not in result
@@ -0,0 +1,90 @@
+import os
+import subprocess
+import sys
+import pytest
+from utils.arraytools import ArrayTools
+from utils.encoder import Encoder
+from utils.filetools import FileConverter, FileReader
+from utils.typetools import BFLOAT16
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+ROWS = [["1", "0", "2.5"], ["0", "x", "-3"], [], ["4", "0", "0", "7"]]
+
+
+def write_csv(tmp_path, rows=ROWS):
+    file_name = tmp_path / "values.csv"
+    file_name.write_text("".join(",".join(row) + "\n" for row in rows))
+    return str(file_name)
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 1 << 20])
+def test_every_row_is_converted(tmp_path, numpy_path, chunk_size):
+    #non-numerical cells are skipped, chunks can end anywhere in a row
+    csv_file = write_csv(tmp_path)
+    output = FileConverter.csv_to_binary_file(csv_file, 'd', str(tmp_path / "out.bin"), chunk_size=chunk_size)
+
+    assert ArrayTools.to_list(FileReader.array_from_decoded(output)) == [1, 0, 2.5, 0, -3, 4, 0, 0, 7]
+
+
+@pytest.mark.parametrize("rows, column, expected", [
+    ((1, 4), None, [0, -3, 4, 0, 0, 7]),
+    ((0, 1), None, [1, 0]),
+    (None, 2, [-3, 0]),
+    (None, 3, [7]),
+])
+def test_rows_and_column(tmp_path, numpy_path, rows, column, expected):
+    csv_file = write_csv(tmp_path)
+    output = FileConverter.csv_to_binary_file(csv_file, 'i', str(tmp_path / "out.bin"), rows, column)
+
+    assert ArrayTools.to_list(FileReader.array_from_decoded(output)) == expected
+
+
+def test_strict_rejects_non_numerical_cells(tmp_path, numpy_path):
+    with pytest.raises(Exception, match="Non-numerical"):
+        FileConverter.csv_to_binary_file(write_csv(tmp_path), 'd', str(tmp_path / "out.bin"), strict=True)
+
+
+def test_list_from_csv_rows(tmp_path):
+    csv_file = write_csv(tmp_path)
+
+    assert FileReader.list_from_csv(csv_file) == [1.0, 0.0, 2.5]
+    assert FileReader.list_from_csv(csv_file, False, rows=None) == [1, 0, 0, -3, 4, 0, 0, 7]
+
+
+def test_bool_and_unsigned_cells(tmp_path, numpy_path):
+    #bool cells are parsed as integers, so "0" is False
+    csv_file = write_csv(tmp_path, [["0", "1", "2", "0", "7"]])
+
+    output = FileConverter.csv_to_binary_file(csv_file, '?', str(tmp_path / "bool.bin"))
+    assert ArrayTools.to_list(FileReader.array_from_decoded(output)) == [False, True, True, False, True]
+    output = FileConverter.csv_to_binary_file(csv_file, 'Q', str(tmp_path / "unsigned.bin"))
+    assert ArrayTools.to_list(FileReader.array_from_decoded(output)) == [0, 1, 2, 0, 7]
+
+    with pytest.raises(Exception, match="bfloat16"):
+        FileConverter.csv_to_binary_file(csv_file, BFLOAT16, str(tmp_path / "bfloat16.bin"))
+
+
+@pytest.mark.parametrize("chr_rep", ['d', 'f', 'i', 'h', '?'])
+@pytest.mark.parametrize("chunk_size", [1, 3, 1 << 20])
+def test_direct_encoding_matches_decoded_then_encoded(tmp_path, numpy_path, chr_rep, chunk_size):
+    csv_file = write_csv(tmp_path, ROWS + [["0"] * 20, ["5"] * 3])
+    decoded = FileConverter.csv_to_binary_file(csv_file, chr_rep, str(tmp_path / "decoded.bin"))
+    expected_decoded = open(decoded, 'rb').read()
+    Encoder.encode_bin_file(decoded)
+
+    encoded = Encoder.encode_csv_file(csv_file, chr_rep, str(tmp_path / "encoded.bin"), str(tmp_path / "tee.bin"),
+                                      chunk_size=chunk_size)
+
+    assert open(encoded, 'rb').read() == open(decoded, 'rb').read()
+    assert open(tmp_path / "tee.bin", 'rb').read() == expected_decoded
+
+
+@pytest.mark.parametrize("arguments, expected", [([], [1.0, 0.0, 2.5, 0.0, -3.0, 4.0, 0.0, 0.0, 7.0]),
+                                                 (["i"], [1, 0, 0, -3, 4, 0, 0, 7])])
+def test_viewer_shows_every_row(tmp_path, arguments, expected):
+    process = subprocess.run([sys.executable, os.path.join(ROOT, "viewer.py"), write_csv(tmp_path), *arguments],
+                             cwd=ROOT, capture_output=True, text=True)
+
+    assert process.returncode == 0, process.stderr
+    assert process.stdout.strip() == str(expected)
@@ -0,0 +1,45 @@
+import pytest
+from tests.helpers import DTYPES, ENCODING_IDS, ENCODINGS, banded_values, read_payload, sample_values, write_decoded
+from utils.arraytools import ArrayTools
+from utils.decoder import Decoder
+from utils.encoder import Encoder
+from utils.filetools import FileReader
+
+
+@pytest.mark.parametrize("density", [0.0, 0.05, 0.5, 1.0])
+@pytest.mark.parametrize("count", [0, 1, 8, 16, 203])
+@pytest.mark.parametrize("chr_rep", DTYPES)
+def test_round_trip(tmp_path, numpy_path, chr_rep, count, density):
+    values = sample_values(chr_rep, count, density)
+    file_name = write_decoded(str(tmp_path / "values.bin"), values, chr_rep)
+    decoded = read_payload(file_name)
+
+    Encoder.encode_bin_file(file_name)
+    assert ArrayTools.to_list(FileReader.array_from_encoded(file_name)) == values
+    assert FileReader.list_from_encoded(file_name) == values
+
+    Decoder.decode_bin_file(file_name)
+    assert read_payload(file_name) == decoded
+
+
+@pytest.mark.parametrize("encoding", ENCODINGS, ids=ENCODING_IDS)
+@pytest.mark.parametrize("chr_rep", DTYPES)
+def test_round_trip_every_mode(tmp_path, numpy_path, chr_rep, encoding):
+    values = banded_values(chr_rep, 1001)
+    file_name = write_decoded(str(tmp_path / "values.bin"), values, chr_rep)
+    decoded = read_payload(file_name)
+
+    Encoder.encode_bin_file(file_name, **encoding)
+    assert ArrayTools.to_list(FileReader.get_array(file_name)) == values
+
+    Decoder.decode_bin_file(file_name)
+    assert read_payload(file_name) == decoded
+
+
+def test_sparse_last_mask(tmp_path, numpy_path):
+    #the number of values comes from the masks, not from the number of bytes left
+    values = [0] * 16 + [0, 0, 5]
+    file_name = write_decoded(str(tmp_path / "values.bin"), values, 'i')
+    Encoder.encode_bin_file(file_name)
+
+    assert FileReader.list_from_encoded(file_name) == values
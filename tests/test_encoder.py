@@ -0,0 +1,48 @@
+import struct
+import pytest
+from tests.helpers import DTYPES, read_payload, sample_values, write_decoded
+from utils.encoder import Encoder
+from utils.filetools import FileReader
+from utils.typetools import DataHelper
+
+
+def legacy_encode(values, chr_rep: str):
+    """
+    Bit mask encodes values one element at a time, as the encoder did before it was vectorized:
+    a mask byte per 8 values (first value in the highest bit) followed by the non-zero values of the mask
+
+    Returns:
+    bytes: interleaved masks and non-zero values (without the file header)
+    """
+    encoded = b''
+    for start in range(0, len(values), 8):
+        group = list(values[start:start + 8])
+        mask = "".join("1" if element != 0 else "0" for element in group).ljust(8, "0")
+        encoded += int(mask, 2).to_bytes(1, "little")
+        for element in group:
+            if element != 0:
+                encoded += struct.pack(chr_rep, element)
+
+    return encoded
+
+
+@pytest.mark.parametrize("count", [0, 1, 7, 8, 9, 1000])
+@pytest.mark.parametrize("chr_rep", DTYPES)
+def test_matches_legacy_encoder(tmp_path, numpy_path, chr_rep, count):
+    values = sample_values(chr_rep, count)
+    file_name = write_decoded(str(tmp_path / "values.bin"), values, chr_rep)
+    Encoder.encode_bin_file(file_name)
+
+    metadata = FileReader.metadata_from_binary(file_name)
+    assert (metadata.length, metadata.last_values) == (count, count % 8)
+    assert read_payload(file_name) == legacy_encode(values, DataHelper.storage_letter(chr_rep))
+
+
+@pytest.mark.parametrize("chr_rep", DataHelper._float_letter_from_metadata)
+def test_matches_legacy_encoder_on_special_floats(tmp_path, numpy_path, chr_rep):
+    #negative zero is stored as a zero, NaN as a non-zero value
+    values = [-0.0, 0.0, float("nan"), 1.5, float("inf"), -0.0, 0.0, -2.0, 0.0, float("-inf")]
+    file_name = write_decoded(str(tmp_path / "values.bin"), values, chr_rep)
+    Encoder.encode_bin_file(file_name)
+
+    assert read_payload(file_name) == legacy_encode(values, chr_rep)
@@ -0,0 +1,168 @@
+import array
+import io
+import struct
+import pytest
+from tests.helpers import DTYPES, read_payload, sample_values, write_decoded
+from tests.test_encoder import legacy_encode
+from utils.arraytools import ArrayTools, np
+from utils.decoder import Decoder
+from utils.encoder import Encoder
+from utils.filetools import FileConstructor, FileReader, Metadata
+from utils.typetools import DataHelper
+
+
+def test_metadata_compares_like_tuple():
+    metadata = Metadata(1, 0, 3, 4, 'i')
+
+    assert metadata == (1, 0, 3, 4, 'i')
+    assert metadata == Metadata(1, 0, 3, 4, 'i', header_size=32)
+    assert metadata != Metadata(0, 0, 3, 4, 'i')
+    assert metadata != None
+    assert metadata != [1, 0, 3, 4, 'i']
+    assert tuple(metadata) == (1, 0, 3, 4, 'i')
+    assert metadata[4] == 'i'
+
+
+def test_metadata_is_hashable():
+    metadata = Metadata(1, 0, 3, 4, 'i')
+
+    assert hash(metadata) == hash((1, 0, 3, 4, 'i'))
+    assert len({metadata, Metadata(1, 0, 3, 4, 'i')}) == 1
+
+
+def test_metadata_is_read_from_header_only(tmp_path):
+    values = sample_values('h', 1001)
+    file_name = write_decoded(str(tmp_path / "values.bin"), values, 'h')
+    Encoder.encode_bin_file(file_name)
+
+    with open(file_name, 'rb') as f:
+        metadata = FileReader.read_metadata(f)
+        assert f.tell() == metadata.header_size
+
+    assert metadata == (1, 0, 1001 % 8, 2, 'h')
+    assert FileReader.metadata_from_binary(file_name) == metadata
+
+
+def test_empty_file_has_no_metadata():
+    with pytest.raises(Exception):
+        FileReader.read_metadata(io.BytesIO(b''))
+
+
+def test_pack_values_converts_typed_byte_arrays():
+    #typed arrays of unsigned bytes hold values, only bytes-like objects are already packed
+    expected = ArrayTools.to_bytes(array.array('i', [1, 0, 2]), 'i')
+    assert bytes(FileConstructor.pack_values(array.array('B', [1, 0, 2]), 'i')) == expected
+    assert bytes(FileConstructor.pack_values([1, 0, 2], 'i')) == expected
+    if np is not None:
+        assert bytes(FileConstructor.pack_values(np.array([1, 0, 2], dtype=np.uint8), 'i')) == expected
+        assert bytes(FileConstructor.pack_values(np.array([1, 0, 2], dtype=np.int64), 'i')) == expected
+
+
+def test_pack_values_keeps_packed_bytes():
+    packed = ArrayTools.to_bytes(array.array('h', [3, -4]), 'h')
+    assert bytes(FileConstructor.pack_values(packed, 'h')) == packed
+    assert bytes(FileConstructor.pack_values(bytearray(packed), 'h')) == packed
+    assert bytes(FileConstructor.pack_values(memoryview(packed), 'h')) == packed
+    assert bytes(FileConstructor.pack_values(array.array('h', [3, -4]), 'h')) == packed
+
+    with pytest.raises(Exception):
+        FileConstructor.pack_values(packed[:-1], 'h')
+
+
+@pytest.mark.parametrize("chr_rep", DTYPES)
+def test_list_to_binary_file_matches_per_value_packing(numpy_path, chr_rep):
+    values = sample_values(chr_rep, 301)
+    output = io.BytesIO()
+    FileConstructor.list_to_binary_file(values, chr_rep, output)
+
+    payload = b''.join(struct.pack(DataHelper.storage_letter(chr_rep), value) for value in values)
+    assert output.getvalue() == FileConstructor.create_header(False, chr_rep, len(values), payload) + payload
+
+
+def test_binary_file_name_keeps_dots_in_directories():
+    assert FileConstructor.binary_file_name("./data.v2/x.csv") == "./data.v2/x.bin"
+    assert FileConstructor.binary_file_name("values") == "values.bin"
+
+
+def test_binary_file_name_is_required_when_not_interactive(monkeypatch):
+    monkeypatch.setattr("sys.stdin", io.StringIO(""))
+
+    with pytest.raises(Exception, match="not running interactively"):
+        FileConstructor.binary_file_name()
+    with pytest.raises(Exception):
+        FileConstructor.list_to_binary_file([1, 2], 'i')
+
+
+def flip_last_byte(file_name: str):
+    with open(file_name, 'r+b') as f:
+        f.seek(-1, 2)
+        last = f.read(1)
+        f.seek(-1, 2)
+        f.write(bytes([last[0] ^ 1]))
+
+
+def test_extended_header_records_values(tmp_path):
+    values = sample_values('h', 1001)
+    file_name = FileConstructor.list_to_binary_file(values, 'h', str(tmp_path / "values.bin"))
+    Encoder.encode_bin_file(file_name)
+
+    metadata = FileReader.metadata_from_binary(file_name)
+    assert (metadata.is_encoded, metadata.chr_rep, metadata.length, metadata.last_values) == (1, 'h', 1001, 1)
+    assert metadata.header_size == 32 and metadata.is_native
+    assert FileReader.list_from_encoded(file_name) == values
+
+
+@pytest.mark.parametrize("encoded", [False, True], ids=["decoded", "encoded"])
+def test_checksum_mismatch_is_rejected(tmp_path, numpy_path, encoded):
+    file_name = FileConstructor.list_to_binary_file(sample_values('i', 100, density=1.0), 'i', str(tmp_path / "values.bin"))
+    if encoded:
+        Encoder.encode_bin_file(file_name)
+    flip_last_byte(file_name)
+
+    with pytest.raises(Exception, match="Checksum mismatch"):
+        if encoded:
+            FileReader.array_from_encoded(file_name)
+        else:
+            FileReader.array_from_decoded(file_name)
+
+
+def test_truncated_payload_is_rejected(tmp_path):
+    file_name = FileConstructor.list_to_binary_file(sample_values('d', 100), 'd', str(tmp_path / "values.bin"))
+    with open(file_name, 'r+b') as f:
+        f.truncate(32 + 99 * 8)
+
+    with pytest.raises(Exception, match="truncated"):
+        FileReader.array_from_decoded(file_name)
+
+
+@pytest.mark.parametrize("chr_rep", DataHelper._int_letter_from_metadata + DataHelper._float_letter_from_metadata)
+def test_legacy_header_is_read(tmp_path, numpy_path, chr_rep):
+    #files written before the extended header start with a single metadata byte
+    values = sample_values(chr_rep, 203)
+    decoded_file = write_decoded(str(tmp_path / "decoded.bin"), values, chr_rep)
+    encoded_file = str(tmp_path / "encoded.bin")
+    with open(encoded_file, 'wb') as f:
+        f.write(FileConstructor.create_first_byte(True, chr_rep, len(values) % 8) + legacy_encode(values, chr_rep))
+
+    metadata = FileReader.metadata_from_binary(decoded_file)
+    assert (metadata.header_size, metadata.length, metadata.checksum) == (1, None, None)
+    assert ArrayTools.to_list(FileReader.array_from_decoded(decoded_file)) == values
+    assert FileReader.list_from_encoded(encoded_file) == values
+
+    Decoder.decode_bin_file(encoded_file)
+    assert read_payload(encoded_file) == read_payload(decoded_file)
+
+
+@pytest.mark.parametrize("size, letter, long_letter", [(4, 'i', 'l'), (8, 'q', 'l'), (4, 'I', 'L'), (8, 'Q', 'L')])
+def test_long_values_of_any_size_are_read(tmp_path, size, letter, long_letter):
+    #'l' and 'L' are 4 bytes on some machines and 8 on others, values are read with the letter of their recorded size
+    values = [1, 0, 2] if letter.isupper() else [1, 0, -2]
+    header = bytearray(FileConstructor.create_header(False, letter, 3))
+    header[4:6] = long_letter.encode("ascii") + bytes([size])
+    file_name = str(tmp_path / "values.bin")
+    with open(file_name, 'wb') as f:
+        f.write(bytes(header) + struct.pack(f'3{letter}', *values))
+
+    chr_rep = FileReader.metadata_from_binary(file_name).chr_rep
+    assert struct.calcsize(chr_rep) == size and DataHelper.is_signed(chr_rep) == letter.islower()
+    assert ArrayTools.to_list(FileReader.array_from_decoded(file_name)) == values
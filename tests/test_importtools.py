@@ -0,0 +1,43 @@
+import os
+import subprocess
+import sys
+import pytest
+from utils.importtools import LazyModule
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.mark.parametrize("module", ["compressor", "viewer", "utils.torchtools"])
+def test_heavy_modules_are_not_imported(module):
+    code = f"import sys, {module}; print(' '.join(sorted(set(sys.modules) & {{'numpy', 'torch', 'multiprocessing'}})))"
+    process = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True)
+
+    assert process.returncode == 0, process.stderr
+    assert process.stdout.split() == []
+
+
+def test_compressor_works_without_importing_numpy_first(tmp_path):
+    #the lazy stand-in imports NumPy the first time values are encoded
+    code = ("import sys, compressor; from tests.helpers import write_decoded; "
+            f"write_decoded({str(tmp_path / 'values.bin')!r}, [0, 1, 2, 0], 'i'); "
+            f"compressor.process_file({str(tmp_path / 'values.bin')!r}); print('numpy' in sys.modules)")
+    process = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True)
+
+    assert process.returncode == 0, process.stderr
+    assert process.stdout.split() == [str(LazyModule.optional("numpy") is not None)]
+
+
+def test_lazy_module_imports_on_first_use():
+    module = LazyModule("json")
+
+    assert repr(module) == "LazyModule('json')"
+    assert module.loads("[1, 2]") == [1, 2]
+    assert "loads" in module.__dict__
+
+
+def test_optional_missing_module(monkeypatch):
+    monkeypatch.setitem(sys.modules, "blocked_module", None)
+
+    assert LazyModule.optional("module_that_does_not_exist") is None
+    assert LazyModule.optional("blocked_module") is None
+    assert isinstance(LazyModule.optional("json"), LazyModule)
@@ -0,0 +1,106 @@
+import os
+import random
+import pytest
+from tests.helpers import sample_values, write_decoded
+from utils.arraytools import ArrayTools
+from utils.encoder import Encoder
+from utils.filetools import FileReader
+from utils.indextools import BlockIndex, EncodedReader
+
+
+def encoded_file(tmp_path, values, chr_rep: str='i', index_interval: int=None):
+    file_name = write_decoded(str(tmp_path / "values.bin"), values, chr_rep)
+    Encoder.encode_bin_file(file_name, index_interval=index_interval)
+    return file_name
+
+
+def test_saved_index_matches_built_index(tmp_path):
+    file_name = encoded_file(tmp_path, sample_values('i', 5003, density=0.1), index_interval=4)
+    index = BlockIndex.load(file_name)
+    built = BlockIndex.build(file_name, interval=4)
+
+    assert list(index.offsets) == list(built.offsets)
+    assert (index.interval, index.num_masks) == (built.interval, built.num_masks) == (4, -(-5003 // 8))
+
+
+def test_index_is_stale_when_size_changes(tmp_path):
+    file_name = encoded_file(tmp_path, sample_values('i', 1000), index_interval=8)
+    stats = os.stat(file_name)
+
+    with open(file_name, 'ab') as f:
+        f.write(b'\x00')
+    os.utime(file_name, ns=(stats.st_atime_ns, stats.st_mtime_ns))
+
+    assert BlockIndex.load(file_name) is None
+
+
+def test_index_is_stale_when_mtime_changes(tmp_path):
+    file_name = encoded_file(tmp_path, sample_values('i', 1000), index_interval=8)
+    stats = os.stat(file_name)
+    assert BlockIndex.load(file_name) is not None
+
+    os.utime(file_name, ns=(stats.st_atime_ns, stats.st_mtime_ns + 1000))
+
+    assert BlockIndex.load(file_name) is None
+
+
+def test_for_file_rebuilds_stale_index(tmp_path):
+    file_name = encoded_file(tmp_path, sample_values('i', 1000), index_interval=8)
+    stats = os.stat(file_name)
+    os.utime(file_name, ns=(stats.st_atime_ns, stats.st_mtime_ns + 1000))
+
+    index = BlockIndex.for_file(file_name, interval=2)
+
+    assert index.interval == 2
+    assert BlockIndex.load(file_name).interval == 2
+
+
+@pytest.mark.parametrize("interval", [1, 3, 64])
+@pytest.mark.parametrize("density", [0.0, 0.1, 0.9])
+def test_random_access_matches_full_decode(tmp_path, numpy_path, interval, density):
+    file_name = encoded_file(tmp_path, sample_values('h', 2001, density), 'h', interval)
+    values = ArrayTools.to_list(FileReader.array_from_encoded(file_name))
+    generator = random.Random(interval)
+
+    with EncodedReader(file_name) as reader:
+        assert len(reader) == len(values)
+        for _ in range(50):
+            position = generator.randrange(-len(values), len(values))
+            assert reader[position] == values[position]
+
+            start = generator.randrange(len(values))
+            stop = generator.randrange(start, len(values) + 10)
+            assert ArrayTools.to_list(reader.slice(start, stop)) == values[start:stop]
+            assert ArrayTools.to_list(reader[start:stop:3]) == values[start:stop:3]
+
+        with pytest.raises(IndexError):
+            reader[len(values)]
+
+
+def test_values_stay_valid_after_close(tmp_path):
+    values = sample_values('d', 500, density=0.5)
+    file_name = encoded_file(tmp_path, values, 'd', 4)
+
+    reader = EncodedReader(file_name)
+    piece = reader[100:300]
+    reader.close()
+    assert reader.mmap.closed
+    assert ArrayTools.to_list(piece) == values[100:300]
+
+
+def test_close_keeps_mapping_of_live_views(tmp_path):
+    values = sample_values('d', 500, density=0.5)
+    file_name = encoded_file(tmp_path, values, 'd', 4)
+
+    reader = EncodedReader(file_name)
+    view = memoryview(reader.mmap)
+    reader.close()
+
+    #the view keeps the mapping open until it is released
+    assert not reader.mmap.closed
+    with open(file_name, 'rb') as f:
+        assert bytes(view) == f.read()
+
+    view.release()
+    reader.mmap.close()
+    assert reader.mmap.closed
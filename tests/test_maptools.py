@@ -0,0 +1,81 @@
+import pytest
+from tests.helpers import sample_values, write_decoded
+from utils.arraytools import ArrayTools, np
+from utils.encoder import Encoder
+from utils.maptools import MappedReader
+
+
+@pytest.mark.parametrize("index", [slice(None), slice(3, 90), slice(90, 3, -7), slice(-20, None, 3), slice(5, 5)])
+def test_slices_match_values(tmp_path, numpy_path, index):
+    values = sample_values('i', 101)
+    file_name = write_decoded(str(tmp_path / "values.bin"), values, 'i')
+
+    with MappedReader(file_name) as reader:
+        assert len(reader) == len(values)
+        assert ArrayTools.to_list(reader[index]) == values[index]
+
+
+def test_indices_match_values(tmp_path, numpy_path):
+    values = sample_values('d', 50)
+    file_name = write_decoded(str(tmp_path / "values.bin"), values, 'd')
+
+    with MappedReader(file_name) as reader:
+        assert [reader[i] for i in range(len(values))] == values
+        assert reader[-1] == values[-1]
+        assert bytes(reader.buffer) == ArrayTools.to_bytes(values, 'd')
+        with pytest.raises(IndexError):
+            reader[len(values)]
+
+
+def test_empty_file(tmp_path):
+    file_name = write_decoded(str(tmp_path / "values.bin"), [], 'h')
+
+    with MappedReader(file_name) as reader:
+        assert len(reader) == 0
+        assert reader.mmap is None
+        assert len(reader[:]) == 0
+
+
+def test_encoded_file_is_rejected(tmp_path):
+    file_name = write_decoded(str(tmp_path / "values.bin"), [1, 0, 2], 'i')
+    Encoder.encode_bin_file(file_name)
+
+    with pytest.raises(Exception):
+        MappedReader(file_name)
+
+
+def test_mapping_is_copy_on_write(tmp_path):
+    if np is None:
+        pytest.skip("NumPy is required for array access")
+
+    values = sample_values('i', 64, density=1.0)
+    file_name = write_decoded(str(tmp_path / "values.bin"), values, 'i')
+    with open(file_name, 'rb') as f:
+        stored = f.read()
+
+    with MappedReader(file_name) as reader:
+        reader.array[:] = 0
+
+    with open(file_name, 'rb') as f:
+        assert f.read() == stored
+
+
+def test_close_keeps_live_views_valid(tmp_path):
+    if np is None:
+        pytest.skip("NumPy is required for array access")
+
+    values = sample_values('f', 100, density=1.0)
+    file_name = write_decoded(str(tmp_path / "values.bin"), values, 'f')
+
+    reader = MappedReader(file_name)
+    array = reader.array
+    reader.close()
+
+    #the view keeps the mapping open until it is deleted
+    assert not reader.mmap.closed
+    assert array.tolist() == values
+
+    del array
+    reader = MappedReader(file_name)
+    reader.close()
+    assert reader.mmap.closed
@@ -0,0 +1,89 @@
+import shutil
+import struct
+import sys
+import pytest
+from tests.helpers import ENCODING_IDS, ENCODINGS, banded_values, sample_values, write_decoded
+from utils.codectools import CODEC_NONE
+from utils.decoder import Decoder
+from utils.encoder import Encoder
+from utils.filetools import MODE_ADAPTIVE, FileConstructor, FileReader
+from utils.indextools import BlockIndex
+from utils.paralleltools import ParallelCoder
+
+
+def read_bytes(file_name: str):
+    with open(file_name, 'rb') as f:
+        return f.read()
+
+
+@pytest.mark.parametrize("encoding", ENCODINGS, ids=ENCODING_IDS)
+@pytest.mark.parametrize("workers", [1, 2])
+@pytest.mark.parametrize("segment_blocks", [1, 125, 1 << 16])
+def test_encode_matches_serial(tmp_path, workers, segment_blocks, encoding):
+    #segments hold whole masks, chunks or frames, runs of empty 64-bit masks are merged across segments
+    segment_size = segment_blocks * Encoder.block_size(encoding["mode"], encoding.get("adaptive_chunk_size"),
+                                                       encoding.get("codec", CODEC_NONE))
+    values = banded_values('f', 5003) + [0.0] * 3000
+    serial_file = write_decoded(str(tmp_path / "serial.bin"), values, 'f')
+    parallel_file = str(tmp_path / "parallel.bin")
+    shutil.copyfile(serial_file, parallel_file)
+
+    Encoder.encode_bin_file(serial_file, **encoding)
+    ParallelCoder.encode_bin_file(parallel_file, workers, segment_size, **encoding)
+
+    assert read_bytes(parallel_file) == read_bytes(serial_file)
+
+
+@pytest.mark.parametrize("segment_size, encoding", [(12, {}), (96, {"mode": MODE_ADAPTIVE, "adaptive_chunk_size": 64})])
+def test_segment_size_must_be_whole_blocks(tmp_path, segment_size, encoding):
+    file_name = write_decoded(str(tmp_path / "values.bin"), [1, 2, 3], 'i')
+
+    with pytest.raises(Exception):
+        ParallelCoder.encode_bin_file(file_name, 1, segment_size, **encoding)
+
+
+def test_decode_requires_bitmask_mode(tmp_path):
+    file_name = write_decoded(str(tmp_path / "values.bin"), [1, 2, 3], 'i')
+    Encoder.encode_bin_file(file_name, mode=MODE_ADAPTIVE)
+
+    with pytest.raises(Exception, match="only supported for bit mask mode"):
+        ParallelCoder.decode_bin_file(file_name, 1)
+
+
+@pytest.mark.parametrize("with_index", [False, True], ids=["prescan", "index"])
+@pytest.mark.parametrize("workers", [1, 2])
+@pytest.mark.parametrize("segment_size", [8, 1000])
+def test_decode_matches_serial(tmp_path, numpy_path, workers, segment_size, with_index):
+    #segments come from a saved block index, or from one scan of the masks handed to the workers
+    values = sample_values('d', 5003, density=0.3) + [0.0] * 2000 + sample_values('d', 7, seed=1)
+    file_name = write_decoded(str(tmp_path / "values.bin"), values, 'd')
+    Encoder.encode_bin_file(file_name, index_interval=4 if with_index else None)
+    assert (BlockIndex.load(file_name) is not None) == with_index
+    serial_file = str(tmp_path / "serial.bin")
+    Decoder.decode_bin_file(file_name, output=serial_file)
+
+    ParallelCoder.decode_bin_file(file_name, workers, segment_size)
+
+    assert read_bytes(file_name) == read_bytes(serial_file)
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_encode_other_byte_order_matches_serial(tmp_path, numpy_path, workers):
+    #zeros are found by value: -0.0 is a zero, and a denormal whose swapped bytes read as -0.0 is not
+    order = "big" if sys.byteorder == "little" else "little"
+    denormal = struct.unpack('<d' if order == "little" else '>d', bytes(7) + b'\x80')[0]
+    values = ([-0.0, 0.0, denormal, float("nan"), 1.5] * 30 + [0.0] * 50 + sample_values('d', 301)) * 3
+    payload = struct.pack(f"{'<' if order == 'little' else '>'}{len(values)}d", *values)
+    serial_file = str(tmp_path / "serial.bin")
+    with open(serial_file, 'wb') as f:
+        f.write(FileConstructor.create_header(False, 'd', len(values), payload, byte_order=order) + payload)
+    parallel_file = str(tmp_path / "parallel.bin")
+    shutil.copyfile(serial_file, parallel_file)
+
+    Encoder.encode_bin_file(serial_file)
+    ParallelCoder.encode_bin_file(parallel_file, workers, 64)
+
+    assert read_bytes(parallel_file) == read_bytes(serial_file)
+    decoded = FileReader.list_from_encoded(parallel_file)
+    assert decoded[2] == denormal and decoded[3] != decoded[3]
+    assert str(decoded[0]) == "0.0"
@@ -0,0 +1,120 @@
+import io
+import pytest
+from tests.helpers import DTYPES, ENCODING_IDS, ENCODINGS, banded_values, read_payload, sample_values, write_decoded
+from utils.encoder import Encoder
+from utils.filetools import FileReader, MODE_BITMASK
+from utils.sparsetools import SparseTools
+
+
+def encoded_file(tmp_path, values, chr_rep: str, **encoding):
+    file_name = write_decoded(str(tmp_path / "values.bin"), values, chr_rep)
+    Encoder.encode_bin_file(file_name, **encoding)
+    return file_name
+
+
+def sparse_form(values):
+    indices = [index for index, value in enumerate(values) if value != 0]
+    return indices, [values[index] for index in indices]
+
+
+@pytest.mark.parametrize("encoding", ENCODINGS, ids=ENCODING_IDS)
+@pytest.mark.parametrize("chr_rep", ['i', 'd', '?'])
+def test_from_encoded_matches_dense_decode(tmp_path, numpy_path, chr_rep, encoding):
+    values = banded_values(chr_rep, 5000) + [0] * 3000
+    file_name = encoded_file(tmp_path, values, chr_rep, **encoding)
+    dense = FileReader.list_from_encoded(file_name)
+
+    indices, non_zero_values, length = SparseTools.from_encoded(file_name)
+
+    assert length == len(dense)
+    assert (list(indices), list(non_zero_values)) == sparse_form(dense)
+
+
+@pytest.mark.parametrize("chr_rep", DTYPES)
+def test_from_encoded_every_type(tmp_path, numpy_path, chr_rep):
+    values = sample_values(chr_rep, 517)
+    file_name = encoded_file(tmp_path, values, chr_rep)
+
+    indices, non_zero_values, length = SparseTools.from_encoded(file_name)
+
+    assert length == len(values)
+    assert (list(indices), list(non_zero_values)) == sparse_form(FileReader.list_from_encoded(file_name))
+
+
+@pytest.mark.parametrize("encoding", ENCODINGS, ids=ENCODING_IDS)
+def test_from_encoded_all_zero(tmp_path, numpy_path, encoding):
+    file_name = encoded_file(tmp_path, [0] * 4099, 'h', **encoding)
+
+    indices, non_zero_values, length = SparseTools.from_encoded(file_name)
+
+    assert (len(indices), len(non_zero_values), length) == (0, 0, 4099)
+
+
+def test_from_encoded_requires_encoded_file(tmp_path):
+    file_name = write_decoded(str(tmp_path / "values.bin"), sample_values('i', 10), 'i')
+
+    with pytest.raises(Exception, match="not a bit mask encoded"):
+        SparseTools.from_encoded(file_name)
+
+
+@pytest.mark.parametrize("encoding", ENCODINGS, ids=ENCODING_IDS)
+@pytest.mark.parametrize("chr_rep", ['h', 'f', 'Q'])
+def test_to_encoded_file_round_trip(tmp_path, numpy_path, chr_rep, encoding):
+    values = banded_values(chr_rep, 5000)
+    indices, non_zero_values = sparse_form(values)
+    #positions in any order
+    indices.reverse()
+    non_zero_values.reverse()
+
+    output = io.BytesIO()
+    SparseTools.to_encoded_file(indices, non_zero_values, len(values), chr_rep, output, **encoding)
+
+    file_name = str(tmp_path / "sparse.bin")
+    with open(file_name, 'wb') as f:
+        f.write(output.getvalue())
+    assert FileReader.list_from_encoded(file_name) == FileReader.list_from_encoded(
+        encoded_file(tmp_path, values, chr_rep, **encoding))
+
+
+@pytest.mark.parametrize("chr_rep", DTYPES)
+def test_sparse_bitmask_encoding_matches_dense(tmp_path, numpy_path, chr_rep):
+    values = sample_values(chr_rep, 1029, density=0.05) + [0] * 700
+    output_name = str(tmp_path / "sparse.bin")
+
+    SparseTools.to_encoded_file(*sparse_form(values), len(values), chr_rep, output_name, mode=MODE_BITMASK)
+
+    assert read_payload(output_name) == read_payload(encoded_file(tmp_path, values, chr_rep))
+
+
+@pytest.mark.parametrize("encoding", ENCODINGS, ids=ENCODING_IDS)
+def test_to_encoded_file_all_zero(tmp_path, numpy_path, encoding):
+    output_name = str(tmp_path / "sparse.bin")
+
+    SparseTools.to_encoded_file([], [], 2500, 'i', output_name, **encoding)
+
+    assert FileReader.list_from_encoded(output_name) == [0] * 2500
+
+
+@pytest.mark.parametrize("indices, non_zero_values, message", [
+    ([1, 2], [5], "one position per value"),
+    ([3, 3], [5, 6], "unique"),
+    ([-1], [5], "within"),
+    ([10], [5], "within"),
+], ids=["count", "duplicate", "negative", "past end"])
+def test_to_encoded_file_rejects_bad_positions(tmp_path, numpy_path, indices, non_zero_values, message):
+    output_name = tmp_path / "sparse.bin"
+
+    with pytest.raises(Exception, match=message):
+        SparseTools.to_encoded_file(indices, non_zero_values, 10, 'i', str(output_name))
+    assert not output_name.exists()
+
+
+def test_to_csr(numpy_path):
+    dense = [[0, 3, 0, 0], [0, 0, 0, 0], [7, 0, 0, 9]]
+    indices, non_zero_values = sparse_form([value for row in dense for value in row])
+
+    values, columns, row_starts = SparseTools.to_csr(indices, non_zero_values, (3, 4))
+
+    assert list(values) == [3, 7, 9]
+    assert list(columns) == [1, 0, 3]
+    assert list(row_starts) == [0, 1, 1, 3]
@@ -0,0 +1,108 @@
+import io
+import os
+import threading
+import pytest
+from tests.helpers import sample_values, write_decoded
+from utils.decoder import Decoder
+from utils.encoder import Encoder
+from utils.filetools import FileReader
+from utils.stattools import StatTools
+
+
+@pytest.fixture
+def reports():
+    """
+    Enables instrumentation for a test, collecting every finished report
+    """
+    collected = []
+    StatTools.enable(collected.append)
+    yield collected
+    StatTools.disable()
+    StatTools.remove_callback(collected.append)
+
+
+def test_disabled_by_default(tmp_path):
+    assert not StatTools.is_enabled()
+    assert StatTools.operation("encode") is StatTools.stage("encode")
+
+    values = [1, 2, 3]
+    assert StatTools.timed(values, "read") is values
+
+
+def test_encode_and_decode_counters(tmp_path, numpy_path, reports):
+    values = sample_values('i', 5000, density=0.2)
+    file_name = write_decoded(str(tmp_path / "values.bin"), values, 'i')
+    decoded_size = os.path.getsize(file_name)
+
+    Encoder.encode_bin_file(file_name)
+    encoded_size = os.path.getsize(file_name)
+    Decoder.decode_bin_file(file_name)
+
+    encode, decode = reports
+    non_zero = sum(1 for value in values if value != 0)
+    assert (encode.operation, encode.file_name) == ("encode", file_name)
+    assert (encode.elements, encode.non_zero) == (len(values), non_zero)
+    assert encode.density == pytest.approx(non_zero / len(values))
+    assert encode.bytes_read == decoded_size
+    assert encode.bytes_written == encoded_size
+    assert {"read", "encode", "header", "write"} <= set(encode.stages)
+
+    assert (decode.operation, decode.elements, decode.non_zero) == ("decode", len(values), non_zero)
+    assert decode.bytes_read == encoded_size
+    assert decode.bytes_written == os.path.getsize(file_name)
+    assert {"read", "verify", "decode", "pack", "write"} <= set(decode.stages)
+    assert all(seconds >= 0 for seconds in decode.stages.values())
+    assert decode.seconds >= sum(decode.stages.values())
+    assert StatTools.last_report() is decode
+
+
+def test_nested_calls_add_to_outer_report(tmp_path, reports):
+    file_name = write_decoded(str(tmp_path / "values.bin"), sample_values('d', 300), 'd')
+
+    with StatTools.operation("process", file_name) as report:
+        Encoder.encode_bin_file(file_name)
+        FileReader.list_from_encoded(file_name)
+
+    assert reports == [report]
+    assert report.elements == 600
+    assert "to_list" in report.stages
+
+
+def test_streaming_counters(tmp_path, reports):
+    values = sample_values('h', 4000)
+    file_name = write_decoded(str(tmp_path / "values.bin"), values, 'h')
+
+    output = io.BytesIO()
+    with open(file_name, 'rb') as f:
+        Encoder.encode_stream(f, output, chunk_size=512)
+    decoded_file = str(tmp_path / "decoded.bin")
+    with open(decoded_file, 'wb') as f:
+        Decoder.decode_stream(io.BytesIO(output.getvalue()), f, chunk_size=512)
+
+    encode, decode = reports
+    assert FileReader.list_from_decoded(decoded_file) == values
+    assert (encode.elements, encode.bytes_read, encode.bytes_written) == (len(values), os.path.getsize(file_name),
+                                                                           len(output.getvalue()))
+    assert (decode.elements, decode.bytes_read) == (len(values), len(output.getvalue()))
+
+
+def test_failed_call_records_error(tmp_path, reports):
+    file_name = write_decoded(str(tmp_path / "values.bin"), sample_values('i', 10), 'i')
+
+    with pytest.raises(Exception):
+        Decoder.decode_bin_file(file_name)
+
+    assert "not a bit mask encoded" in reports[0].error
+
+
+def test_reports_are_per_thread(tmp_path, reports):
+    file_names = [write_decoded(str(tmp_path / f"{number}.bin"), sample_values('i', 100 * (number + 1)), 'i')
+                  for number in range(4)]
+    threads = [threading.Thread(target=Encoder.encode_bin_file, args=(file_name,)) for file_name in file_names]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted((report.file_name, report.elements) for report in reports) == [
+        (file_name, 100 * (number + 1)) for number, file_name in enumerate(file_names)]
@@ -0,0 +1,100 @@
+import io
+import pytest
+from tests.helpers import ENCODING_IDS, ENCODINGS, banded_values, sample_values, write_decoded
+from utils.arraytools import ArrayTools
+from utils.decoder import Decoder
+from utils.encoder import Encoder, StreamEncoder
+
+
+def read_bytes(file_name: str):
+    with open(file_name, 'rb') as f:
+        return f.read()
+
+
+def encoded_file(tmp_path, values, chr_rep: str, **encoding):
+    """
+    Writes values to a decoded binary file and encodes it with Encoder.encode_bin_file
+
+    Returns:
+    str: name of the encoded file
+    """
+    file_name = write_decoded(str(tmp_path / "encoded.bin"), values, chr_rep)
+    Encoder.encode_bin_file(file_name, **encoding)
+    return file_name
+
+
+@pytest.mark.parametrize("encoding", ENCODINGS, ids=ENCODING_IDS)
+@pytest.mark.parametrize("known_length", [False, True], ids=["unknown", "known"])
+@pytest.mark.parametrize("piece_size", [1, 37, 1000])
+def test_stream_encoder_matches_encoder(tmp_path, numpy_path, piece_size, known_length, encoding):
+    values = banded_values('h', 3001) + [0] * 5000
+
+    output = io.BytesIO()
+    with StreamEncoder(output, 'h', len(values) if known_length else None, **encoding) as stream:
+        for start in range(0, len(values), piece_size):
+            stream.write(values[start:start + piece_size])
+
+    assert stream.length == len(values)
+    assert output.getvalue() == read_bytes(encoded_file(tmp_path, values, 'h', **encoding))
+
+
+@pytest.mark.parametrize("encoding", ENCODINGS, ids=ENCODING_IDS)
+def test_encode_stream_matches_encoder(tmp_path, numpy_path, encoding):
+    values = banded_values('d', 2003)
+    decoded_file = write_decoded(str(tmp_path / "values.bin"), values, 'd')
+
+    output = io.BytesIO()
+    with open(decoded_file, 'rb') as f:
+        assert Encoder.encode_stream(f, output, chunk_size=64, **encoding) == len(values)
+
+    assert output.getvalue() == read_bytes(encoded_file(tmp_path, values, 'd', **encoding))
+
+
+@pytest.mark.parametrize("encoding", ENCODINGS, ids=ENCODING_IDS)
+@pytest.mark.parametrize("chunk_size", [8, 64, 1024])
+def test_iter_decode_is_bounded(tmp_path, numpy_path, chunk_size, encoding):
+    #runs of zeros take a few bytes in every mode, but must not be decoded all at once
+    values = [0] * 50000 + sample_values('i', 2000) + [0] * 50000
+    file_name = encoded_file(tmp_path, values, 'i', **encoding)
+
+    decoded = []
+    with open(file_name, 'rb') as f:
+        chunks = Decoder.iter_decode(f, chunk_size)
+        next(chunks)
+        for chunk in chunks:
+            assert len(chunk) <= chunk_size
+            decoded += ArrayTools.to_list(chunk)
+
+    assert decoded == values
+
+
+@pytest.mark.parametrize("encoding", ENCODINGS, ids=ENCODING_IDS)
+@pytest.mark.parametrize("piece_size", [1, 5, 4096])
+def test_iter_decode_from_byte_pieces(tmp_path, numpy_path, piece_size, encoding):
+    #blocks and the header can be cut anywhere between pieces
+    values = banded_values('f', 1003)
+    encoded = read_bytes(encoded_file(tmp_path, values, 'f', **encoding))
+    pieces = [encoded[start:start + piece_size] for start in range(0, len(encoded), piece_size)]
+
+    chunks = Decoder.iter_decode(pieces, 64)
+    assert next(chunks).chr_rep == 'f'
+    assert [value for chunk in chunks for value in ArrayTools.to_list(chunk)] == values
+
+
+@pytest.mark.parametrize("encoding", ENCODINGS, ids=ENCODING_IDS)
+def test_decode_stream_matches_decoded_file(tmp_path, numpy_path, encoding):
+    values = banded_values('b', 999)
+    file_name = encoded_file(tmp_path, values, 'b', **encoding)
+    decoded_file = str(tmp_path / "decoded.bin")
+    Decoder.decode_bin_file(file_name, output=decoded_file)
+
+    output = io.BytesIO()
+    with open(file_name, 'rb') as f:
+        assert Decoder.decode_stream(f, output, chunk_size=16) == len(values)
+
+    assert output.getvalue() == read_bytes(decoded_file)
+
+
+def test_chunk_size_must_be_whole_masks():
+    with pytest.raises(Exception):
+        next(Decoder.iter_decode(io.BytesIO(b''), 12))
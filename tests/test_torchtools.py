@@ -0,0 +1,134 @@
+import pytest
+from tests.helpers import DTYPES, ENCODING_IDS, ENCODINGS, banded_values, sample_values
+from utils.cachetools import DecodedCache
+from utils.codectools import CODEC_NONE
+from utils.encoder import Encoder
+
+torch = pytest.importorskip("torch")
+from utils.torchtools import TorchConverter
+
+
+@pytest.mark.parametrize("encoded", [False, True], ids=["decoded", "encoded"])
+@pytest.mark.parametrize("chr_rep", DTYPES)
+def test_tensor_round_trip(tmp_path, chr_rep, encoded):
+    tensor = torch.tensor(sample_values(chr_rep, 203), dtype=TorchConverter.character_to_dtype(chr_rep))
+    file_name = TorchConverter.tensor_to_binary_file(tensor, str(tmp_path / "values"))
+    if encoded:
+        Encoder.encode_bin_file(file_name)
+
+    result = TorchConverter.binary_to_tensor(file_name)
+
+    assert result.dtype == tensor.dtype
+    assert torch.equal(result, tensor)
+
+
+def test_non_contiguous_tensor_is_written_in_order(tmp_path):
+    tensor = torch.arange(12, dtype=torch.int32).reshape(3, 4).t()
+    file_name = TorchConverter.tensor_to_binary_file(tensor, str(tmp_path / "values"))
+
+    assert TorchConverter.binary_to_tensor(file_name).tolist() == tensor.reshape(-1).tolist()
+
+
+def test_mapped_tensor_outlives_reader(tmp_path):
+    tensor = torch.tensor(sample_values('f', 300), dtype=torch.float32)
+    file_name = TorchConverter.tensor_to_binary_file(tensor, str(tmp_path / "values"))
+
+    assert torch.equal(TorchConverter.binary_to_tensor(file_name, use_mmap=True), tensor)
+
+
+def sample_state_dict():
+    return {
+        "layer.weight": torch.tensor(sample_values('f', 600), dtype=torch.float32).reshape(20, 30),
+        "layer.bias": torch.tensor(sample_values('d', 30), dtype=torch.float64),
+        "embedding": torch.tensor(sample_values('e', 120), dtype=torch.bfloat16).reshape(4, 5, 6),
+        "mask": torch.tensor(sample_values('?', 64), dtype=torch.bool).reshape(8, 8),
+        "ids": torch.tensor(sample_values('B', 50), dtype=torch.uint8),
+        "steps": torch.tensor(12345, dtype=torch.int64),
+        "transposed": torch.arange(12, dtype=torch.int32).reshape(3, 4).t(),
+    }
+
+
+@pytest.mark.parametrize("encoding", ENCODINGS, ids=ENCODING_IDS)
+def test_state_dict_round_trip(tmp_path, encoding):
+    state_dict = sample_state_dict()
+    file_name = str(tmp_path / "state.bmar")
+    TorchConverter.save_state_dict(state_dict, file_name, 2, encoding["mode"], encoding.get("codec", CODEC_NONE))
+
+    loaded = TorchConverter.load_state_dict(file_name)
+
+    assert list(loaded) == list(state_dict)
+    for name, tensor in state_dict.items():
+        assert loaded[name].dtype == tensor.dtype and loaded[name].shape == tensor.shape
+        assert torch.equal(loaded[name], tensor)
+
+
+def test_state_dict_names(tmp_path):
+    state_dict = sample_state_dict()
+    file_name = str(tmp_path / "state.bmar")
+    TorchConverter.save_state_dict(state_dict, file_name)
+
+    loaded = TorchConverter.load_state_dict(file_name, ["mask", "layer.bias"])
+
+    assert list(loaded) == ["mask", "layer.bias"]
+    assert torch.equal(loaded["layer.bias"], state_dict["layer.bias"])
+    with pytest.raises(KeyError):
+        TorchConverter.load_state_dict(file_name, ["missing"])
+
+
+def test_truncated_state_dict_is_rejected(tmp_path):
+    file_name = tmp_path / "state.bmar"
+    TorchConverter.save_state_dict(sample_state_dict(), str(file_name))
+    file_name.write_bytes(file_name.read_bytes()[:-1])
+
+    with pytest.raises(Exception, match="tensor archive"):
+        TorchConverter.load_state_dict(str(file_name))
+
+
+@pytest.mark.parametrize("encoding", ENCODINGS, ids=ENCODING_IDS)
+@pytest.mark.parametrize("layout", [torch.sparse_coo, torch.sparse_csr], ids=["coo", "csr"])
+def test_sparse_tensor_round_trip(tmp_path, layout, encoding):
+    dense = torch.tensor(banded_values('f', 60 * 70, band=250), dtype=torch.float32).reshape(60, 70)
+    file_name = str(tmp_path / "sparse.bin")
+    source = dense.to_sparse() if layout == torch.sparse_coo else dense.to_sparse_csr()
+
+    TorchConverter.sparse_tensor_to_binary_file(source, file_name, encoding["mode"], encoding.get("codec", CODEC_NONE))
+    result = TorchConverter.binary_to_sparse_tensor(file_name, (60, 70), layout)
+
+    assert result.layout == layout
+    assert torch.equal(result.to_dense(), dense)
+    assert torch.equal(result.to_dense(), TorchConverter.binary_to_tensor(file_name).reshape(60, 70))
+
+
+def test_sparse_tensor_shape_mismatch(tmp_path):
+    file_name = str(tmp_path / "sparse.bin")
+    TorchConverter.sparse_tensor_to_binary_file(torch.zeros(12).to_sparse(), file_name)
+
+    with pytest.raises(Exception, match="does not match"):
+        TorchConverter.binary_to_sparse_tensor(file_name, (5, 3))
+    with pytest.raises(Exception, match="must be 2D"):
+        TorchConverter.binary_to_sparse_tensor(file_name, (2, 3, 2), torch.sparse_csr)
+
+
+@pytest.mark.parametrize("layout", [torch.sparse_coo, torch.sparse_csr], ids=["coo", "csr"])
+def test_sparse_tensor_all_zero(tmp_path, layout):
+    file_name = str(tmp_path / "sparse.bin")
+    TorchConverter.sparse_tensor_to_binary_file(torch.zeros(40, 30, dtype=torch.int16).to_sparse(), file_name)
+
+    result = TorchConverter.binary_to_sparse_tensor(file_name, (40, 30), layout)
+
+    assert result.dtype == torch.int16
+    assert torch.equal(result.to_dense(), torch.zeros(40, 30, dtype=torch.int16))
+
+
+def test_cached_tensor_is_a_copy(tmp_path):
+    tensor = torch.tensor(sample_values('i', 300), dtype=torch.int32)
+    file_name = TorchConverter.tensor_to_binary_file(tensor, str(tmp_path / "values"))
+    Encoder.encode_bin_file(file_name)
+    cache = DecodedCache()
+
+    first = TorchConverter.binary_to_tensor(file_name, cache=cache)
+    first += 1
+    second = TorchConverter.binary_to_tensor(file_name, cache=cache)
+
+    assert torch.equal(second, tensor)
+    assert cache.stats()["hits"] == 1
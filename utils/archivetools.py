@@ -0,0 +1,300 @@
+import contextlib
+import json
+import math
+import mmap
+import os
+import struct
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from utils.arraytools import ArrayTools, np
+from utils.chunktools import DEFAULT_ADAPTIVE_CHUNK_SIZE
+from utils.codectools import CODEC_NONE
+from utils.encoder import Encoder
+from utils.filetools import EXTENDED_HEADER_SIZE, MODE_BITMASK, FileReader, FileConstructor
+from utils.sparsetools import SparseTools
+from utils.typetools import DataHelper
+
+#archive layout (little-endian):
+#-preamble: magic, version, 3 padding bytes
+#-entries: one complete encoded binary file (extended header and payload) per tensor
+#-table of contents: JSON with the name, type letter, shape, offset and size of every entry
+#-footer: offset, length and CRC32 of the table of contents, magic
+_archive_magic = b'BMAR'
+_archive_version = 1
+_preamble = struct.Struct('<4sB3x')
+_footer = struct.Struct('<QQI4s')
+
+
+class ArchiveWriter:
+    """
+    Writes many named arrays (e.g. the tensors of a state dict) to one archive file. Every entry is
+    bit mask encoded and stored as a complete encoded binary file, and the table of contents at the
+    end of the archive records its name, type and shape, so entries can be read back one at a time.
+
+    Entries are encoded in a pool of threads (encoding is mostly NumPy and codec work, which does not
+    hold the GIL) and written in the order they were added.
+    """
+
+    def __init__(self, output, workers: int=None, mode: int=MODE_BITMASK, codec: int=CODEC_NONE, level: int=None,
+                 fsync: bool=False):
+        """
+        Parameters:
+        output (str or file): archive file name (written atomically) or writable binary file object
+        workers (int): number of encoding threads (defaults to number of CPUs, 1 encodes in the calling thread)
+        mode (int): encoding mode of the entries (MODE_BITMASK, MODE_ADAPTIVE or MODE_BITMASK64)
+        codec (int): secondary codec of the entries in bit mask mode
+        level (int): compression level of the codec
+        fsync (bool): flush an archive given by name to disk before it replaces any existing file
+        """
+        self.mode = mode
+        self.codec = codec
+        self.level = level
+        self.entries = []
+        self._names = set()
+        self._pending = []
+
+        if workers is None:
+            workers = os.cpu_count() or 1
+        self._executor = ThreadPoolExecutor(max_workers=workers) if workers > 1 else None
+
+        self._stack = contextlib.ExitStack()
+        self._output = self._stack.enter_context(FileConstructor.open_output(output, fsync))
+        self._position = _preamble.size
+        self._output.write(_preamble.pack(_archive_magic, _archive_version))
+
+    def add(self, name: str, values, chr_rep: str, shape: tuple=None):
+        """
+        Queues an array for encoding
+
+        Parameters:
+        name (str): unique name of the entry
+        values: NumPy array (any shape), array.array or list of values
+        chr_rep (str): struct module character representation of data type, or BFLOAT16 for 16-bit patterns
+        shape (tuple): shape of the values (defaults to the shape of a NumPy array, or a flat shape)
+        """
+        if name in self._names:
+            raise Exception(f"Archive already has an entry named {name!r}")
+        self._names.add(name)
+
+        if shape is None:
+            shape = getattr(values, "shape", (len(values),))
+        shape = tuple(int(dimension) for dimension in shape)
+
+        storage_letter = DataHelper.storage_letter(chr_rep)
+        values = ArrayTools.to_array(values, storage_letter)
+        if np is not None:
+            values = values.reshape(-1)
+        if len(values) != math.prod(shape):
+            raise Exception(f"Shape {shape} does not match the {len(values)} values of entry {name!r}")
+
+        task = (values, chr_rep, self.mode, self.codec, self.level)
+        if self._executor is None:
+            self._write_entry(name, chr_rep, shape, _encode_entry(*task))
+            return
+
+        self._pending.append((name, chr_rep, shape, self._executor.submit(_encode_entry, *task)))
+
+        #write finished entries so encoded bytes do not pile up
+        while self._pending and self._pending[0][3].done():
+            self._write_pending()
+
+    def _write_pending(self):
+        name, chr_rep, shape, future = self._pending.pop(0)
+        self._write_entry(name, chr_rep, shape, future.result())
+
+    def _write_entry(self, name: str, chr_rep: str, shape: tuple, entry: bytes):
+        self._output.write(entry)
+        self.entries.append({"name": name, "dtype": chr_rep, "shape": list(shape), "offset": self._position,
+                             "size": len(entry)})
+        self._position += len(entry)
+
+    def close(self):
+        """
+        Writes the remaining entries, the table of contents and the footer
+        """
+        try:
+            while self._pending:
+                self._write_pending()
+
+            toc = json.dumps({"entries": self.entries}, separators=(',', ':')).encode("utf-8")
+            self._output.write(toc)
+            self._output.write(_footer.pack(self._position, len(toc), zlib.crc32(toc), _archive_magic))
+        finally:
+            self._shutdown()
+
+        self._stack.close()
+
+    def _shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(cancel_futures=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+            return
+
+        #an archive given by name is discarded
+        self._shutdown()
+        self._stack.__exit__(exc_type, exc_value, traceback)
+
+
+class ArchiveReader:
+    """
+    Reads entries of an archive written by ArchiveWriter. Only the footer and the table of contents
+    are read when the archive is opened; the archive is memory mapped and loading an entry only
+    touches the pages holding that entry.
+    """
+
+    def __init__(self, file_name: str):
+        """
+        Parameters:
+        file_name (str): archive file
+        """
+        self.file_name = file_name
+        self._file = open(file_name, 'rb')
+
+        try:
+            file_size = os.path.getsize(file_name)
+            if file_size < _preamble.size + _footer.size:
+                raise Exception("File provided is not a tensor archive")
+
+            magic, version = _preamble.unpack(self._file.read(_preamble.size))
+            self._file.seek(file_size - _footer.size)
+            toc_offset, toc_size, toc_checksum, footer_magic = _footer.unpack(self._file.read(_footer.size))
+
+            if magic != _archive_magic or footer_magic != _archive_magic:
+                raise Exception("File provided is not a tensor archive")
+            if version > _archive_version:
+                raise Exception(f"Tensor archive version {version} is not supported")
+            if toc_offset + toc_size + _footer.size != file_size:
+                raise Exception("Tensor archive is truncated or corrupted")
+
+            self._file.seek(toc_offset)
+            toc = self._file.read(toc_size)
+            if zlib.crc32(toc) != toc_checksum:
+                raise Exception("Checksum mismatch: tensor archive table of contents is corrupted")
+
+            self.entries = {entry["name"]: entry for entry in json.loads(toc)["entries"]}
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except BaseException:
+            self._file.close()
+            raise
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __iter__(self):
+        return iter(self.entries)
+
+    def __contains__(self, name):
+        return name in self.entries
+
+    def names(self):
+        """
+        Returns:
+        list: names of the entries in the order they were written
+        """
+        return list(self.entries)
+
+    def shape(self, name: str):
+        """
+        Returns:
+        tuple: shape of an entry
+        """
+        return tuple(self.entries[name]["shape"])
+
+    def metadata(self, name: str):
+        """
+        Reads the header of an entry
+
+        Parameters:
+        name (str): name of the entry
+
+        Returns:
+        Metadata: metadata of the entry (header_size is relative to the start of the entry)
+        """
+        entry = self.entries[name]
+        header_end = entry["offset"] + min(entry["size"], EXTENDED_HEADER_SIZE)
+        return FileReader.metadata_from_bytes(self._mmap[entry["offset"]:header_end])
+
+    def load(self, name: str):
+        """
+        Decodes an entry
+
+        Parameters:
+        name (str): name of the entry
+
+        Returns:
+        numpy.ndarray: values of the entry in their shape, 16-bit patterns for bfloat16
+                       (flat array.array or list if NumPy is not installed)
+        """
+        entry = self.entries[name]
+        metadata = self.metadata(name)
+        if metadata.length != math.prod(entry["shape"]):
+            raise Exception(f"Tensor archive entry {name!r} is corrupted")
+
+        #decoding copies values out of the mapping, so the view can be released (letting the mapping close)
+        with memoryview(self._mmap)[entry["offset"] + metadata.header_size:entry["offset"] + entry["size"]] as payload:
+            FileReader.verify_payload(payload, metadata)
+            values = FileReader.to_native(FileReader.decode_payload(payload, metadata), metadata)
+
+        if np is not None:
+            return values.reshape(entry["shape"])
+
+        return values
+
+    def load_sparse(self, name: str):
+        """
+        Decodes the non-zero values of an entry, without creating its dense values
+
+        Parameters:
+        name (str): name of the entry
+
+        Returns:
+        numpy.ndarray: sorted int64 positions of the non-zero values in the flat entry (array.array of 'q' if NumPy is not installed)
+        numpy.ndarray: non-zero values, 16-bit patterns for bfloat16 (array.array or list if NumPy is not installed)
+        """
+        entry = self.entries[name]
+        metadata = self.metadata(name)
+        if metadata.length != math.prod(entry["shape"]):
+            raise Exception(f"Tensor archive entry {name!r} is corrupted")
+
+        with memoryview(self._mmap)[entry["offset"] + metadata.header_size:entry["offset"] + entry["size"]] as payload:
+            FileReader.verify_payload(payload, metadata)
+            indices, values = SparseTools.decode_payload(payload, metadata)
+
+        return indices, FileReader.to_native(values, metadata)
+
+    def load_all(self):
+        """
+        Decodes every entry
+
+        Returns:
+        dict: values of every entry by name
+        """
+        return {name: self.load(name) for name in self.entries}
+
+    def close(self):
+        self._mmap.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def _encode_entry(values, chr_rep: str, mode: int, codec: int, level: int):
+    """
+    Encoding task: returns an encoded binary file (header and payload) holding values
+    """
+    storage_letter = DataHelper.storage_letter(chr_rep)
+    payload = Encoder.encode_values(values, storage_letter, mode, DEFAULT_ADAPTIVE_CHUNK_SIZE, codec, level)
+    header = FileConstructor.create_header(True, chr_rep, len(values), payload, mode=mode,
+                                           chunk_size=Encoder.mode_chunk_size(mode, DEFAULT_ADAPTIVE_CHUNK_SIZE, codec),
+                                           codec=codec, level=level)
+    return header + payload
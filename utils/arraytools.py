@@ -0,0 +1,280 @@
+import array
+import struct
+import sys
+from utils.importtools import LazyModule
+
+#NumPy is imported on first use, None if it is not installed
+np = LazyModule.optional("numpy")
+
+
+class ArrayTools:
+    @staticmethod
+    def has_numpy():
+        """
+        Returns whether NumPy is available for the vectorized code paths
+
+        Returns:
+        bool: True if NumPy is installed (it is only imported when first used)
+        """
+        return np is not None
+
+    @staticmethod
+    def dtype_from_letter(chr_rep: str):
+        """
+        Translates a struct module character representation of data type to a NumPy dtype
+
+        Parameters:
+        chr_rep (str): struct module character representation of data type
+
+        Returns:
+        numpy.dtype: matching NumPy dtype (native byte order, same size as struct)
+        """
+        return np.dtype(chr_rep)
+
+    @staticmethod
+    def from_bytes(buffer, chr_rep: str):
+        """
+        Interprets a buffer of packed numbers as a typed array without unpacking values one by one
+
+        Parameters:
+        buffer (bytes-like): packed numerical values with no metadata
+        chr_rep (str): struct module character representation of data type
+
+        Returns:
+        numpy.ndarray: if NumPy is available (read-only view over buffer)
+        array.array: otherwise, if the array module supports the data type
+        list: otherwise (e.g. float16 without NumPy)
+        """
+        if np is not None:
+            return np.frombuffer(buffer, dtype=ArrayTools.dtype_from_letter(chr_rep))
+
+        if chr_rep in array.typecodes:
+            values = array.array(chr_rep)
+            values.frombytes(buffer)
+            return values
+
+        return [value[0] for value in struct.iter_unpack(chr_rep, buffer)]
+
+    @staticmethod
+    def from_file(f, chr_rep: str, count: int):
+        """
+        Reads packed numbers from the current position of an open binary file directly into a writable typed array
+
+        Parameters:
+        f (file): binary file object opened for reading
+        chr_rep (str): struct module character representation of data type
+        count (int): number of values to read
+
+        Returns:
+        numpy.ndarray: if NumPy is available, array.array or list otherwise
+        """
+        if np is not None:
+            values = np.empty(count, dtype=ArrayTools.dtype_from_letter(chr_rep))
+            f.readinto(memoryview(values).cast('B'))
+            return values
+
+        return ArrayTools.from_bytes(f.read(count * struct.calcsize(chr_rep)), chr_rep)
+
+    @staticmethod
+    def to_array(values, chr_rep: str):
+        """
+        Converts a list, array.array, NumPy array or buffer of values to a typed array of the given type
+
+        Parameters:
+        values: sequence of numerical values
+        chr_rep (str): struct module character representation of data type
+
+        Returns:
+        numpy.ndarray: if NumPy is available, otherwise the values unchanged (as a list if they are an array of another type)
+        """
+        if np is None:
+            if isinstance(values, array.array) and values.typecode != chr_rep:
+                return values.tolist()
+            return values
+
+        return np.asarray(values, dtype=ArrayTools.dtype_from_letter(chr_rep))
+
+    @staticmethod
+    def zeros(length: int, chr_rep: str):
+        """
+        Creates a zero filled typed array of the given length and type
+
+        Parameters:
+        length (int): number of elements
+        chr_rep (str): struct module character representation of data type
+
+        Returns:
+        numpy.ndarray: if NumPy is available, array.array or list otherwise
+        """
+        if np is not None:
+            return np.zeros(length, dtype=ArrayTools.dtype_from_letter(chr_rep))
+
+        if chr_rep in array.typecodes:
+            return array.array(chr_rep, bytes(length * struct.calcsize(chr_rep)))
+
+        #types without an array module type (e.g. float16 or bool)
+        return [struct.unpack(chr_rep, bytes(struct.calcsize(chr_rep)))[0]] * length
+
+    @staticmethod
+    def to_bytes(values, chr_rep: str):
+        """
+        Packs a typed array or list of values into bytes in a single call
+
+        Parameters:
+        values: numpy.ndarray, array.array, list or other sequence of values
+        chr_rep (str): struct module character representation of data type
+
+        Returns:
+        bytes: packed values
+        """
+        if not hasattr(values, "tobytes"):
+            return struct.pack(f"{len(values)}{chr_rep}", *values)
+
+        return values.tobytes()
+
+    @staticmethod
+    def swap_byte_order(values, chr_rep: str):
+        """
+        Reverses the bytes of every value, converting between little-endian and big-endian
+
+        Parameters:
+        values: numpy.ndarray, array.array or list of values
+        chr_rep (str): struct module character representation of data type
+
+        Returns:
+        numpy.ndarray: values with swapped bytes (array.array or list if NumPy is not installed)
+        """
+        if np is not None:
+            return np.asarray(values).byteswap()
+
+        if isinstance(values, array.array):
+            values = array.array(values.typecode, values)
+            values.byteswap()
+            return values
+
+        #list of values without an array module type (e.g. float16)
+        order = '>' if sys.byteorder == "little" else '<'
+        packed = struct.pack(f"{order}{len(values)}{chr_rep}", *values)
+        return list(struct.unpack(f"{len(values)}{chr_rep}", packed))
+
+    @staticmethod
+    def concatenate(first, second):
+        """
+        Joins two typed arrays (or lists) of the same type
+
+        Parameters:
+        first: numpy.ndarray, array.array or list
+        second: numpy.ndarray, array.array or list
+
+        Returns:
+        numpy.ndarray: joined values, array.array or list if NumPy is not installed
+        """
+        if np is not None:
+            return np.concatenate((first, second))
+
+        return first + second
+
+    @staticmethod
+    def split(values, max_values: int=None):
+        """
+        Yields consecutive pieces of values holding at most max_values values each
+
+        Parameters:
+        values: numpy.ndarray, array.array or list
+        max_values (int): maximum number of values per piece (None yields values whole)
+
+        Yields:
+        numpy.ndarray: piece of values (a view for NumPy arrays), array.array or list if NumPy is not installed
+        """
+        if max_values is None or len(values) <= max_values:
+            yield values
+            return
+
+        for start in range(0, len(values), max_values):
+            yield values[start:start + max_values]
+
+    @staticmethod
+    def iter_zeros(length: int, chr_rep: str, max_values: int=None):
+        """
+        Yields zero filled typed arrays adding up to length values, so long runs of zeros are never
+        created as one array
+
+        Parameters:
+        length (int): total number of zeros
+        chr_rep (str): struct module character representation of data type
+        max_values (int): maximum number of values per array (None yields one array)
+
+        Yields:
+        numpy.ndarray: zero filled array, array.array or list if NumPy is not installed
+        """
+        piece_size = length if max_values is None else max_values
+        for start in range(0, length, max(piece_size, 1)):
+            yield ArrayTools.zeros(min(piece_size, length - start), chr_rep)
+
+    @staticmethod
+    def nonzero(values, chr_rep: str):
+        """
+        Splits values into the positions and values of their non-zero elements
+
+        Parameters:
+        values: numpy.ndarray, array.array or list of values
+        chr_rep (str): struct module character representation of data type
+
+        Returns:
+        numpy.ndarray: int64 positions of non-zero values (array.array of 'q' if NumPy is not installed)
+        numpy.ndarray: non-zero values (array.array or list if NumPy is not installed)
+        """
+        if np is not None:
+            values = ArrayTools.to_array(values, chr_rep)
+            indices = np.flatnonzero(values)
+            return indices, values[indices]
+
+        indices = array.array('q', (index for index, value in enumerate(values) if value != 0))
+        non_zero_values = [values[index] for index in indices]
+        if chr_rep in array.typecodes:
+            non_zero_values = array.array(chr_rep, non_zero_values)
+
+        return indices, non_zero_values
+
+    @staticmethod
+    def join_sparse(parts: list, chr_rep: str):
+        """
+        Joins the positions and values of the non-zero values of consecutive pieces of values
+
+        Parameters:
+        parts (list): (position of the first value of the piece, positions in the piece, values) of every piece
+        chr_rep (str): struct module character representation of data type
+
+        Returns:
+        numpy.ndarray: int64 positions of non-zero values (array.array of 'q' if NumPy is not installed)
+        numpy.ndarray: non-zero values (array.array or list if NumPy is not installed)
+        """
+        if np is not None:
+            if not parts:
+                return np.zeros(0, dtype=np.int64), ArrayTools.zeros(0, chr_rep)
+            return (np.concatenate([indices + start for start, indices, _ in parts]),
+                    np.concatenate([values for _, _, values in parts]))
+
+        indices = array.array('q')
+        values = ArrayTools.zeros(0, chr_rep)
+        for start, piece_indices, piece_values in parts:
+            indices.extend(index + start for index in piece_indices)
+            values.extend(piece_values)
+
+        return indices, values
+
+    @staticmethod
+    def to_list(values):
+        """
+        Converts a typed array returned by the vectorized code paths to a list of Python numbers
+
+        Parameters:
+        values: numpy.ndarray, array.array or list
+
+        Returns:
+        list: list of Python ints or floats
+        """
+        if isinstance(values, list):
+            return values
+
+        return values.tolist()
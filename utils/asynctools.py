@@ -0,0 +1,299 @@
+import asyncio
+import contextlib
+import sys
+import zlib
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from utils.arraytools import ArrayTools
+from utils.chunktools import DEFAULT_ADAPTIVE_CHUNK_SIZE
+from utils.codectools import CODEC_NONE
+from utils.decoder import Decoder
+from utils.encoder import Encoder
+from utils.filetools import (DEFAULT_CHUNK_SIZE, MODE_BITMASK, MODE_BITMASK64, FileConstructor, FileReader, Metadata,
+                             PayloadWriter)
+from utils.widemasktools import WideMaskTools, WideRunJoiner
+
+#default number of files encoded or decoded at the same time
+DEFAULT_MAX_CONCURRENT = 4
+
+
+class AsyncCoder:
+    """
+    Encodes and decodes files from asyncio code without blocking the event loop. Files are processed a
+    chunk at a time: while one chunk is encoded (or decoded) on the CPU executor, the next chunk is read
+    and the previous one written on a pool of I/O threads. The output is byte-identical to
+    Encoder.encode_bin_file and Decoder.decode_bin_file.
+
+    A semaphore bounds the number of files in flight, so memory use stays around
+    max_concurrent * chunk_size values however many requests are waiting.
+    """
+
+    def __init__(self, max_concurrent: int=DEFAULT_MAX_CONCURRENT, executor=None, io_workers: int=None,
+                 chunk_size: int=DEFAULT_CHUNK_SIZE):
+        """
+        Parameters:
+        max_concurrent (int): maximum number of files encoded or decoded at the same time
+        executor (Executor): executor running encoding and decoding (defaults to the event loop's default
+                             thread pool). A ProcessPoolExecutor decodes whole payloads, since stream
+                             decoders keep state between chunks.
+        io_workers (int): number of threads reading and writing files (defaults to 2 per concurrent file)
+        chunk_size (int): number of values read, encoded and written at a time, a multiple of 8
+        """
+        if chunk_size <= 0 or chunk_size % 8:
+            raise Exception("Chunk size must be a positive multiple of 8")
+
+        self.executor = executor
+        self.chunk_size = chunk_size
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+        self._io_executor = ThreadPoolExecutor(max_workers=io_workers or 2 * max_concurrent)
+
+    def _io(self, function, *args):
+        return asyncio.get_running_loop().run_in_executor(self._io_executor, function, *args)
+
+    def _cpu(self, function, *args):
+        return asyncio.get_running_loop().run_in_executor(self.executor, function, *args)
+
+    async def encode_bin_file(self, file_name: str, output=None, fsync: bool=False, mode: int=MODE_BITMASK,
+                              adaptive_chunk_size: int=DEFAULT_ADAPTIVE_CHUNK_SIZE, codec: int=CODEC_NONE, level: int=None):
+        """
+        Bit mask encodes a decoded binary file (see Encoder.encode_bin_file)
+
+        Parameters:
+        file_name (str): decoded binary file
+        output (str or file): encoded file name (written atomically) or writable, seekable binary file object,
+                              file_name is replaced if not provided
+        fsync (bool): flush an encoded file given by name to disk before it replaces any existing file
+        mode (int): MODE_BITMASK, MODE_ADAPTIVE or MODE_BITMASK64
+        adaptive_chunk_size (int): number of values per chunk for MODE_ADAPTIVE
+        codec (int): secondary codec for bit mask mode
+        level (int): compression level of the codec
+
+        Returns:
+        int: number of values encoded
+        """
+        #pieces are encoded independently, so they must hold whole masks (or chunks or frames)
+        block_size = Encoder.block_size(mode, adaptive_chunk_size, codec)
+        chunk_size = -(-self.chunk_size // block_size) * block_size
+
+        async with self._semaphore, _Pipeline(self) as pipeline:
+            #output is opened first so the source is closed before the output replaces it
+            f = await pipeline.enter(FileConstructor.open_output, file_name if output is None else output, fsync)
+            source = await pipeline.enter(open, file_name, 'rb')
+            metadata = await pipeline.io(FileReader.read_metadata, source)
+            if metadata.is_encoded:
+                raise Exception("File provided is not a bit mask decoded binary file")
+
+            chunks = FileReader.iter_decoded_chunks(source, metadata, chunk_size)
+            writer = await pipeline.io(PayloadWriter, f, True, metadata.type_letter, metadata.length, sys.byteorder, mode,
+                                       Encoder.mode_chunk_size(mode, adaptive_chunk_size, codec), codec, level)
+
+            #runs of empty 64-bit masks can span chunks, they are merged so the output matches Encoder.encode_bin_file
+            joiner = WideRunJoiner() if mode == MODE_BITMASK64 else None
+
+            #read the next chunk and write the previous one while a chunk is encoded
+            values = await pipeline.io(next, chunks, None)
+            while values is not None:
+                encoded = pipeline.cpu(_encode_chunk, values, metadata.chr_rep, mode, adaptive_chunk_size, codec, level)
+                next_values = pipeline.io(next, chunks, None)
+                encoded_bytes, trailing = await encoded
+                if joiner is not None:
+                    #chunks are joined here in order, whichever executor encoded them
+                    encoded_bytes = joiner.join(encoded_bytes, trailing)
+                await pipeline.write(writer.write, encoded_bytes, len(values))
+                values = await next_values
+
+            if joiner is not None:
+                await pipeline.write(writer.write, joiner.finish(), 0)
+
+            await pipeline.drain()
+            await pipeline.io(writer.close)
+            return writer.length
+
+    async def decode_bin_file(self, file_name: str, output=None, fsync: bool=False):
+        """
+        Decodes a bit mask encoded binary file (see Decoder.decode_bin_file)
+
+        Parameters:
+        file_name (str): bit mask encoded binary file
+        output (str or file): decoded file name (written atomically) or writable, seekable binary file object,
+                              file_name is replaced if not provided
+        fsync (bool): flush a decoded file given by name to disk before it replaces any existing file
+
+        Returns:
+        int: number of values decoded
+        """
+        async with self._semaphore, _Pipeline(self) as pipeline:
+            f = await pipeline.enter(FileConstructor.open_output, file_name if output is None else output, fsync)
+            source = await pipeline.enter(open, file_name, 'rb')
+            metadata = await pipeline.io(FileReader.read_metadata, source)
+            if not metadata.is_encoded:
+                raise Exception("File provided is not a bit mask encoded binary file")
+
+            writer = await pipeline.io(PayloadWriter, f, False, metadata.type_letter, metadata.length)
+
+            if isinstance(self.executor, ProcessPoolExecutor):
+                #worker processes cannot keep the state of a stream decoder between chunks
+                payload = await pipeline.io(source.read)
+                values = await pipeline.cpu(_decode_payload, payload, metadata)
+                await pipeline.write(_write_values, writer, values, metadata.chr_rep)
+            else:
+                await self._decode_chunks(pipeline, source, metadata, writer)
+
+            await pipeline.drain()
+            await pipeline.io(writer.close)
+            return writer.length
+
+    async def _decode_chunks(self, pipeline, source, metadata: Metadata, writer: PayloadWriter):
+        """
+        Decodes the payload of an open encoded file with a stream decoder, reading the next piece and
+        writing the previous values while a piece is decoded. Pieces are decoded at most chunk_size values
+        at a time, since a small piece can stand for many values.
+        """
+        stream = Decoder.stream_decoder(metadata)
+        read_size = self.chunk_size * metadata.num_size
+        checksum = 0
+        length = 0
+
+        piece = await pipeline.io(source.read, read_size)
+        while piece:
+            checksummed = pipeline.cpu(zlib.crc32, piece, checksum)
+            next_piece = pipeline.io(source.read, read_size)
+
+            #the next values are decoded while the previous ones are written
+            pieces = stream.iter_feed(piece, self.chunk_size)
+            values = await pipeline.cpu(_decode_next, pieces, metadata)
+            while values is not None:
+                decoded = pipeline.cpu(_decode_next, pieces, metadata)
+                length += len(values)
+                await pipeline.write(_write_values, writer, values, metadata.chr_rep)
+                values = await decoded
+
+            checksum = await checksummed
+            piece = await next_piece
+
+        values = FileReader.to_native(await pipeline.cpu(stream.finish), metadata)
+        length += len(values)
+        await pipeline.write(_write_values, writer, values, metadata.chr_rep)
+
+        if metadata.length is not None and length != metadata.length:
+            raise Exception("Bit mask encoded data is truncated or corrupted")
+        FileReader.verify_payload(None, metadata, checksum)
+
+    async def array_from_encoded(self, file_name: str):
+        """
+        Reads and decodes a bit mask encoded binary file (see FileReader.array_from_encoded)
+
+        Parameters:
+        file_name (str): bit mask encoded binary file
+
+        Returns:
+        numpy.ndarray: decoded values (array.array or list if NumPy is not installed)
+        """
+        async with self._semaphore, _Pipeline(self) as pipeline:
+            source = await pipeline.enter(open, file_name, 'rb')
+            metadata = await pipeline.io(FileReader.read_metadata, source)
+            if not metadata.is_encoded:
+                raise Exception("File provided is not a bit mask encoded binary file")
+
+            payload = await pipeline.io(source.read)
+            return await pipeline.cpu(_decode_payload, payload, metadata)
+
+    def close(self):
+        """
+        Shuts down the I/O threads (the CPU executor belongs to the caller)
+        """
+        self._io_executor.shutdown()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class _Pipeline:
+    """
+    Tracks the files and in-flight I/O and CPU tasks of one file. Files are opened and closed on I/O threads,
+    and on failure every task still running is awaited before the files are closed (or discarded).
+    """
+
+    def __init__(self, coder: AsyncCoder):
+        self._coder = coder
+        self._stack = contextlib.ExitStack()
+        self._tasks = []
+        self._write = None
+
+    def io(self, function, *args):
+        return self._track(self._coder._io(function, *args))
+
+    def cpu(self, function, *args):
+        return self._track(self._coder._cpu(function, *args))
+
+    def _track(self, future):
+        self._tasks = [task for task in self._tasks if not task.done()]
+        self._tasks.append(future)
+        return future
+
+    async def enter(self, function, *args):
+        """
+        Opens a context manager (e.g. a file) on an I/O thread, to be closed when the pipeline ends
+        """
+        return self._stack.enter_context(await self.io(function, *args))
+
+    async def write(self, function, *args):
+        """
+        Starts a write once the previous write has finished, so writes stay in order without waiting for each other
+        """
+        await self.drain()
+        self._write = self.io(function, *args)
+
+    async def drain(self):
+        """
+        Waits for the last write
+        """
+        if self._write is not None:
+            await self._write
+            self._write = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+        #closing renames (and possibly flushes) output files, which blocks
+        await self._coder._io(self._stack.__exit__, exc_type, exc_value, traceback)
+
+
+def _encode_chunk(values, chr_rep: str, mode: int, adaptive_chunk_size: int, codec: int, level: int):
+    """
+    Encoding task: encodes a chunk of values, returning the encoded bytes with the number of empty
+    64-bit mask groups they end with in MODE_BITMASK64 (0 otherwise)
+    """
+    encoded_bytes = Encoder.encode_values(values, chr_rep, mode, adaptive_chunk_size, codec, level)
+    trailing = WideMaskTools.trailing_empty_groups(values) if mode == MODE_BITMASK64 else 0
+    return encoded_bytes, trailing
+
+
+def _decode_payload(payload, metadata: Metadata):
+    """
+    Decoding task: verifies and decodes a whole payload
+    """
+    FileReader.verify_payload(payload, metadata)
+    return FileReader.to_native(FileReader.decode_payload(payload, metadata), metadata)
+
+
+def _decode_next(pieces, metadata: Metadata):
+    """
+    Decoding task: decodes the next values of a piece fed to a stream decoder (None once the piece is decoded)
+    """
+    values = next(pieces, None)
+    return None if values is None else FileReader.to_native(values, metadata)
+
+
+def _write_values(writer: PayloadWriter, values, chr_rep: str):
+    """
+    Writing task: packs decoded values and writes them
+    """
+    if len(values):
+        writer.write(ArrayTools.to_bytes(values, chr_rep), len(values))
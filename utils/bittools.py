@@ -20,4 +20,20 @@ class BitTools:
         if byte_length % 8 == 0:
             return int(byte_length)
         else:
-            return int(byte_length) + 1
\ No newline at end of file
+            return int(byte_length) + 1
+
+    #number of set bits for every possible byte value
+    _popcount_table = [bin(byte).count("1") for byte in range(256)]
+
+    @staticmethod
+    def popcount(byte_chunk):
+        """
+        Returns the number of set bits in a single byte
+
+        Parameters:
+        byte_chunk (int): byte value between 0 and 255
+
+        Returns:
+        int: number of bits set to 1
+        """
+        return BitTools._popcount_table[byte_chunk]
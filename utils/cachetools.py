@@ -0,0 +1,202 @@
+import collections
+import contextlib
+import glob
+import hashlib
+import os
+import threading
+from utils.arraytools import ArrayTools, np
+from utils.filetools import FileConstructor, FileReader, Metadata
+from utils.maptools import MappedReader
+
+#default bytes of decoded values kept in memory by a DecodedCache
+DEFAULT_MEMORY_BUDGET = 1 << 30
+
+
+class DecodedCache:
+    """
+    Opt-in cache of decoded arrays for files that are read over and over (e.g. a checkpoint loaded in
+    every evaluation loop). Entries are keyed by the identity of the file: its path, size, modification
+    time and inode, so a rewritten file is never served from the cache.
+
+    Arrays are kept in memory up to a budget of bytes, evicting the least recently used ones first.
+    With a cache directory, decoded forms of encoded files are also written there as decoded binary
+    files, which other processes map instead of decoding the file again.
+
+    Cached NumPy arrays are shared and read-only; copy them before modifying values.
+    """
+
+    def __init__(self, memory_budget: int=DEFAULT_MEMORY_BUDGET, cache_dir: str=None):
+        """
+        Parameters:
+        memory_budget (int): bytes of decoded values kept in memory (0 keeps nothing in memory)
+        cache_dir (str): directory for decoded files shared between processes (None disables the disk cache)
+        """
+        self.memory_budget = memory_budget
+        self.cache_dir = cache_dir
+        self.size = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+        if cache_dir is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def file_key(file_name: str):
+        """
+        Returns the identity of a file
+
+        Parameters:
+        file_name (str): file path
+
+        Returns:
+        tuple: (absolute path, size, modification time in nanoseconds, inode)
+        """
+        info = os.stat(file_name)
+        return os.path.realpath(file_name), info.st_size, info.st_mtime_ns, info.st_ino
+
+    def get_array(self, file_name: str, metadata: Metadata=None):
+        """
+        Returns the values of an encoded or decoded binary file, decoding it only if no cached copy exists
+
+        Parameters:
+        file_name (str): encoded or decoded binary file
+        metadata (Metadata): metadata already read from file, read from the file header if not provided
+
+        Returns:
+        numpy.ndarray: read-only array of stored values (a copy as array.array or list if NumPy is not installed)
+        """
+        key = DecodedCache.file_key(file_name)
+
+        with self._lock:
+            values = self._entries.get(key)
+            if values is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return DecodedCache._shared(values)
+
+        values = self._load_from_disk(key)
+        with self._lock:
+            if values is not None:
+                self.disk_hits += 1
+            else:
+                self.misses += 1
+
+        if values is None:
+            if metadata is None:
+                metadata = FileReader.metadata_from_binary(file_name)
+            values = FileReader.get_array(file_name, metadata)
+            if metadata.is_encoded:
+                self._save_to_disk(key, values, metadata)
+
+        if np is not None:
+            values.setflags(write=False)
+
+        self._store(key, values)
+        return DecodedCache._shared(values)
+
+    @staticmethod
+    def _shared(values):
+        #arrays of the array module cannot be made read-only, so they are copied
+        if np is None:
+            return values[:]
+
+        return values
+
+    def _store(self, key: tuple, values):
+        """
+        Adds values to the in-memory cache, evicting least recently used entries beyond the budget
+        """
+        size = DecodedCache._nbytes(values)
+        if size > self.memory_budget:
+            return
+
+        with self._lock:
+            if key in self._entries:
+                return
+
+            self._entries[key] = values
+            self.size += size
+            while self.size > self.memory_budget:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= DecodedCache._nbytes(evicted)
+                self.evictions += 1
+
+    @staticmethod
+    def _nbytes(values):
+        """
+        Returns the bytes held by an array (lists are counted as 8 bytes per value)
+        """
+        if hasattr(values, "nbytes"):
+            return values.nbytes
+        if hasattr(values, "itemsize"):
+            return len(values) * values.itemsize
+
+        return len(values) * 8
+
+    def _disk_name(self, key: tuple):
+        """
+        Returns the cache file of a file identity and the pattern matching every cached version of the same path
+        """
+        path_hash = hashlib.sha1(key[0].encode("utf-8")).hexdigest()[:16]
+        identity_hash = hashlib.sha1(repr(key[1:]).encode("utf-8")).hexdigest()[:16]
+        return (os.path.join(self.cache_dir, f"{path_hash}-{identity_hash}.bin"),
+                os.path.join(self.cache_dir, f"{path_hash}-*.bin"))
+
+    def _load_from_disk(self, key: tuple):
+        if self.cache_dir is None:
+            return None
+
+        cache_name = self._disk_name(key)[0]
+        if not os.path.exists(cache_name):
+            return None
+
+        try:
+            if np is None:
+                return FileReader.array_from_decoded(cache_name)
+
+            #cache files are written in native byte order, the array view keeps the mapping alive after the reader is closed
+            with MappedReader(cache_name) as reader:
+                return reader.array
+        except Exception:
+            #unreadable cache files (e.g. removed meanwhile) are decoded again and replaced
+            return None
+
+    def _save_to_disk(self, key: tuple, values, metadata: Metadata):
+        """
+        Writes decoded values to the cache directory, replacing cached versions of older contents of the same path
+        """
+        if self.cache_dir is None:
+            return
+
+        cache_name, pattern = self._disk_name(key)
+        payload = ArrayTools.to_bytes(values, metadata.chr_rep)
+        with FileConstructor.atomic_output(cache_name) as f:
+            f.write(FileConstructor.create_header(False, metadata.type_letter, len(values), payload))
+            f.write(payload)
+
+        for stale_name in glob.glob(pattern):
+            if stale_name != cache_name:
+                with contextlib.suppress(OSError):
+                    os.remove(stale_name)
+
+    def stats(self):
+        """
+        Returns:
+        dict: hits (in memory), disk hits, misses, evictions, number of entries and bytes held in memory
+        """
+        with self._lock:
+            return {"hits": self.hits, "disk_hits": self.disk_hits, "misses": self.misses, "evictions": self.evictions,
+                    "entries": len(self._entries), "bytes": self.size}
+
+    def clear(self):
+        """
+        Drops every in-memory entry (the disk cache is left in place) and resets the counters
+        """
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+            self.hits = self.disk_hits = self.misses = self.evictions = 0
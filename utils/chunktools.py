@@ -0,0 +1,306 @@
+import struct
+from utils.arraytools import ArrayTools, np
+from utils.masktools import MaskTools
+
+#default number of values per chunk of an adaptive encoded file
+DEFAULT_ADAPTIVE_CHUNK_SIZE = 1 << 16
+
+#chunk tags: how the values of a chunk are stored
+ZERO_CHUNK = 0
+RAW_CHUNK = 1
+BITMASK_CHUNK = 2
+
+#every chunk starts with its tag and the length of its data (little-endian)
+_chunk_header = struct.Struct('<BI')
+
+
+class ChunkTools:
+    """
+    Adaptive encoding: values are split into fixed size chunks and every chunk picks the smallest of
+    three encodings based on how many of its values are non-zero:
+    -ZERO_CHUNK: all values are zero, nothing is stored
+    -RAW_CHUNK: values are stored packed, as in a decoded file
+    -BITMASK_CHUNK: values are bit mask encoded (see MaskTools)
+
+    Each chunk is a tag byte and a u32 data length followed by the data, so chunks can be skipped
+    without being decoded. Only the last chunk can hold fewer values than the chunk size.
+    """
+
+    @staticmethod
+    def encode(values, chr_rep: str, chunk_size: int=DEFAULT_ADAPTIVE_CHUNK_SIZE):
+        """
+        Adaptively encodes values chunk by chunk
+
+        Parameters:
+        values: list, array.array, NumPy array or other sequence of numerical values
+        chr_rep (str): struct module character representation of data type
+        chunk_size (int): number of values per chunk
+
+        Returns:
+        bytes: tagged chunks (without the file header)
+        """
+        values = ArrayTools.to_array(values, chr_rep)
+        return b''.join(ChunkTools.encode_chunk(values[start:start + chunk_size], chr_rep)
+                        for start in range(0, len(values), chunk_size))
+
+    @staticmethod
+    def encode_chunk(values, chr_rep: str):
+        """
+        Encodes one chunk with the encoding that stores it in the fewest bytes
+
+        Parameters:
+        values: values of the chunk
+        chr_rep (str): struct module character representation of data type
+
+        Returns:
+        bytes: tag, data length and data of the chunk
+        """
+        tag = ChunkTools.choose_tag(values, struct.calcsize(chr_rep))
+
+        if tag == ZERO_CHUNK:
+            data = b''
+        elif tag == RAW_CHUNK:
+            data = ArrayTools.to_bytes(values, chr_rep)
+        else:
+            data = MaskTools.encode(values, chr_rep)
+
+        return _chunk_header.pack(tag, len(data)) + data
+
+    @staticmethod
+    def choose_tag(values, num_size: int):
+        """
+        Picks the encoding of a chunk from its number of non-zero values
+
+        Parameters:
+        values: values of the chunk
+        num_size (int): size of each value in bytes
+
+        Returns:
+        int: ZERO_CHUNK, RAW_CHUNK or BITMASK_CHUNK
+        """
+        if np is not None:
+            non_zero = int(np.count_nonzero(values))
+        else:
+            non_zero = sum(1 for value in values if value != 0)
+
+        if non_zero == 0:
+            return ZERO_CHUNK
+
+        #one mask byte per 8 values plus the non-zero values, against every value packed
+        bitmask_size = (len(values) + 7) // 8 + non_zero * num_size
+        return BITMASK_CHUNK if bitmask_size < len(values) * num_size else RAW_CHUNK
+
+    @staticmethod
+    def iter_chunks(buffer, start: int=0, end: int=None):
+        """
+        Finds the complete chunks in a buffer
+
+        Parameters:
+        buffer (bytes-like): tagged chunks
+        start (int): position of the first chunk
+        end (int): position where the chunks end (defaults to end of buffer)
+
+        Yields:
+        tuple: (tag, start of data, end of data) of every complete chunk
+        """
+        if end is None:
+            end = len(buffer)
+
+        position = start
+        while position + _chunk_header.size <= end:
+            tag, size = _chunk_header.unpack_from(buffer, position)
+            data_start = position + _chunk_header.size
+            if data_start + size > end:
+                return
+
+            yield tag, data_start, data_start + size
+            position = data_start + size
+
+    @staticmethod
+    def decode(buffer, chr_rep: str, length: int, chunk_size: int=DEFAULT_ADAPTIVE_CHUNK_SIZE):
+        """
+        Decodes adaptively encoded chunks into a preallocated zero filled array
+
+        Parameters:
+        buffer (bytes-like): tagged chunks (without the file header)
+        chr_rep (str): struct module character representation of data type
+        length (int): number of values stored
+        chunk_size (int): number of values per chunk
+
+        Returns:
+        numpy.ndarray: decoded values (array.array or list if NumPy is not installed)
+        """
+        values = ArrayTools.zeros(length, chr_rep)
+        view = memoryview(buffer)
+        position = 0
+        end = 0
+
+        for tag, data_start, data_end in ChunkTools.iter_chunks(view):
+            count = min(chunk_size, length - position)
+            if count <= 0:
+                raise Exception("Adaptive encoded data is corrupted")
+
+            #zero chunks are already in place
+            if tag != ZERO_CHUNK:
+                values[position:position + count] = ChunkTools.decode_chunk(tag, view[data_start:data_end], chr_rep, count)
+
+            position += count
+            end = data_end
+
+        if position != length or end != len(buffer):
+            raise Exception("Adaptive encoded data is truncated or corrupted")
+
+        return values
+
+    @staticmethod
+    def decode_chunk(tag: int, data, chr_rep: str, count: int):
+        """
+        Decodes the data of one chunk
+
+        Parameters:
+        tag (int): ZERO_CHUNK, RAW_CHUNK or BITMASK_CHUNK
+        data (bytes-like): data of the chunk
+        chr_rep (str): struct module character representation of data type
+        count (int): number of values in the chunk
+
+        Returns:
+        numpy.ndarray: values of the chunk (array.array or list if NumPy is not installed)
+        """
+        if tag == ZERO_CHUNK:
+            return ArrayTools.zeros(count, chr_rep)
+        if tag == RAW_CHUNK:
+            if len(data) != count * struct.calcsize(chr_rep):
+                raise Exception("Adaptive encoded data is corrupted")
+            return ArrayTools.from_bytes(data, chr_rep)
+        if tag == BITMASK_CHUNK:
+            return MaskTools.decode(data, chr_rep, count % 8, count)
+
+        raise Exception(f"Unknown chunk tag {tag}")
+
+
+    @staticmethod
+    def decode_sparse(buffer, chr_rep: str, length: int, chunk_size: int=DEFAULT_ADAPTIVE_CHUNK_SIZE):
+        """
+        Decodes adaptively encoded chunks into the positions and values of the non-zero values, without
+        creating the decoded array. Zero chunks are skipped without being looked at.
+
+        Parameters:
+        buffer (bytes-like): tagged chunks (without the file header)
+        chr_rep (str): struct module character representation of data type
+        length (int): number of values stored
+        chunk_size (int): number of values per chunk
+
+        Returns:
+        numpy.ndarray: int64 positions of the non-zero values (array.array of 'q' if NumPy is not installed)
+        numpy.ndarray: non-zero values (array.array or list if NumPy is not installed)
+        """
+        view = memoryview(buffer)
+        parts = []
+        position = 0
+        end = 0
+
+        for tag, data_start, data_end in ChunkTools.iter_chunks(view):
+            count = min(chunk_size, length - position)
+            if count <= 0:
+                raise Exception("Adaptive encoded data is corrupted")
+
+            if tag == RAW_CHUNK:
+                parts.append((position, *ArrayTools.nonzero(ChunkTools.decode_chunk(tag, view[data_start:data_end], chr_rep,
+                                                                                    count), chr_rep)))
+            elif tag == BITMASK_CHUNK:
+                parts.append((position, *MaskTools.decode_sparse(view[data_start:data_end], chr_rep, count % 8, count)))
+            elif tag != ZERO_CHUNK:
+                raise Exception(f"Unknown chunk tag {tag}")
+
+            position += count
+            end = data_end
+
+        if position != length or end != len(buffer):
+            raise Exception("Adaptive encoded data is truncated or corrupted")
+
+        return ArrayTools.join_sparse(parts, chr_rep)
+
+
+class ChunkStreamDecoder:
+    """
+    Decodes adaptively encoded data that arrives in pieces, with the same interface as StreamDecoder.
+    Bytes of a chunk cut off at the end of a piece are kept until the next piece arrives.
+    """
+
+    def __init__(self, chr_rep: str, length: int, chunk_size: int=DEFAULT_ADAPTIVE_CHUNK_SIZE):
+        """
+        Parameters:
+        chr_rep (str): struct module character representation of data type
+        length (int): number of values stored
+        chunk_size (int): number of values per chunk
+        """
+        self.chr_rep = chr_rep
+        self.length = length
+        self.chunk_size = chunk_size
+        self._position = 0
+        self._leftover = b''
+
+    def feed(self, data):
+        """
+        Decodes every chunk completed by data
+
+        Parameters:
+        data (bytes-like): next piece of tagged chunks
+
+        Returns:
+        numpy.ndarray: decoded values (array.array or list if NumPy is not installed)
+        """
+        decoded = list(self.iter_feed(data))
+
+        if not decoded:
+            return ArrayTools.zeros(0, self.chr_rep)
+        if np is not None:
+            return np.concatenate(decoded)
+
+        values = decoded[0]
+        for chunk_values in decoded[1:]:
+            values = ArrayTools.concatenate(values, chunk_values)
+
+        return values
+
+    def iter_feed(self, data, max_values: int=None):
+        """
+        Decodes every chunk completed by data, one chunk (split into pieces of at most max_values values)
+        at a time. A zero chunk takes 5 bytes whatever its size, so decoding all chunks of a piece at once
+        could create arrays far larger than the piece. The generator must be exhausted before more data is fed.
+
+        Parameters:
+        data (bytes-like): next piece of tagged chunks
+        max_values (int): maximum number of values per yielded array (None yields one array per chunk)
+
+        Yields:
+        numpy.ndarray: decoded values (array.array or list if NumPy is not installed)
+        """
+        buffer = self._leftover + bytes(data)
+        chunks = list(ChunkTools.iter_chunks(buffer))
+        self._leftover = buffer[chunks[-1][2]:] if chunks else buffer
+
+        for tag, data_start, data_end in chunks:
+            count = min(self.chunk_size, self.length - self._position)
+            if count <= 0:
+                raise Exception("Adaptive encoded data is corrupted")
+            self._position += count
+
+            #zero chunks are created a piece at a time, other chunks hold their values in the encoded data
+            if tag == ZERO_CHUNK:
+                yield from ArrayTools.iter_zeros(count, self.chr_rep, max_values)
+            else:
+                yield from ArrayTools.split(ChunkTools.decode_chunk(tag, buffer[data_start:data_end], self.chr_rep, count),
+                                            max_values)
+
+    def finish(self):
+        """
+        Checks that all data has been fed
+
+        Returns:
+        numpy.ndarray: empty array, all values are returned by feed
+        """
+        if self._leftover or self._position != self.length:
+            raise Exception("Adaptive encoded data is truncated or corrupted")
+
+        return ArrayTools.zeros(0, self.chr_rep)
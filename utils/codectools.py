@@ -0,0 +1,423 @@
+import bz2
+import lzma
+import struct
+import zlib
+from utils.arraytools import ArrayTools, np
+from utils.bittools import BitTools
+
+#secondary compression codecs applied to bit mask encoded data
+CODEC_NONE = 0
+CODEC_ZLIB = 1
+CODEC_LZMA = 2
+CODEC_BZ2 = 3
+
+CODEC_NAMES = {"none": CODEC_NONE, "zlib": CODEC_ZLIB, "lzma": CODEC_LZMA, "bz2": CODEC_BZ2}
+
+#level used when none is given
+DEFAULT_LEVELS = {CODEC_NONE: 0, CODEC_ZLIB: 6, CODEC_LZMA: 6, CODEC_BZ2: 9}
+
+#default number of values per independently compressed frame
+DEFAULT_FRAME_SIZE = 1 << 18
+
+#every frame starts with the compressed lengths of its mask and value streams (little-endian)
+_frame_header = struct.Struct('<II')
+
+
+class CodecTools:
+    """
+    Secondary compression of bit mask encoded data. Values are split into frames; for every frame the
+    masks (one byte per 8 values, as in MaskTools) and the non-zero values are stored as two separate
+    streams, each compressed with a stdlib codec. Non-zero values are byte-shuffled first: the first
+    byte of every value, then the second byte of every value and so on, so bytes of similar
+    significance (sign and exponent bytes in particular) end up next to each other.
+
+    Frames are compressed independently and start with the compressed length of both streams, so
+    they can be decompressed one at a time while the file is read.
+    """
+
+    @staticmethod
+    def compress(data, codec: int, level: int):
+        """
+        Compresses bytes with a codec
+
+        Parameters:
+        data (bytes-like): bytes to compress
+        codec (int): CODEC_NONE, CODEC_ZLIB, CODEC_LZMA or CODEC_BZ2
+        level (int): compression level of the codec
+
+        Returns:
+        bytes: compressed bytes
+        """
+        if codec == CODEC_NONE:
+            return bytes(data)
+        if codec == CODEC_ZLIB:
+            return zlib.compress(data, level)
+        if codec == CODEC_LZMA:
+            return lzma.compress(data, preset=level)
+        if codec == CODEC_BZ2:
+            return bz2.compress(data, max(level, 1))
+
+        raise Exception(f"Unknown codec {codec}")
+
+    @staticmethod
+    def decompress(data, codec: int):
+        """
+        Decompresses bytes compressed with compress
+
+        Parameters:
+        data (bytes-like): compressed bytes
+        codec (int): codec the bytes were compressed with
+
+        Returns:
+        bytes: decompressed bytes
+        """
+        if codec == CODEC_NONE:
+            return bytes(data)
+        if codec == CODEC_ZLIB:
+            return zlib.decompress(data)
+        if codec == CODEC_LZMA:
+            return lzma.decompress(data)
+        if codec == CODEC_BZ2:
+            return bz2.decompress(data)
+
+        raise Exception(f"Unknown codec {codec}")
+
+    @staticmethod
+    def shuffle(buffer, num_size: int):
+        """
+        Groups the bytes of packed values by significance
+
+        Parameters:
+        buffer (bytes-like): packed values
+        num_size (int): size of each value in bytes
+
+        Returns:
+        bytes: byte 0 of every value, then byte 1 of every value, and so on
+        """
+        if num_size == 1:
+            return bytes(buffer)
+        if np is not None:
+            return np.frombuffer(buffer, dtype=np.uint8).reshape(-1, num_size).T.tobytes()
+
+        buffer = bytes(buffer)
+        return b''.join(buffer[i::num_size] for i in range(num_size))
+
+    @staticmethod
+    def unshuffle(buffer, num_size: int):
+        """
+        Reverses shuffle
+
+        Parameters:
+        buffer (bytes-like): shuffled bytes
+        num_size (int): size of each value in bytes
+
+        Returns:
+        bytes: packed values
+        """
+        if num_size == 1:
+            return bytes(buffer)
+        if np is not None:
+            return np.frombuffer(buffer, dtype=np.uint8).reshape(num_size, -1).T.tobytes()
+
+        count = len(buffer) // num_size
+        unshuffled = bytearray(len(buffer))
+        for i in range(num_size):
+            unshuffled[i::num_size] = buffer[i * count:(i + 1) * count]
+
+        return bytes(unshuffled)
+
+    @staticmethod
+    def encode(values, chr_rep: str, codec: int, level: int=None, frame_size: int=DEFAULT_FRAME_SIZE):
+        """
+        Bit mask encodes values into frames of separately compressed mask and value streams
+
+        Parameters:
+        values: list, array.array, NumPy array or other sequence of numerical values
+        chr_rep (str): struct module character representation of data type
+        codec (int): CODEC_NONE, CODEC_ZLIB, CODEC_LZMA or CODEC_BZ2
+        level (int): compression level (defaults to DEFAULT_LEVELS of the codec)
+        frame_size (int): number of values per frame, a multiple of 8
+
+        Returns:
+        bytes: frames (without the file header)
+        """
+        if level is None:
+            level = DEFAULT_LEVELS[codec]
+
+        values = ArrayTools.to_array(values, chr_rep)
+        return b''.join(CodecTools.encode_frame(values[start:start + frame_size], chr_rep, codec, level)
+                        for start in range(0, len(values), frame_size))
+
+    @staticmethod
+    def encode_frame(values, chr_rep: str, codec: int, level: int):
+        """
+        Encodes one frame: compressed masks followed by compressed, byte-shuffled non-zero values
+
+        Returns:
+        bytes: frame header and both compressed streams
+        """
+        num_size = struct.calcsize(chr_rep)
+
+        if np is not None:
+            values = ArrayTools.to_array(values, chr_rep)
+            non_zero = values != 0
+            masks = np.packbits(non_zero).tobytes()
+            packed_values = np.ascontiguousarray(values[non_zero]).tobytes()
+        else:
+            masks = bytearray()
+            for start in range(0, len(values), 8):
+                #first element of group is stored in the most significant bit
+                bit_mask = 0
+                for i, element in enumerate(values[start:start + 8]):
+                    if element != 0:
+                        bit_mask = BitTools.set_bit(bit_mask, 7 - i)
+                masks.append(bit_mask)
+            packed_values = ArrayTools.to_bytes([element for element in values if element != 0], chr_rep)
+
+        mask_stream = CodecTools.compress(masks, codec, level)
+        value_stream = CodecTools.compress(CodecTools.shuffle(packed_values, num_size), codec, level)
+
+        return _frame_header.pack(len(mask_stream), len(value_stream)) + mask_stream + value_stream
+
+    @staticmethod
+    def iter_frames(buffer, start: int=0, end: int=None):
+        """
+        Finds the complete frames in a buffer
+
+        Parameters:
+        buffer (bytes-like): frames
+        start (int): position of the first frame
+        end (int): position where the frames end (defaults to end of buffer)
+
+        Yields:
+        tuple: (start of mask stream, start of value stream, end of frame) of every complete frame
+        """
+        if end is None:
+            end = len(buffer)
+
+        position = start
+        while position + _frame_header.size <= end:
+            mask_size, value_size = _frame_header.unpack_from(buffer, position)
+            mask_start = position + _frame_header.size
+            frame_end = mask_start + mask_size + value_size
+            if frame_end > end:
+                return
+
+            yield mask_start, mask_start + mask_size, frame_end
+            position = frame_end
+
+    @staticmethod
+    def decode(buffer, chr_rep: str, length: int, codec: int, frame_size: int=DEFAULT_FRAME_SIZE):
+        """
+        Decodes frames into a preallocated zero filled array
+
+        Parameters:
+        buffer (bytes-like): frames (without the file header)
+        chr_rep (str): struct module character representation of data type
+        length (int): number of values stored
+        codec (int): codec the streams were compressed with
+        frame_size (int): number of values per frame
+
+        Returns:
+        numpy.ndarray: decoded values (array.array or list if NumPy is not installed)
+        """
+        values = ArrayTools.zeros(length, chr_rep)
+        view = memoryview(buffer)
+        position = 0
+        end = 0
+
+        for mask_start, value_start, frame_end in CodecTools.iter_frames(view):
+            count = min(frame_size, length - position)
+            if count <= 0:
+                raise Exception("Compressed data is corrupted")
+
+            values[position:position + count] = CodecTools.decode_frame(view[mask_start:value_start],
+                                                                         view[value_start:frame_end], chr_rep, count, codec)
+            position += count
+            end = frame_end
+
+        if position != length or end != len(buffer):
+            raise Exception("Compressed data is truncated or corrupted")
+
+        return values
+
+    @staticmethod
+    def decode_frame(mask_stream, value_stream, chr_rep: str, count: int, codec: int):
+        """
+        Decompresses the streams of one frame and scatters the non-zero values to the positions of set mask bits
+
+        Parameters:
+        mask_stream (bytes-like): compressed masks
+        value_stream (bytes-like): compressed, byte-shuffled non-zero values
+        chr_rep (str): struct module character representation of data type
+        count (int): number of values in the frame
+        codec (int): codec the streams were compressed with
+
+        Returns:
+        numpy.ndarray: values of the frame (array.array or list if NumPy is not installed)
+        """
+        num_size = struct.calcsize(chr_rep)
+        masks = CodecTools.decompress(mask_stream, codec)
+        packed_values = CodecTools.unshuffle(CodecTools.decompress(value_stream, codec), num_size)
+
+        if len(masks) != (count + 7) // 8:
+            raise Exception("Compressed data is corrupted")
+
+        non_zero_values = ArrayTools.from_bytes(packed_values, chr_rep)
+        values = ArrayTools.zeros(count, chr_rep)
+
+        if np is not None:
+            is_set = np.unpackbits(np.frombuffer(masks, dtype=np.uint8), count=count).view(bool)
+            if int(is_set.sum()) != len(non_zero_values):
+                raise Exception("Compressed data is corrupted")
+            values[is_set] = non_zero_values
+            return values
+
+        position = 0
+        for index in range(count):
+            if BitTools.get_bit(masks[index // 8], 7 - index % 8):
+                values[index] = non_zero_values[position]
+                position += 1
+
+        if position != len(non_zero_values):
+            raise Exception("Compressed data is corrupted")
+
+        return values
+
+
+    @staticmethod
+    def decode_sparse(buffer, chr_rep: str, length: int, codec: int, frame_size: int=DEFAULT_FRAME_SIZE):
+        """
+        Decodes frames into the positions and values of the non-zero values, without creating the decoded
+        array. The value stream of a frame already holds exactly its non-zero values.
+
+        Parameters:
+        buffer (bytes-like): frames (without the file header)
+        chr_rep (str): struct module character representation of data type
+        length (int): number of values stored
+        codec (int): codec the streams were compressed with
+        frame_size (int): number of values per frame
+
+        Returns:
+        numpy.ndarray: int64 positions of the non-zero values (array.array of 'q' if NumPy is not installed)
+        numpy.ndarray: non-zero values (array.array or list if NumPy is not installed)
+        """
+        num_size = struct.calcsize(chr_rep)
+        view = memoryview(buffer)
+        parts = []
+        position = 0
+        end = 0
+
+        for mask_start, value_start, frame_end in CodecTools.iter_frames(view):
+            count = min(frame_size, length - position)
+            if count <= 0:
+                raise Exception("Compressed data is corrupted")
+
+            masks = CodecTools.decompress(view[mask_start:value_start], codec)
+            packed_values = CodecTools.unshuffle(CodecTools.decompress(view[value_start:frame_end], codec), num_size)
+            if len(masks) != (count + 7) // 8:
+                raise Exception("Compressed data is corrupted")
+
+            #copy so the values are writable
+            non_zero_values = ArrayTools.from_bytes(bytearray(packed_values), chr_rep)
+            if np is not None:
+                indices = np.flatnonzero(np.unpackbits(np.frombuffer(masks, dtype=np.uint8), count=count))
+            else:
+                indices = [index for index in range(count) if BitTools.get_bit(masks[index // 8], 7 - index % 8)]
+
+            if len(indices) != len(non_zero_values):
+                raise Exception("Compressed data is corrupted")
+
+            parts.append((position, indices, non_zero_values))
+            position += count
+            end = frame_end
+
+        if position != length or end != len(buffer):
+            raise Exception("Compressed data is truncated or corrupted")
+
+        return ArrayTools.join_sparse(parts, chr_rep)
+
+
+class CodecStreamDecoder:
+    """
+    Decodes compressed frames that arrive in pieces, with the same interface as StreamDecoder.
+    Every frame is decompressed and scattered as soon as all of its bytes have arrived.
+    """
+
+    def __init__(self, chr_rep: str, length: int, codec: int, frame_size: int=DEFAULT_FRAME_SIZE):
+        """
+        Parameters:
+        chr_rep (str): struct module character representation of data type
+        length (int): number of values stored
+        codec (int): codec the streams were compressed with
+        frame_size (int): number of values per frame
+        """
+        self.chr_rep = chr_rep
+        self.length = length
+        self.codec = codec
+        self.frame_size = frame_size
+        self._position = 0
+        self._leftover = b''
+
+    def feed(self, data):
+        """
+        Decodes every frame completed by data
+
+        Parameters:
+        data (bytes-like): next piece of frames
+
+        Returns:
+        numpy.ndarray: decoded values (array.array or list if NumPy is not installed)
+        """
+        decoded = list(self.iter_feed(data))
+
+        if not decoded:
+            return ArrayTools.zeros(0, self.chr_rep)
+        if np is not None:
+            return np.concatenate(decoded)
+
+        values = decoded[0]
+        for frame_values in decoded[1:]:
+            values = ArrayTools.concatenate(values, frame_values)
+
+        return values
+
+    def iter_feed(self, data, max_values: int=None):
+        """
+        Decodes every frame completed by data, one frame (split into pieces of at most max_values values)
+        at a time. Frames of highly compressible values take a few bytes, so decoding all frames of a piece
+        at once could create arrays far larger than the piece. The generator must be exhausted before more
+        data is fed.
+
+        Parameters:
+        data (bytes-like): next piece of frames
+        max_values (int): maximum number of values per yielded array (None yields one array per frame)
+
+        Yields:
+        numpy.ndarray: decoded values (array.array or list if NumPy is not installed)
+        """
+        buffer = self._leftover + bytes(data)
+        frames = list(CodecTools.iter_frames(buffer))
+        self._leftover = buffer[frames[-1][2]:] if frames else buffer
+
+        view = memoryview(buffer)
+        for mask_start, value_start, frame_end in frames:
+            count = min(self.frame_size, self.length - self._position)
+            if count <= 0:
+                raise Exception("Compressed data is corrupted")
+            self._position += count
+
+            yield from ArrayTools.split(CodecTools.decode_frame(view[mask_start:value_start], view[value_start:frame_end],
+                                                                self.chr_rep, count, self.codec), max_values)
+
+    def finish(self):
+        """
+        Checks that all data has been fed
+
+        Returns:
+        numpy.ndarray: empty array, all values are returned by feed
+        """
+        if self._leftover or self._position != self.length:
+            raise Exception("Compressed data is truncated or corrupted")
+
+        return ArrayTools.zeros(0, self.chr_rep)
@@ -1,20 +1,224 @@
+import itertools
+import struct
+import zlib
+from utils.chunktools import ChunkStreamDecoder
+from utils.codectools import CODEC_NONE, CodecStreamDecoder
 from utils.filetools import *
+from utils.masktools import MaskTools
+from utils.stattools import StatTools
+from utils.widemasktools import WideStreamDecoder
 
 class Decoder:
     @staticmethod
-    def decode_bin_file(file_name: str):
-        """Takes a bit mask encoded binary file of numerical values and decodes it 
+    def decode_bin_file(file_name: str, metadata: Metadata=None, output=None, fsync: bool=False):
+        """Takes a bit mask encoded binary file of numerical values and decodes it
 
         Parameters:
         file_name (str): A bit mask encoded binary file
+        metadata (Metadata): metadata already read from file, read from the file header if not provided
+        output (str or file): decoded file name or writable binary file object, file_name is replaced if not provided.
+                              Files given by name are written to a temporary file first, so an interrupted run
+                              leaves the existing file untouched.
+        fsync (bool): flush the decoded file to disk before it replaces any existing file
         """
 
-        #get data type
-        chr_rep = FileReader.metadata_from_binary(file_name)[4]
+        with StatTools.operation("decode", file_name):
+            #get data type
+            if metadata is None:
+                metadata = FileReader.metadata_from_binary(file_name)
+            chr_rep = metadata.chr_rep
 
-        #get values from encoded file in list form
-        values = FileReader.list_from_encoded(file_name)
+            #get values from encoded file as a typed array
+            values = FileReader.array_from_encoded(file_name, metadata)
+            with StatTools.stage("pack"):
+                payload = ArrayTools.to_bytes(values, chr_rep)
+                header = FileConstructor.create_header(False, metadata.type_letter, len(values), payload)
 
-        #write array to binary file
-        FileConstructor.list_to_binary_file(values, chr_rep, file_name)
-    
\ No newline at end of file
+            #write header and values to binary file
+            with StatTools.stage("write"), FileConstructor.open_output(file_name if output is None else output, fsync) as f:
+                f.write(header)
+                f.write(payload)
+            StatTools.count(bytes_written=len(header) + len(payload))
+
+    @staticmethod
+    def iter_decode(source, chunk_size: int=DEFAULT_CHUNK_SIZE):
+        """
+        Decodes a bit mask encoded binary file chunk by chunk so memory use stays proportional to the chunk size
+
+        Parameters:
+        source: binary file object at the start of an encoded binary file, or an iterable of
+                bytes chunks making up an encoded binary file
+        chunk_size (int): number of values worth of bytes read at a time, must be a multiple of 8
+
+        Yields:
+        Metadata: metadata of the encoded file (first item only)
+        numpy.ndarray: at most chunk_size decoded values at a time (array.array or list if NumPy is not installed)
+        """
+        if chunk_size <= 0 or chunk_size % 8:
+            raise Exception("Chunk size must be a positive multiple of 8")
+
+        if hasattr(source, "read"):
+            metadata = FileReader.read_metadata(source)
+            chunks = iter(lambda: source.read(chunk_size * metadata.num_size), b'')
+        else:
+            chunks = iter(source)
+            header = b''
+            for chunk in chunks:
+                header += chunk
+                if header and len(header) >= FileReader.header_size(header[0]):
+                    break
+
+            metadata = FileReader.metadata_from_bytes(header)
+            chunks = itertools.chain([header[metadata.header_size:]], chunks)
+
+        if not metadata.is_encoded:
+            raise Exception("File provided is not a bit mask encoded binary file")
+
+        yield metadata
+
+        checksum = 0
+        length = 0
+        stream = Decoder.stream_decoder(metadata)
+        for chunk in StatTools.timed(chunks, "read"):
+            StatTools.count(bytes_read=len(chunk))
+            with StatTools.stage("decode"):
+                checksum = zlib.crc32(chunk, checksum)
+
+            #a small piece of encoded data can stand for many values (e.g. runs of zeros), so they are
+            #decoded at most chunk_size values at a time
+            for values in StatTools.timed(stream.iter_feed(chunk, chunk_size), "decode"):
+                if len(values):
+                    length += len(values)
+                    yield FileReader.to_native(values, metadata)
+
+        values = stream.finish()
+        length += len(values)
+        if metadata.length is not None and length != metadata.length:
+            raise Exception("Bit mask encoded data is truncated or corrupted")
+        FileReader.verify_payload(None, metadata, checksum)
+
+        yield FileReader.to_native(values, metadata)
+
+    @staticmethod
+    def stream_decoder(metadata: Metadata):
+        """
+        Creates a decoder for the payload of an encoded file that arrives in pieces
+
+        Parameters:
+        metadata (Metadata): metadata of the encoded file
+
+        Returns:
+        StreamDecoder, ChunkStreamDecoder, WideStreamDecoder or CodecStreamDecoder: decoder for the encoding of the file
+        """
+        if metadata.codec != CODEC_NONE:
+            return CodecStreamDecoder(metadata.chr_rep, metadata.length, metadata.codec, metadata.chunk_size)
+        if metadata.mode == MODE_BITMASK:
+            return StreamDecoder(metadata.chr_rep, metadata.last_values)
+        if metadata.mode == MODE_ADAPTIVE:
+            return ChunkStreamDecoder(metadata.chr_rep, metadata.length, metadata.chunk_size)
+        if metadata.mode == MODE_BITMASK64:
+            return WideStreamDecoder(metadata.chr_rep, metadata.length)
+
+        raise Exception(f"Unknown encoding mode {metadata.mode}")
+
+    @staticmethod
+    def decode_stream(source, output, chunk_size: int=DEFAULT_CHUNK_SIZE):
+        """
+        Decodes a bit mask encoded binary file into a decoded binary file chunk by chunk
+
+        Parameters:
+        source: binary file object at the start of an encoded binary file, or an iterable of
+                bytes chunks making up an encoded binary file
+        output: binary file object the decoded file is written to (must be seekable unless the
+                encoded file records its number of values)
+        chunk_size (int): number of values worth of bytes read at a time, must be a multiple of 8
+
+        Returns:
+        int: number of values decoded
+        """
+        with StatTools.operation("decode", getattr(source, "name", None)):
+            decoded_chunks = Decoder.iter_decode(source, chunk_size)
+            metadata = next(decoded_chunks)
+            chr_rep = metadata.chr_rep
+
+            with PayloadWriter(output, False, metadata.type_letter, metadata.length) as writer:
+                for values in decoded_chunks:
+                    StatTools.count_values(values)
+                    writer.write(ArrayTools.to_bytes(values, chr_rep), len(values))
+
+            return writer.length
+
+
+class StreamDecoder:
+    """
+    Decodes bit mask encoded data that arrives in pieces. Bytes of a block cut off at the end of
+    a piece are kept until the next piece arrives. The values of the most recent bit mask are held
+    back because only the last mask of the file can hold fewer than 8 values.
+    """
+
+    def __init__(self, chr_rep: str, last_values: int=0):
+        """
+        Parameters:
+        chr_rep (str): struct module character representation of data type
+        last_values (int): number of values stored in the last mask (0 if the last mask is full)
+        """
+        self.chr_rep = chr_rep
+        self.last_values = last_values
+        self._num_size = struct.calcsize(chr_rep)
+        self._leftover = b''
+        self._pending = ArrayTools.zeros(0, chr_rep)
+
+    def feed(self, data):
+        """
+        Decodes every block completed by data
+
+        Parameters:
+        data (bytes-like): next piece of interleaved masks and non-zero values
+
+        Returns:
+        numpy.ndarray: values known not to belong to the last mask (array.array or list if NumPy is not installed)
+        """
+        buffer = self._leftover + bytes(data)
+        offsets, end = MaskTools.complete_blocks(buffer, self._num_size)
+        self._leftover = buffer[end:]
+
+        if not len(offsets):
+            return ArrayTools.zeros(0, self.chr_rep)
+
+        #release the previously held back mask and hold back the newest one
+        values = ArrayTools.concatenate(self._pending, MaskTools.decode_blocks(buffer, offsets, self.chr_rep, end))
+        self._pending = values[-8:]
+        return values[:-8]
+
+    def iter_feed(self, data, max_values: int=None):
+        """
+        Decodes every block completed by data, a piece of at most max_values values at a time.
+        Every mask byte stands for at most 8 values, so the output of feed is already bounded by the
+        size of data and is only split into pieces.
+
+        Parameters:
+        data (bytes-like): next piece of interleaved masks and non-zero values
+        max_values (int): maximum number of values per yielded array (None yields all values at once)
+
+        Yields:
+        numpy.ndarray: values known not to belong to the last mask (array.array or list if NumPy is not installed)
+        """
+        yield from ArrayTools.split(self.feed(data), max_values)
+
+    def finish(self):
+        """
+        Returns the values of the last mask once all data has been fed
+
+        Returns:
+        numpy.ndarray: values of the last mask (array.array or list if NumPy is not installed)
+        """
+        if self._leftover:
+            raise Exception("Bit mask encoded data is truncated or corrupted")
+
+        values = self._pending
+        self._pending = ArrayTools.zeros(0, self.chr_rep)
+
+        if self.last_values and len(values):
+            return values[:self.last_values]
+
+        return values
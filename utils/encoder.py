@@ -1,66 +1,322 @@
-import struct
-from utils.filetools import FileReader, FileConstructor
+import contextlib
+from utils.arraytools import ArrayTools, np
+from utils.chunktools import ChunkTools, DEFAULT_ADAPTIVE_CHUNK_SIZE
+from utils.codectools import CODEC_NONE, DEFAULT_FRAME_SIZE, CodecTools
+from utils.filetools import (DEFAULT_CHUNK_SIZE, MODE_ADAPTIVE, MODE_BITMASK, MODE_BITMASK64, FileReader, FileConstructor,
+                             Metadata, PayloadWriter)
+from utils.indextools import BlockIndex
+from utils.masktools import MaskTools
+from utils.stattools import StatTools
+from utils.typetools import DataHelper
+from utils.widemasktools import WIDE_MASK_SIZE, WideMaskTools, WideRunJoiner
 
 
 class Encoder:
     @staticmethod
-    def encode_bin_file(file_name: str):
+    def encode_bin_file(file_name: str, metadata: Metadata=None, index_interval: int=None, output=None, fsync: bool=False,
+                        mode: int=MODE_BITMASK, adaptive_chunk_size: int=DEFAULT_ADAPTIVE_CHUNK_SIZE, codec: int=CODEC_NONE,
+                        level: int=None):
         """
         Using bitmask encoding, encodes a binary file containing a byte of metadata and numerical values in byte from
 
         file_name (str): file path to a binary file to be encoded using bit mask encoding
+        metadata (Metadata): metadata already read from file, read from the file header if not provided
+        index_interval (int): if provided, also writes a block index sidecar file with a checkpoint every index_interval masks
+        output (str or file): encoded file name or writable binary file object, file_name is replaced if not provided.
+                              Files given by name are written to a temporary file first, so an interrupted run
+                              leaves the existing file untouched.
+        fsync (bool): flush the encoded file to disk before it replaces any existing file
+        mode (int): MODE_BITMASK, MODE_ADAPTIVE to let every chunk pick zero, raw or bit mask storage, or
+                    MODE_BITMASK64 for 64-bit masks with run-length coded empty masks (for very sparse data)
+        adaptive_chunk_size (int): number of values per chunk for MODE_ADAPTIVE, a power of two
+        codec (int): secondary codec for bit mask mode (CODEC_NONE, CODEC_ZLIB, CODEC_LZMA or CODEC_BZ2), see CodecTools
+        level (int): compression level of the codec (defaults to DEFAULT_LEVELS of the codec)
         """
-        #get values from file
-        values_list = FileReader.list_from_decoded(file_name)
-
-        #get metadata
-        chr_rep = FileReader.metadata_from_binary(file_name)[4]
-
-        #get remainder in last bitmask
-        last_mask_remainder = len(values_list) % 8
-        
-        #Create bytes object to write to file, starting off with first byte which holds metadata
-        encoded_bytes = FileConstructor.create_first_byte(True, chr_rep, last_mask_remainder)
-
-        #iterate through list
-        list_index = 0
-        while list_index < len(values_list):
-            #create bit mask and bytes object for non-zero elements
-            block_bit_mask = ""
-
-            #create an empty bytes object to store non-zero elements
-            non_zero_bytes = bytes(0)
-
-            #iterate through 8 elements at a time in the list (each bit mask stores 8 elements)
-            for i in range(8):
-                try:
-                    #get element
-                    element = values_list[list_index]
-
-                    #add appropriate bit to bit mask
-                    block_bit_mask += "0" if element == 0 else "1"
-
-                    #if element is non-zero add in byte form to bytes object 
-                    if element != 0:
-                        non_zero_bytes += struct.pack(chr_rep, element)
-
-                    list_index += 1
-                except IndexError:
-                    #used to handle remainders if list length is not multiple of 8
-                    remaining_zeros = 8 - i
-                    for j in range(remaining_zeros):
-                        block_bit_mask += "0"
-                    break
-            
-            #convert bitmask to bytes and add bitmask and list to encoded_bytes
-            block_mask_as_bytes = int(block_bit_mask, 2).to_bytes(1, "little")
-
-            #add bit mask followed by non-zero elements to bytes object that will be written to file
-            encoded_bytes += block_mask_as_bytes
-            encoded_bytes += non_zero_bytes
-        
-        #write bytes to binary file
-        with open(file_name, 'wb') as f:
-            f.write(encoded_bytes)
-    
-    
\ No newline at end of file
+        if output is None:
+            output = file_name
+        if index_interval and hasattr(output, "write"):
+            raise Exception("A block index can only be written for an output file name")
+        if index_interval and (mode != MODE_BITMASK or codec != CODEC_NONE):
+            raise Exception("A block index can only be written for bit mask mode without a codec")
+
+        with StatTools.operation("encode", file_name):
+            #get metadata
+            if metadata is None:
+                metadata = FileReader.metadata_from_binary(file_name)
+            chr_rep = metadata.chr_rep
+
+            #get values from file as a typed array
+            values = FileReader.array_from_decoded(file_name, metadata)
+
+            #header holds metadata, followed by interleaved bit masks and non-zero elements (or tagged chunks)
+            with StatTools.stage("encode"):
+                encoded_bytes = Encoder.encode_values(values, chr_rep, mode, adaptive_chunk_size, codec, level)
+            with StatTools.stage("header"):
+                header = FileConstructor.create_header(True, metadata.type_letter, len(values), encoded_bytes, mode=mode,
+                                                       chunk_size=Encoder.mode_chunk_size(mode, adaptive_chunk_size, codec),
+                                                       codec=codec, level=level)
+
+            #write bytes to binary file
+            with StatTools.stage("write"), FileConstructor.open_output(output, fsync) as f:
+                f.write(header)
+                f.write(encoded_bytes)
+            StatTools.count(bytes_written=len(header) + len(encoded_bytes))
+
+            #block index for random access
+            if index_interval:
+                with StatTools.stage("index"):
+                    mask_offsets = MaskTools.block_offsets(values, chr_rep)
+                    BlockIndex.from_mask_offsets(mask_offsets, len(header), index_interval).save(output, fsync)
+
+    @staticmethod
+    def encode_values(values, chr_rep: str, mode: int=MODE_BITMASK, adaptive_chunk_size: int=DEFAULT_ADAPTIVE_CHUNK_SIZE,
+                      codec: int=CODEC_NONE, level: int=None):
+        """
+        Encodes values with an encoding mode
+
+        Parameters:
+        values: list, array.array, NumPy array or other sequence of numerical values
+        chr_rep (str): struct module character representation of data type
+        mode (int): MODE_BITMASK, MODE_ADAPTIVE or MODE_BITMASK64
+        adaptive_chunk_size (int): number of values per chunk for MODE_ADAPTIVE
+        codec (int): secondary codec for bit mask mode
+        level (int): compression level of the codec
+
+        Returns:
+        bytes: encoded payload (without the file header)
+        """
+        if codec != CODEC_NONE:
+            if mode != MODE_BITMASK:
+                raise Exception("Secondary codecs are only supported in bit mask mode")
+            return CodecTools.encode(values, chr_rep, codec, level, DEFAULT_FRAME_SIZE)
+        if mode == MODE_BITMASK:
+            return MaskTools.encode(values, chr_rep)
+        if mode == MODE_ADAPTIVE:
+            return ChunkTools.encode(values, chr_rep, adaptive_chunk_size)
+        if mode == MODE_BITMASK64:
+            return WideMaskTools.encode(values, chr_rep)
+
+        raise Exception(f"Unknown encoding mode {mode}")
+
+    @staticmethod
+    def mode_chunk_size(mode: int, adaptive_chunk_size: int, codec: int=CODEC_NONE):
+        """
+        Returns the chunk (or frame) size recorded in the header for an encoding mode (None for modes without chunks)
+        """
+        if codec != CODEC_NONE:
+            return DEFAULT_FRAME_SIZE
+
+        return adaptive_chunk_size if mode == MODE_ADAPTIVE else None
+
+    @staticmethod
+    def block_size(mode: int, adaptive_chunk_size: int, codec: int=CODEC_NONE):
+        """
+        Returns the number of values encoded together by an encoding mode. Encoded pieces of values can be
+        concatenated as long as every piece but the last holds a multiple of this number of values
+        (MODE_BITMASK64 pieces are joined with a WideRunJoiner, which merges runs of empty masks).
+        """
+        if codec != CODEC_NONE:
+            return DEFAULT_FRAME_SIZE
+        if mode == MODE_ADAPTIVE:
+            return adaptive_chunk_size
+        if mode == MODE_BITMASK64:
+            return WIDE_MASK_SIZE
+
+        return 8
+
+    @staticmethod
+    def encode_stream(source, output, chunk_size: int=DEFAULT_CHUNK_SIZE, chr_rep: str=None, mode: int=MODE_BITMASK,
+                      adaptive_chunk_size: int=DEFAULT_ADAPTIVE_CHUNK_SIZE, codec: int=CODEC_NONE, level: int=None):
+        """
+        Bit mask encodes values chunk by chunk so memory use stays proportional to the chunk size
+
+        Parameters:
+        source: binary file object at the start of a decoded binary file, or an iterable of
+                value chunks (lists or arrays) in which case chr_rep must be provided
+        output: binary file object the encoded file is written to
+        chunk_size (int): number of values read and encoded at a time, must be a multiple of 8
+        chr_rep (str): struct module character representation of data type, only used for iterable sources
+        mode (int): MODE_BITMASK, MODE_ADAPTIVE or MODE_BITMASK64
+        adaptive_chunk_size (int): number of values per chunk for MODE_ADAPTIVE
+        codec (int): secondary codec for bit mask mode
+        level (int): compression level of the codec
+
+        Returns:
+        int: number of values encoded
+        """
+        if chunk_size <= 0 or chunk_size % 8:
+            raise Exception("Chunk size must be a positive multiple of 8")
+
+        with StatTools.operation("encode", getattr(source, "name", None)):
+            if hasattr(source, "read"):
+                metadata = FileReader.read_metadata(source)
+                if metadata.is_encoded:
+                    raise Exception("File provided is not a bit mask decoded binary file")
+
+                chr_rep = metadata.type_letter
+                length = metadata.length
+                chunks = FileReader.iter_decoded_chunks(source, metadata, chunk_size)
+            elif chr_rep is None:
+                raise Exception("Data type must be provided when encoding an iterable of values")
+            else:
+                length = None
+                chunks = source
+
+            with StreamEncoder(output, chr_rep, length, mode, adaptive_chunk_size, codec, level) as stream:
+                for chunk in StatTools.timed(chunks, "read"):
+                    StatTools.count_values(chunk)
+                    stream.write(chunk)
+
+            return stream.length
+
+    @staticmethod
+    def encode_csv_file(file_name: str, chr_rep: str='d', output_file_name=None, decoded_file_name=None, rows: tuple=None,
+                        column: int=None, strict: bool=False, chunk_size: int=DEFAULT_CHUNK_SIZE, fsync: bool=False,
+                        mode: int=MODE_BITMASK, adaptive_chunk_size: int=DEFAULT_ADAPTIVE_CHUNK_SIZE, codec: int=CODEC_NONE,
+                        level: int=None):
+        """
+        Converts a CSV file straight to a bit mask encoded binary file. Parsed chunks of values are encoded as they
+        are read, so no decoded binary file is written or read back unless one is requested.
+
+        Parameters:
+        file_name (str): The CSV file that will be converted
+        chr_rep (str): struct module character representation of data type to store
+        output_file_name (str or file): name of encoded file to create (defaults to CSV name with .bin extension) or a
+                                        writable, seekable binary file object
+        decoded_file_name (str or file): if provided, a decoded binary file is also written to this name or file object
+        rows (tuple): (first row, row after last) to read, None reads all rows
+        column (int): if provided, only this column of each row is read
+        strict (bool): raise an error for non-numerical cells instead of skipping them
+        chunk_size (int): approximate number of values converted at a time
+        fsync (bool): flush files given by name to disk before they replace any existing file
+        mode (int): MODE_BITMASK, MODE_ADAPTIVE or MODE_BITMASK64
+        adaptive_chunk_size (int): number of values per chunk for MODE_ADAPTIVE
+        codec (int): secondary codec for bit mask mode
+        level (int): compression level of the codec
+
+        Returns:
+        str: created encoded file name (name of file object, if it has one)
+        """
+        with contextlib.ExitStack() as stack:
+            stack.enter_context(StatTools.operation("convert", file_name))
+            chunks = StatTools.timed(FileReader.iter_csv_chunks(file_name, chr_rep, rows, column, strict, chunk_size),
+                                     "parse")
+
+            #open outputs that were given by name
+            if not hasattr(output_file_name, "write"):
+                output_file_name = FileConstructor.binary_file_name(output_file_name or file_name)
+                output = stack.enter_context(FileConstructor.atomic_output(output_file_name, fsync))
+            else:
+                output = output_file_name
+                output_file_name = getattr(output, "name", None)
+
+            #optionally tee values into a decoded file as they are encoded
+            decoded_writer = None
+            if decoded_file_name is not None:
+                decoded_output = stack.enter_context(FileConstructor.open_output(decoded_file_name, fsync))
+                decoded_writer = stack.enter_context(PayloadWriter(decoded_output, False, chr_rep))
+
+            with StreamEncoder(output, chr_rep, mode=mode, adaptive_chunk_size=adaptive_chunk_size, codec=codec,
+                               level=level) as stream:
+                for chunk in chunks:
+                    StatTools.count_values(chunk)
+                    stream.write(chunk)
+                    if decoded_writer is not None:
+                        decoded_writer.write(FileConstructor.pack_values(chunk, chr_rep), len(chunk))
+
+        return output_file_name
+
+
+
+class StreamEncoder:
+    """
+    Writes an encoded binary file incrementally. Values can be written in chunks of any length; at
+    most 7 values are held back until the next chunk completes their bit mask (with 64-bit masks or
+    in adaptive mode or with a codec, values are held back until they fill a whole mask, chunk or frame).
+
+    The number of values, the payload length and its checksum are only known once all values are
+    written, so the header is rewritten on close (see PayloadWriter).
+    """
+
+    def __init__(self, output, chr_rep: str, length: int=None, mode: int=MODE_BITMASK,
+                 adaptive_chunk_size: int=DEFAULT_ADAPTIVE_CHUNK_SIZE, codec: int=CODEC_NONE, level: int=None):
+        """
+        Parameters:
+        output: binary file object the encoded file is written to (must be seekable if length is not given)
+        chr_rep (str): struct module character representation of data type, or BFLOAT16 for 16-bit patterns of bfloat16 values
+        length (int): total number of values that will be written, if known
+        mode (int): MODE_BITMASK, MODE_ADAPTIVE or MODE_BITMASK64
+        adaptive_chunk_size (int): number of values per chunk for MODE_ADAPTIVE
+        codec (int): secondary codec for bit mask mode
+        level (int): compression level of the codec
+        """
+        self.output = output
+        self.chr_rep = DataHelper.storage_letter(chr_rep)
+        self.length = 0
+        self.mode = mode
+        self.adaptive_chunk_size = adaptive_chunk_size
+        self.codec = codec
+        self.level = level
+
+        #values are encoded in whole bit masks, chunks or frames
+        self._block_size = Encoder.block_size(mode, adaptive_chunk_size, codec)
+        self._writer = PayloadWriter(output, True, chr_rep, length, mode=mode,
+                                     chunk_size=Encoder.mode_chunk_size(mode, adaptive_chunk_size, codec), codec=codec,
+                                     level=level)
+        self._pending = ArrayTools.zeros(0, self.chr_rep)
+
+        #runs of empty 64-bit masks can span pieces, they are merged so the output matches Encoder.encode_bin_file
+        self._joiner = WideRunJoiner() if mode == MODE_BITMASK64 else None
+
+    def write(self, values):
+        """
+        Encodes and writes values, holding back any values that do not complete a bit mask
+
+        Parameters:
+        values: list, array.array or NumPy array of values
+        """
+        values = ArrayTools.to_array(values, self.chr_rep)
+        if np is None:
+            values = list(values)
+            self._pending = list(self._pending)
+
+        if len(self._pending):
+            values = ArrayTools.concatenate(self._pending, values)
+
+        self.length += len(values) - len(self._pending)
+
+        #encode whole bit masks (or chunks) only
+        complete = len(values) - len(values) % self._block_size
+        with StatTools.stage("encode"):
+            payload = self._encode(values[:complete])
+        self._writer.write(payload, complete)
+        self._pending = values[complete:]
+
+    def close(self):
+        """
+        Encodes the final partial bit mask (or chunk) and writes the final header
+        """
+        if len(self._pending):
+            with StatTools.stage("encode"):
+                payload = self._encode(self._pending)
+            self._writer.write(payload, len(self._pending))
+            self._pending = self._pending[:0]
+
+        if self._joiner is not None:
+            self._writer.write(self._joiner.finish(), 0)
+
+        self._writer.close()
+
+    def _encode(self, values):
+        payload = Encoder.encode_values(values, self.chr_rep, self.mode, self.adaptive_chunk_size, self.codec, self.level)
+        if self._joiner is not None:
+            payload = self._joiner.join(payload, WideMaskTools.trailing_empty_groups(values))
+
+        return payload
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
@@ -1,8 +1,122 @@
+from utils.arraytools import ArrayTools, np
 from utils.bittools import BitTools
-from utils.typetools import DataHelper
+from utils.chunktools import ChunkTools
+from utils.codectools import CODEC_NONE, DEFAULT_LEVELS, CodecTools
+from utils.masktools import MaskTools
+from utils.stattools import StatTools
+from utils.typetools import BFLOAT16, DataHelper
+from utils.widemasktools import WideMaskTools
+import contextlib
 import csv
+import itertools
 import os
+import stat
 import struct 
+import sys
+import zlib
+
+#default number of values processed at a time when streaming files
+DEFAULT_CHUNK_SIZE = 1 << 20
+
+#version of the extended header written by FileConstructor.create_header
+HEADER_VERSION = 1
+
+#encoding modes of encoded files
+MODE_BITMASK = 0
+MODE_ADAPTIVE = 1
+MODE_BITMASK64 = 2
+
+#extended header (little-endian): first byte, magic, version, type letter, element size, byte order of values,
+#flags, element count, payload length, CRC32 of payload, encoding mode, log2 of chunk size, secondary codec and its level
+_extended_header = struct.Struct('<B2sBcBBBQQIBBBB')
+EXTENDED_HEADER_SIZE = _extended_header.size
+_header_magic = b'BM'
+
+#low 4 bits of the first byte of an extended header (float type index 7 does not exist in 1-byte headers)
+_extended_header_marker = 0b1111
+
+#header flag: payload length and checksum are recorded
+_flag_checked = 1
+
+_byte_orders = ("little", "big")
+
+class Metadata:
+    """
+    Metadata parsed once from the header of a binary file. Unpacks and indexes like the tuple
+    returned by FileReader.metadata_from_binary:
+    (is_encoded, is_float, last_values, num_size, chr_rep)
+
+    Files with an extended header also record the number of values, the byte order of the values,
+    the payload length and a CRC32 of the payload. These are None for legacy 1-byte headers, whose
+    values are in the byte order of the machine. Encoded files record their encoding mode (MODE_BITMASK
+    for legacy headers) and, for chunked modes, the number of values per chunk. Bit mask encoded files compressed with a secondary
+    codec (see CodecTools) record the codec, its level and the number of values per frame in chunk_size.
+
+    chr_rep is the struct module letter of the stored values, type_letter the type recorded in the header.
+    They only differ for bfloat16 (DataHelper.BFLOAT16), whose values are stored as 16-bit patterns ('H').
+    """
+
+    def __init__(self, is_encoded: int, is_float: int, last_values: int, num_size: int, chr_rep: str, header_size: int=1,
+                 version: int=0, length: int=None, payload_size: int=None, checksum: int=None, byte_order: str=sys.byteorder,
+                 mode: int=MODE_BITMASK, chunk_size: int=None, codec: int=CODEC_NONE, level: int=None, type_letter: str=None):
+        self.is_encoded = is_encoded
+        self.is_float = is_float
+        self.last_values = last_values
+        self.num_size = num_size
+        self.chr_rep = chr_rep
+        self.header_size = header_size
+        self.version = version
+        self.length = length
+        self.payload_size = payload_size
+        self.checksum = checksum
+        self.byte_order = byte_order
+        self.mode = mode
+        self.chunk_size = chunk_size
+        self.codec = codec
+        self.level = level
+        self.type_letter = type_letter or chr_rep
+
+    @property
+    def is_native(self):
+        """
+        bool: whether values are stored in the byte order of this machine
+        """
+        return self.byte_order == sys.byteorder
+
+    @property
+    def file_type(self):
+        """
+        str: 'encoded' or 'decoded'
+        """
+        return "encoded" if self.is_encoded else "decoded"
+
+    def _as_tuple(self):
+        return (self.is_encoded, self.is_float, self.last_values, self.num_size, self.chr_rep)
+
+    def __iter__(self):
+        return iter(self._as_tuple())
+
+    def __getitem__(self, index):
+        return self._as_tuple()[index]
+
+    def __len__(self):
+        return 5
+
+    def __eq__(self, other):
+        #compares like the legacy metadata tuple, with other Metadata or plain tuples only
+        if not isinstance(other, (Metadata, tuple)):
+            return NotImplemented
+
+        return self._as_tuple() == tuple(other)
+
+    def __hash__(self):
+        #equal to the hash of the legacy tuple, so equal objects hash alike
+        return hash(self._as_tuple())
+
+    def __repr__(self):
+        return (f"Metadata(is_encoded={self.is_encoded}, is_float={self.is_float}, last_values={self.last_values}, "
+                f"num_size={self.num_size}, chr_rep={self.chr_rep!r}, type_letter={self.type_letter!r}, version={self.version}, length={self.length}, mode={self.mode}, codec={self.codec})")
+
 
 class FileReader:
     @staticmethod
@@ -35,6 +149,32 @@ class FileReader:
             return funcs_dict[file_type](file_name)
 
     
+    @staticmethod
+    def get_array(file_name: str, metadata: Metadata=None):
+        """
+        From a .bin file, determines whether it is encoded or decoded, and returns the stored
+        values as a typed array
+
+        Parameters:
+        file_name (str): encoded or decoded .bin file
+        metadata (Metadata): metadata already read from file, read from the file header if not provided
+
+        Returns:
+        numpy.ndarray: writable array of stored values (array.array or list if NumPy is not installed)
+        """
+        if metadata is None:
+            file_type, metadata = FileReader.get_file_info(file_name)
+        else:
+            file_type = metadata.file_type
+
+        if file_type == "encoded":
+            return FileReader.array_from_encoded(file_name, metadata)
+        elif file_type == "decoded":
+            return FileReader.array_from_decoded(file_name, metadata)
+
+        raise Exception("File provided is not a binary file")
+
+    
     @staticmethod
     def get_file_type(file_name: str):
         """
@@ -49,6 +189,21 @@ class FileReader:
         Returns:
         str: 'csv' if .csv file or 'encoded' or 'decoded' for a .bin file
 
+        """
+        return FileReader.get_file_info(file_name)[0]
+
+    @staticmethod
+    def get_file_info(file_name: str):
+        """
+        From a provided file name, returns the file type (see get_file_type) and, for binary files,
+        the metadata read from the file header so it does not need to be read again
+
+        Parameters:
+        file_name (str): The name of the file 
+
+        Returns:
+        str: 'csv' if .csv file or 'encoded' or 'decoded' for a .bin file, None otherwise
+        Metadata: metadata of a .bin file or None for other files
         """
 
         #get file extension from file
@@ -56,178 +211,358 @@ class FileReader:
 
         #Case 1: CSV
         if file_ext == "csv":
-            return "csv"
+            return "csv", None
         
-        #Case 2: Binary File
+        #Case 2: Binary File, header tells if encoded or decoded
         if file_ext == "bin":
-            #open file and check first bit to see if encoded or decoded
-            with open(file_name, 'rb') as f:
-                file_bytes = f.read()
-                first_byte = file_bytes[0]
-
-                #get first bit of file
-                encoded = BitTools.get_bit(first_byte, 7)
-            
-            #1 means encoded while 0 means decoded
-            if encoded: 
-                return "encoded"
-            else:
-                return "decoded"
+            metadata = FileReader.metadata_from_binary(file_name)
+            return metadata.file_type, metadata
         
         #Case 3: None of the Above
-        return None
+        return None, None
 
     @staticmethod
-    def list_from_encoded(file_name: str):
+    def list_from_encoded(file_name: str, metadata: Metadata=None):
         """
         From a bitmask encoded .bin file, extracts stored numbers and returns a list with values
 
         Parameters
         file_name (str): encoded .bin file with numerical values in binary form
+        metadata (Metadata): metadata already read from file, read from the file header if not provided
 
         Returns
         list: list with numbers found in bitmask encoded binary file 
 
         """
+        with StatTools.operation("decode", file_name):
+            values = FileReader.array_from_encoded(file_name, metadata)
+            with StatTools.stage("to_list"):
+                return ArrayTools.to_list(values)
 
-        values = [] #store values in list
-        byte_number = 0 #track byte_number in file
-        file_size = os.path.getsize(file_name)
-        
-        #get metadata
-        is_encoded, is_float, last_values, num_size, chr_rep = FileReader.metadata_from_binary(file_name)
-        byte_number += 1
 
-        #if not encoded raise error
-        if not is_encoded:
-            raise Exception("File provided is not a bit mask encoded binary file")
+    @staticmethod
+    def array_from_encoded(file_name: str, metadata: Metadata=None):
+        """
+        From a bitmask encoded .bin file, extracts stored numbers and returns them as a typed array
 
-        #get bytes from file
-        with open(file_name, 'rb') as f:
-            encoded_bytes = f.read()
-    
-        
-        #handle bytes up until last bit mask
-        while byte_number < (file_size - last_values * num_size - 1):
-            #gets bit mask at location
-            bit_mask = "{0:08b}".format(encoded_bytes[byte_number])
-            byte_number += 1
-
-            #iterate through bit mask and populate array
-            for bit in bit_mask:
-                if bit == "0":
-                    if is_float:
-                        values.append(0.0)
-                    else:
-                        values.append(0)
-                else:
-                    current_val = struct.unpack(chr_rep, encoded_bytes[byte_number:byte_number+num_size])[0]
-                    values.append(current_val)
-                    byte_number += num_size
-        
-        #handle remainders if list length is not divisible by 8
-        if byte_number < file_size:
-            #get mask
-            bit_mask = "{0:08b}".format(encoded_bytes[byte_number])
-            byte_number += 1
-
-            #iterate through mask get and get values
-            for bit_number in range(last_values):
-                bit = bit_mask[bit_number]
-                if bit == "0":
-                    if is_float:
-                        values.append(0.0)
-                    else:
-                        values.append(0)
-                else:
-                    current_val = struct.unpack(chr_rep, encoded_bytes[byte_number:byte_number+num_size])[0]
-                    values.append(current_val)
-                    byte_number += num_size
+        Parameters
+        file_name (str): encoded .bin file with numerical values in binary form
+        metadata (Metadata): metadata already read from file, read from the file header if not provided
 
-        return values
+        Returns
+        numpy.ndarray: array with numbers found in bitmask encoded binary file (array.array or list if NumPy is not installed)
+
+        """
 
+        with StatTools.operation("decode", file_name), open(file_name, 'rb') as f:
+            #get metadata
+            if metadata is None:
+                metadata = FileReader.read_metadata(f)
+
+            #if not encoded raise error
+            if not metadata.is_encoded:
+                raise Exception("File provided is not a bit mask encoded binary file")
+
+            #get bytes after metadata from file
+            with StatTools.stage("read"):
+                f.seek(metadata.header_size)
+                encoded_bytes = f.read()
+            StatTools.count(bytes_read=len(encoded_bytes))
+
+            with StatTools.stage("verify"):
+                FileReader.verify_payload(encoded_bytes, metadata)
+            with StatTools.stage("decode"):
+                values = FileReader.to_native(FileReader.decode_payload(encoded_bytes, metadata), metadata)
+            StatTools.count_values(values)
+
+            return values
 
     @staticmethod
-    def list_from_decoded(file_name: str):
+    def decode_payload(payload, metadata: Metadata):
+        """
+        Decodes the payload of an encoded file with the encoding mode recorded in its header
+
+        Parameters:
+        payload (bytes-like): all bytes after the header
+        metadata (Metadata): metadata of the file
+
+        Returns:
+        numpy.ndarray: decoded values in the byte order of the file (array.array or list if NumPy is not installed)
+        """
+        if metadata.codec != CODEC_NONE:
+            return CodecTools.decode(payload, metadata.chr_rep, metadata.length, metadata.codec, metadata.chunk_size)
+        if metadata.mode == MODE_BITMASK:
+            return MaskTools.decode(payload, metadata.chr_rep, metadata.last_values, metadata.length)
+        if metadata.mode == MODE_ADAPTIVE:
+            return ChunkTools.decode(payload, metadata.chr_rep, metadata.length, metadata.chunk_size)
+        if metadata.mode == MODE_BITMASK64:
+            return WideMaskTools.decode(payload, metadata.chr_rep, metadata.length)
+
+        raise Exception(f"Unknown encoding mode {metadata.mode}")
+
+    @staticmethod
+    def list_from_decoded(file_name: str, metadata: Metadata=None):
         """
         From a decoded binary file, retrieves stored numbers, adds them to a list, and returns list
 
         Parameters:
         file_name (str): The decoded binary file 
+        metadata (Metadata): metadata already read from file, read from the file header if not provided
 
         Returns
         list: list of numbers in decoded binary file
         """
+        with StatTools.operation("read", file_name):
+            values = FileReader.array_from_decoded(file_name, metadata)
+            with StatTools.stage("to_list"):
+                return ArrayTools.to_list(values)
+
+
+    @staticmethod
+    def array_from_decoded(file_name: str, metadata: Metadata=None):
+        """
+        From a decoded binary file, retrieves stored numbers as a typed array in a single read
+
+        Parameters:
+        file_name (str): The decoded binary file 
+        metadata (Metadata): metadata already read from file, read from the file header if not provided
+
+        Returns
+        numpy.ndarray: array of numbers in decoded binary file (array.array or list if NumPy is not installed)
+        """
 
         #data about file
-        file_path = file_name
         file_size = os.path.getsize(file_name)
 
-        #get metadata
-        is_encoded, is_float, last_values, num_size, chr_rep = FileReader.metadata_from_binary(file_name)
+        with StatTools.operation("read", file_name), open(file_name, 'rb') as f:
+            #get metadata
+            if metadata is None:
+                metadata = FileReader.read_metadata(f)
 
-        #make sure file is correctly stored (should be divisible by element size)
-        remainder = (file_size - 1) % num_size
-        if remainder:
-            raise Exception("Elements not correctly stored in binary file")
-        
-        #if not decoded raise error
-        if is_encoded:
-            raise Exception("File provided is not a bit mask decoded binary file")
-        
-        #open file and get bytes stored
-        with open(file_path, 'rb') as f:
-            decoded_bytes = f.read()
-        
-        #iterate through bytes and get numbers and max integer size
-        current_byte = 1
-        values = []
+            #make sure file is correctly stored (should be divisible by element size)
+            payload_size = file_size - metadata.header_size
+            remainder = payload_size % metadata.num_size
+            if remainder:
+                raise Exception("Elements not correctly stored in binary file")
+            
+            #if not decoded raise error
+            if metadata.is_encoded:
+                raise Exception("File provided is not a bit mask decoded binary file")
+
+            #the element count of an extended header is checked against the file size
+            length = payload_size // metadata.num_size
+            if metadata.length is not None and metadata.length != length:
+                raise Exception("Binary file is truncated or has trailing data")
+            
+            #read values stored after metadata straight into an array
+            with StatTools.stage("read"):
+                f.seek(metadata.header_size)
+                values = ArrayTools.from_file(f, metadata.chr_rep, length)
+            StatTools.count(bytes_read=payload_size)
 
-        while current_byte < file_size:
-            #get four bytes and convert to integer
-            current_block = decoded_bytes[current_byte:current_byte+num_size] 
-            current_byte += num_size
-            current_value = struct.unpack(chr_rep, current_block)[0]
+            with StatTools.stage("verify"):
+                FileReader.verify_payload(FileConstructor.pack_values(values, metadata.chr_rep), metadata)
+            values = FileReader.to_native(values, metadata)
+            StatTools.count_values(values)
 
-            #add current value to list
-            values.append(current_value)
+            return values
 
-        return values
+    @staticmethod
+    def verify_payload(payload, metadata: Metadata, checksum: int=None):
+        """
+        Checks the payload of a binary file against the length and CRC32 recorded in its extended header.
+        Legacy 1-byte headers record neither, so their payload is not checked.
+
+        Parameters:
+        payload (bytes-like): all bytes after the header, or None if only checksum is given
+        metadata (Metadata): metadata of the file
+        checksum (int): CRC32 already computed over the payload, computed from payload if not provided
+        """
+        if metadata.checksum is None:
+            return
+
+        if payload is not None:
+            if len(payload) != metadata.payload_size:
+                raise Exception("Binary file is truncated or has trailing data")
+            checksum = zlib.crc32(payload)
 
+        if checksum != metadata.checksum:
+            raise Exception("Checksum mismatch: binary file is corrupted")
 
     @staticmethod
-    def list_from_csv(file_name: str, is_float: bool = True):
+    def to_native(values, metadata: Metadata):
+        """
+        Converts values read from a binary file to the byte order of this machine
+
+        Parameters:
+        values: numpy.ndarray, array.array or list read from the file
+        metadata (Metadata): metadata of the file
+
+        Returns:
+        numpy.ndarray: values in native byte order (array.array or list if NumPy is not installed)
+        """
+        if metadata.is_native:
+            return values
+
+        return ArrayTools.swap_byte_order(values, metadata.chr_rep)
+
+
+    @staticmethod
+    def iter_decoded_chunks(f, metadata: Metadata, chunk_size: int):
+        """
+        Reads the values of a decoded binary file a chunk at a time
+
+        Parameters:
+        f (file): binary file object positioned after the metadata of a decoded binary file
+        metadata (Metadata): metadata of the file
+        chunk_size (int): number of values per chunk
+
+        Yields:
+        numpy.ndarray: up to chunk_size values (array.array or list if NumPy is not installed)
+        """
+        checksum = 0
+        payload_size = 0
+        while True:
+            chunk = f.read(chunk_size * metadata.num_size)
+            if not chunk:
+                break
+
+            if len(chunk) % metadata.num_size:
+                raise Exception("Elements not correctly stored in binary file")
+
+            checksum = zlib.crc32(chunk, checksum)
+            payload_size += len(chunk)
+            StatTools.count(bytes_read=len(chunk))
+            yield FileReader.to_native(ArrayTools.from_bytes(chunk, metadata.chr_rep), metadata)
+
+        #the checksum can only be checked once the whole payload has been read
+        if metadata.payload_size is not None and payload_size != metadata.payload_size:
+            raise Exception("Binary file is truncated or has trailing data")
+        FileReader.verify_payload(None, metadata, checksum)
+
+
+    @staticmethod
+    def list_from_csv(file_name: str, is_float: bool = True, rows: tuple=(0, 1), column: int=None):
         """
         From a CSV file of numbers, retrieves values, and populates and returns list with numbers
 
         Parameters:
         file_name (str): CSV file path to be read
         is_float (bool): Type of numerical values stored in CSV (True for floats or False for integers)
+        rows (tuple): (first row, row after last) to read, defaults to the first row only; None reads all rows
+        column (int): if provided, only this column of each row is read
 
         Returns:
         list: a list of numerical values found in CSV
         """
 
+        values = []
+        with open(file_name, 'r', newline='') as f:
+            #iterate through values found in CSV
+            for cells in FileReader.iter_csv_cells(f, rows, column):
+                values += FileReader.parse_csv_cells(cells, float if is_float else int)
+        
+        return values
+
+    @staticmethod
+    def iter_csv_cells(f, rows: tuple=None, column: int=None, chunk_size: int=DEFAULT_CHUNK_SIZE):
+        """
+        Streams the cells of a CSV file in chunks without reading the whole file
+
+        Parameters:
+        f (file): CSV file object opened for reading
+        rows (tuple): (first row, row after last) to read, None reads all rows
+        column (int): if provided, only this column of each row is read
+        chunk_size (int): approximate number of cells per chunk
+
+        Yields:
+        list: cells (strings), in row order
+        """
+        f_reader = csv.reader(f, delimiter=",")
+        if rows is not None:
+            f_reader = itertools.islice(f_reader, rows[0], rows[1])
 
+        cells = []
+        for row in f_reader:
+            if column is None:
+                cells += row
+            elif column < len(row):
+                cells.append(row[column])
+
+            if len(cells) >= chunk_size:
+                yield cells
+                cells = []
+
+        if cells:
+            yield cells
+
+    @staticmethod
+    def parse_csv_cells(cells: list, convert, strict: bool=False):
+        """
+        Converts CSV cells to numbers one at a time
+
+        Parameters:
+        cells (list): cells read from CSV
+        convert: float or int
+        strict (bool): raise an error for non-numerical cells instead of skipping them
+
+        Returns:
+        list: converted values
+        """
         values = []
-        with open(file_name, 'r') as f:
-            #read contents from CSV
-            f_reader = csv.reader(f, delimiter=",")
-            read_values = list(f_reader)[0]
+        for val in cells:
+            try:
+                values.append(convert(val))
+            except ValueError:
+                if strict:
+                    raise Exception(f"Non-numerical value in CSV: {val!r}")
+                #if non-numerical value, continue and don't add to list
 
-            #iterate through values found in CSV
-            for val in read_values:
+        return values
+
+    @staticmethod
+    def iter_csv_chunks(file_name: str, chr_rep: str='d', rows: tuple=None, column: int=None, strict: bool=False,
+                        chunk_size: int=DEFAULT_CHUNK_SIZE):
+        """
+        Streams the values of a CSV file as typed arrays, converting a whole chunk of cells at a time
+
+        Parameters:
+        file_name (str): CSV file path to be read
+        chr_rep (str): struct module character representation of data type of the values
+        rows (tuple): (first row, row after last) to read, None reads all rows
+        column (int): if provided, only this column of each row is read
+        strict (bool): raise an error for non-numerical cells instead of skipping them
+        chunk_size (int): approximate number of values per chunk
+
+        Yields:
+        numpy.ndarray: values of a chunk (list if NumPy is not installed)
+        """
+        if chr_rep == BFLOAT16:
+            raise Exception("CSV values cannot be converted to bfloat16")
+        convert = float if DataHelper.type_from_letter(chr_rep) == 'float' else int
+
+        #bool cells are parsed as integers (casting the text would make "0" True), any non-zero integer is True
+        is_bool = chr_rep == '?'
+        parse_dtype = 'q' if is_bool else chr_rep
+
+        with open(file_name, 'r', newline='') as f:
+            for cells in FileReader.iter_csv_cells(f, rows, column, chunk_size):
+                if np is None:
+                    values = FileReader.parse_csv_cells(cells, convert, strict)
+                    yield [value != 0 for value in values] if is_bool else values
+                    continue
+
+                #vectorized conversion, falling back to a cell by cell pass to find non-numerical cells
                 try:
-                    if is_float:
-                        values.append(float(val))
-                    else:
-                        values.append(int(val))
+                    values = np.array(cells, dtype=ArrayTools.dtype_from_letter(parse_dtype))
                 except ValueError:
-                    #if non-numerical value, continue and don't add to list
-                    pass
-        
-        return values
-    
+                    values = ArrayTools.to_array(FileReader.parse_csv_cells(cells, convert, strict), parse_dtype)
+
+                yield values != 0 if is_bool else values
+
+            #the text layer cannot tell its position while rows are being iterated, the byte layer can
+            StatTools.count(bytes_read=f.buffer.tell())
+
     @staticmethod
     def metadata_from_binary(file_name: str):
         """
@@ -238,21 +573,76 @@ class FileReader:
         -The size of each numerical value stored
         -Representative character used by struct package for data type
 
+        Only the header of the file is read.
+
         Parameters:
         file_name (str): A binary file from which metadata is being extracted
 
         Returns
+        Metadata: unpacks into the following values
         int: 0 if file is decoded or 1 if bit mask encoded
         int: 0 if integers are stored or 1 if floats are stored
         int: the number of values stored in the last bit mask for an encoded file
         int: the size of numerical values in bytes 
         str: the representative character used by struct for data type stored in file
         """
-        #read file and get first byte 
         with open(file_name, 'rb') as f:
-            file_bytes = f.read()
-        
-        first_byte = file_bytes[0]
+            return FileReader.read_metadata(f)
+
+    @staticmethod
+    def read_metadata(f):
+        """
+        Reads and parses the header at the start of an open binary file, leaving the file positioned after it
+
+        Parameters:
+        f (file): binary file object opened for reading at the start of the file
+
+        Returns
+        Metadata: metadata stored in file header
+        """
+        with StatTools.stage("metadata"):
+            header = f.read(1)
+            if header:
+                header += f.read(FileReader.header_size(header[0]) - 1)
+            StatTools.count(bytes_read=len(header))
+
+            return FileReader.metadata_from_bytes(header)
+
+    @staticmethod
+    def header_size(first_byte: int):
+        """
+        Returns the size of a header from its first byte
+
+        Parameters:
+        first_byte (int): first byte of a binary file
+
+        Returns:
+        int: 1 for a legacy header, EXTENDED_HEADER_SIZE for an extended header
+        """
+        if first_byte & _extended_header_marker == _extended_header_marker:
+            return EXTENDED_HEADER_SIZE
+
+        return 1
+
+    @staticmethod
+    def metadata_from_bytes(header: bytes):
+        """
+        Parses metadata from the header bytes at the start of a binary file, which can be a legacy
+        1-byte header or an extended header
+
+        Parameters:
+        header (bytes): bytes at the start of a binary file
+
+        Returns
+        Metadata: metadata stored in header
+        """
+        if not header:
+            raise Exception("Binary file is empty")
+
+        first_byte = header[0]
+
+        if FileReader.header_size(first_byte) == EXTENDED_HEADER_SIZE:
+            return FileReader.metadata_from_extended_header(header)
 
         #check if encoded 
         encoded = BitTools.get_bit(first_byte, 7)
@@ -271,70 +661,312 @@ class FileReader:
         #get size in bytes 
         size = struct.calcsize(chr_rep)
 
-        return encoded, is_float, num_last_values, size, chr_rep
+        return Metadata(encoded, is_float, num_last_values, size, chr_rep)
+
+    @staticmethod
+    def metadata_from_extended_header(header: bytes):
+        """
+        Parses metadata from an extended header (see FileConstructor.create_header)
+
+        Parameters:
+        header (bytes): bytes at the start of a binary file
+
+        Returns
+        Metadata: metadata stored in header
+        """
+        if len(header) < EXTENDED_HEADER_SIZE:
+            raise Exception("Binary file header is truncated")
+
+        (first_byte, magic, version, letter, size, byte_order, flags,
+         length, payload_size, checksum, mode, chunk_shift, codec, level) = _extended_header.unpack_from(header)
+
+        if magic != _header_magic:
+            raise Exception("Binary file header is corrupted")
+        if version > HEADER_VERSION:
+            raise Exception(f"Binary file header version {version} is not supported")
+
+        type_letter = letter.decode("ascii")
+        chr_rep = DataHelper.storage_letter(type_letter)
+        is_float = int(DataHelper.type_from_letter(type_letter) == 'float')
+
+        #native sized types (e.g. 'l') can differ in size between machines, such values are read with the
+        #letter of their recorded size (8-byte longs are read as 'q' or 'Q' where 'l' is 4 bytes)
+        if struct.calcsize(chr_rep) != size:
+            chr_rep = type_letter = DataHelper.letter_from_size(is_float, size, DataHelper.is_signed(chr_rep))
+            if struct.calcsize(chr_rep) != size:
+                raise Exception(f"{size} byte values of type {letter.decode('ascii')!r} are not supported on this machine")
+
+        encoded = BitTools.get_bit(first_byte, 7)
+        last_values = length % 8 if encoded else 0
+
+        if not flags & _flag_checked:
+            payload_size = checksum = None
+
+        return Metadata(encoded, is_float, last_values, size, chr_rep, EXTENDED_HEADER_SIZE, version, length,
+                        payload_size, checksum, _byte_orders[byte_order], mode, 1 << chunk_shift if chunk_shift else None,
+                        codec, level if codec != CODEC_NONE else None, type_letter)
 
     
 class FileConverter:
     @staticmethod
-    def csv_to_binary_file(file_name: str, chr_rep='d'):
+    def csv_to_binary_file(file_name: str, chr_rep='d', output_file_name=None, rows: tuple=None, column: int=None,
+                           strict: bool=False, chunk_size: int=DEFAULT_CHUNK_SIZE, fsync: bool=False):
         """
-        Takes a CSV file, extracts integers stored in the CSV file, and creates a decoded binary file that stores integers
+        Takes a CSV file, extracts numbers stored in the CSV file, and creates a decoded binary file that stores them.
+        The CSV file is read and the binary file written a chunk at a time, so memory use does not grow with file size.
 
         Parameters:
         file_name (str): The CSV file that will be converted to a binary file
+        chr_rep (str): struct module character representation of data type to store
+        output_file_name (str or file): name of binary file to create (defaults to CSV name with .bin extension) or a writable binary file object
+        rows (tuple): (first row, row after last) to read, None reads all rows
+        column (int): if provided, only this column of each row is read
+        strict (bool): raise an error for non-numerical cells instead of skipping them
+        chunk_size (int): approximate number of values converted at a time
+        fsync (bool): flush the file to disk before it replaces any existing file
 
         Returns:
         str: created binary file name
         """
 
-        #get data from file and store in list
-        is_float = (DataHelper.type_from_letter(chr_rep) == 'float')
-        
-        values = FileReader.list_from_csv(file_name, is_float)
-        
+        with StatTools.operation("convert", file_name):
+            chunks = StatTools.timed(FileReader.iter_csv_chunks(file_name, chr_rep, rows, column, strict, chunk_size), "parse")
+
+            #write to file object if one is provided
+            if hasattr(output_file_name, "write"):
+                FileConstructor.chunks_to_binary_file(chunks, chr_rep, output_file_name)
+                return getattr(output_file_name, "name", None)
 
-        #convert it to binary file 
-        return FileConstructor.list_to_binary_file(values, chr_rep, file_name) 
+            output_file_name = FileConstructor.binary_file_name(output_file_name or file_name)
+            with FileConstructor.atomic_output(output_file_name, fsync) as f:
+                FileConstructor.chunks_to_binary_file(chunks, chr_rep, f)
+
+            return output_file_name
 
 class FileConstructor:
     @staticmethod
-    def list_to_binary_file(values: list, chr_rep: str, output_file_name: str=None):
+    def list_to_binary_file(values, chr_rep: str, output_file_name=None, fsync: bool=False):
         """
-        Creates a decoded binary file from a list of integers.
-        The function is called from other functions which extracted a list of integers from existing files.
+        Creates a decoded binary file from a list of values.
+        The function is called from other functions which extracted a list of values from existing files.
+        Values are packed with one call, so writing is linear in the number of values.
 
         Parameters:
-        values (list): list of integer values to be written to decoded binary file
-        output_file_name (str): desired name of created binary file or existing file from which list was retrieved; should include file extension
+        values: list, array.array, NumPy array or other buffer-protocol object of values to be written to decoded
+                binary file; bytes, bytearray and memoryview objects of unsigned bytes are
+                written as already packed values
+        chr_rep (str): struct module character representation of data type, or BFLOAT16 for 16-bit patterns of bfloat16 values
+        output_file_name (str or file): desired name of created binary file or existing file from which list was
+                                        retrieved (should include file extension), or a writable binary file object
+        fsync (bool): flush the file to disk before it replaces any existing file
 
         Returns:
-        str: name of created binary file
+        str: name of created binary file (name of file object, if it has one)
         """
 
+        #Create header of binary file with metadata, followed by packed values
+        storage_letter = DataHelper.storage_letter(chr_rep)
+        payload = FileConstructor.pack_values(values, storage_letter)
+        header = FileConstructor.create_header(False, chr_rep, len(payload) // struct.calcsize(storage_letter), payload)
+
+        #Write to file object if one is provided
+        if hasattr(output_file_name, "write"):
+            output_file_name.write(header)
+            output_file_name.write(payload)
+            return getattr(output_file_name, "name", None)
+
         #get name of output file and add .bin extension
+        output_file_name = FileConstructor.binary_file_name(output_file_name)
+
+        with FileConstructor.atomic_output(output_file_name, fsync) as f:
+            f.write(header)
+            f.write(payload)
+
+        return output_file_name
+
+    @staticmethod
+    def chunks_to_binary_file(chunks, chr_rep: str, output):
+        """
+        Writes a decoded binary file from an iterable of value chunks, one chunk at a time
+
+        Parameters:
+        chunks: iterable of lists or arrays of values
+        chr_rep (str): struct module character representation of data type
+        output (file): writable, seekable binary file object
+
+        Returns:
+        int: number of values written
+        """
+        with PayloadWriter(output, False, chr_rep) as writer:
+            for chunk in chunks:
+                StatTools.count_values(chunk)
+                writer.write(FileConstructor.pack_values(chunk, DataHelper.storage_letter(chr_rep)), len(chunk))
+
+        return writer.length
+
+    @staticmethod
+    def pack_values(values, chr_rep: str):
+        """
+        Packs values into their binary form without copying them one at a time
+
+        Parameters:
+        values: list, array.array, NumPy array or other buffer-protocol object of values; bytes, bytearray
+                and memoryview objects of unsigned bytes are treated as already packed values
+        chr_rep (str): struct module character representation of data type
+
+        Returns:
+        bytes-like: packed values (a memoryview over values when they are already in the right format)
+        """
+        num_size = struct.calcsize(chr_rep)
+
+        #buffers already holding values of this type (or raw packed bytes) are written as they are,
+        #typed arrays of unsigned bytes (NumPy uint8, array.array('B')) hold values and are converted
+        try:
+            view = memoryview(values)
+        except TypeError:
+            view = None
+
+        if view is not None and view.c_contiguous:
+            if view.format.lstrip('@') == chr_rep and view.itemsize == num_size:
+                return view.cast('B')
+            if view.format == 'B' and isinstance(values, (bytes, bytearray, memoryview)):
+                if view.nbytes % num_size:
+                    raise Exception("Packed values are not a multiple of the element size")
+                return view
+
+        return ArrayTools.to_bytes(ArrayTools.to_array(values, chr_rep), chr_rep)
+
+    @staticmethod
+    @contextlib.contextmanager
+    def atomic_output(file_name: str, fsync: bool=False):
+        """
+        Opens a temporary file next to file_name for writing and moves it over file_name with os.replace
+        once writing succeeds. An interrupted write leaves any existing file untouched, so files can be
+        converted in place safely.
+
+        Parameters:
+        file_name (str): file that will be created or replaced
+        fsync (bool): flush the file (and the directory entry) to disk before returning
+
+        Yields:
+        file: binary file object to write to
+        """
+        directory, base_name = os.path.split(os.path.abspath(file_name))
+        temp_name = os.path.join(directory, f".{base_name}.{os.getpid()}.{os.urandom(4).hex()}.tmp")
+
+        #create file with default permissions (or those of the file being replaced)
+        mode = stat.S_IMODE(os.stat(file_name).st_mode) if os.path.exists(file_name) else 0o666
+        f = os.fdopen(os.open(temp_name, os.O_WRONLY | os.O_CREAT | os.O_EXCL, mode), 'wb')
+        try:
+            with f:
+                yield f
+                if fsync:
+                    f.flush()
+                    os.fsync(f.fileno())
+
+            os.replace(temp_name, file_name)
+        except BaseException:
+            if os.path.exists(temp_name):
+                os.remove(temp_name)
+            raise
+
+        if fsync and hasattr(os, "O_DIRECTORY"):
+            directory_fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+            try:
+                os.fsync(directory_fd)
+            finally:
+                os.close(directory_fd)
+
+    @staticmethod
+    def open_output(output, fsync: bool=False):
+        """
+        Returns a context manager for writing to output: a file name is written atomically with
+        atomic_output, a file object is used as it is (and not closed)
+
+        Parameters:
+        output (str or file): file name or writable binary file object
+        fsync (bool): for file names, flush the file to disk before it replaces the target
+
+        Returns:
+        context manager yielding a binary file object
+        """
+        if hasattr(output, "write"):
+            return contextlib.nullcontext(output)
+
+        return FileConstructor.atomic_output(output, fsync)
+
+    @staticmethod
+    def binary_file_name(output_file_name: str=None):
+        """
+        Builds the name of a binary file to create, asking the user for one if no name is provided
+        and the program is running interactively
+
+        Parameters:
+        output_file_name (str): desired name of created binary file or existing file; any extension is replaced
+
+        Returns:
+        str: file name ending in .bin
+        """
         if not output_file_name:
+            if not sys.stdin or not sys.stdin.isatty():
+                raise Exception("Output file name must be provided when not running interactively")
+
             output_file_name = input("Enter name of file to store values in (no extensions just the name): ")
         else:
-            if "." in output_file_name:
-                #clear dot in file name
-                dot_index = output_file_name.index(".")
-                output_file_name = output_file_name[:dot_index]
+            #clear extension of file name
+            output_file_name = os.path.splitext(output_file_name)[0]
 
-        output_file_name += ".bin"
+        return output_file_name + ".bin"
 
-        
-        #Create first byte of binary file with metadata
-        bytes_string = FileConstructor.create_first_byte(False, chr_rep)
+    @staticmethod
+    def create_header(encoded: bool, chr_rep: str, length: int, payload=None, payload_size: int=None, checksum: int=None,
+                      byte_order: str=sys.byteorder, mode: int=MODE_BITMASK, chunk_size: int=None, codec: int=CODEC_NONE,
+                      level: int=None):
+        """
+        Creates the extended header written at the start of binary files (EXTENDED_HEADER_SIZE bytes, little-endian):
+        -first byte: encoded flag and values in last bit mask as in create_first_byte, low 4 bits set
+        -magic b'BM', header version, struct type letter, element size, byte order of values, flags
+        -number of values (u64), payload length in bytes (u64), CRC32 of the payload (u32)
+        -encoding mode, log2 of the chunk (or frame) size, secondary codec, codec level
+
+        Parameters:
+        encoded (bool): true if encoded, false if file is decoded
+        chr_rep (str): the character representation of data type used by struct module, or BFLOAT16
+        length (int): number of values stored in the file
+        payload (bytes-like): all bytes written after the header, used for payload_size and checksum if provided
+        payload_size (int): payload length in bytes, if payload is not provided
+        checksum (int): CRC32 of the payload, if payload is not provided
+        byte_order (str): 'little' or 'big', byte order of the stored values
+        mode (int): encoding mode of an encoded file (MODE_BITMASK, MODE_ADAPTIVE or MODE_BITMASK64)
+        chunk_size (int): number of values per chunk for MODE_ADAPTIVE or per frame with a codec, must be a power of two
+        codec (int): secondary codec of a bit mask encoded file (CODEC_NONE, CODEC_ZLIB, CODEC_LZMA or CODEC_BZ2)
+        level (int): compression level of the codec (defaults to DEFAULT_LEVELS of the codec)
 
-        #Go through values in list and add them in byte form to bytes object
-        for value in values:
-            bytes_string += struct.pack(chr_rep, value)
+        Returns:
+        bytes: header that should be written to a binary file
+        """
+        if codec != CODEC_NONE and mode != MODE_BITMASK:
+            raise Exception("Secondary codecs are only supported in bit mask mode")
+        if level is None:
+            level = DEFAULT_LEVELS[codec]
 
-        #Write bytes string to file 
-        with open(output_file_name, 'wb') as f:
-            f.write(bytes_string)
+        chunk_shift = 0
+        if chunk_size is not None:
+            if chunk_size < 8 or chunk_size & (chunk_size - 1):
+                raise Exception("Chunk size must be a power of two of at least 8")
+            chunk_shift = chunk_size.bit_length() - 1
 
-        return output_file_name
+        if payload is not None:
+            payload_size = memoryview(payload).nbytes
+            checksum = zlib.crc32(payload)
+
+        #payload length and checksum are optional for writers that cannot seek back to the header
+        flags = _flag_checked if checksum is not None else 0
+
+        first_byte = (int(bool(encoded)) << 7) | ((length % 8 if encoded else 0) << 4) | _extended_header_marker
+        return _extended_header.pack(first_byte, _header_magic, HEADER_VERSION, chr_rep.encode("ascii"),
+                                     struct.calcsize(DataHelper.storage_letter(chr_rep)), _byte_orders.index(byte_order), flags,
+                                     length, payload_size or 0, checksum or 0, mode, chunk_shift, codec, level)
 
     @staticmethod
     def create_first_byte(encoded: bool, chr_rep: str, last_mask_remainder: int=0):
@@ -378,12 +1010,89 @@ class FileConstructor:
         #convert string to integer and return bytes object
         byte_string_as_int = int(byte_string, 2)
         return byte_string_as_int.to_bytes(1, "little")
-        
 
 
+class PayloadWriter:
+    """
+    Writes the header and payload of a binary file incrementally. The element count, payload length and
+    checksum are only known once everything is written, so the header is rewritten on close. Outputs that
+    cannot seek are supported when the number of values is given up front; their header then records no
+    payload length or checksum.
+    """
+
+    def __init__(self, output, encoded: bool, chr_rep: str, length: int=None, byte_order: str=sys.byteorder,
+                 mode: int=MODE_BITMASK, chunk_size: int=None, codec: int=CODEC_NONE, level: int=None):
+        """
+        Parameters:
+        output: binary file object the file is written to (must be seekable if length is not given)
+        encoded (bool): true if the payload is encoded
+        chr_rep (str): struct module character representation of data type (type letter recorded in the header)
+        length (int): total number of values that will be written, if known
+        byte_order (str): 'little' or 'big', byte order of the payload values
+        mode (int): encoding mode of an encoded payload
+        chunk_size (int): number of values per chunk for chunked encoding modes, or per frame with a codec
+        codec (int): secondary codec of a bit mask encoded payload
+        level (int): compression level of the codec
+        """
+        self.output = output
+        self.encoded = encoded
+        self.chr_rep = chr_rep
+        self.byte_order = byte_order
+        self.mode = mode
+        self.chunk_size = chunk_size
+        self.codec = codec
+        self.level = level
+        self.length = 0
+        self.payload_size = 0
+        self.checksum = 0
+        self._expected_length = length
+
+        #remember where the header goes so it can be rewritten on close
+        seekable = getattr(output, "seekable", lambda: False)()
+        if length is None and not seekable:
+            raise Exception("Output must be seekable when the number of values is not given")
+
+        self._header_position = output.tell() if seekable else None
+        header = FileConstructor.create_header(encoded, chr_rep, length or 0, byte_order=byte_order, mode=mode,
+                                               chunk_size=chunk_size, codec=codec, level=level)
+        output.write(header)
+        StatTools.count(bytes_written=len(header))
+
+    def write(self, payload, count: int):
+        """
+        Writes payload bytes
+
+        Parameters:
+        payload (bytes-like): packed or encoded values
+        count (int): number of values the payload adds
+        """
+        with StatTools.stage("write"):
+            self.output.write(payload)
+            self.checksum = zlib.crc32(payload, self.checksum)
+        self.payload_size += memoryview(payload).nbytes
+        self.length += count
+        StatTools.count(bytes_written=memoryview(payload).nbytes)
+
+    def close(self):
+        """
+        Rewrites the header with the final element count, payload length and checksum
+        """
+        if self._expected_length is not None and self._expected_length != self.length:
+            raise Exception("Number of values written does not match expected length")
+
+        if self._header_position is None:
+            return
 
+        end_position = self.output.tell()
+        self.output.seek(self._header_position)
+        self.output.write(FileConstructor.create_header(self.encoded, self.chr_rep, self.length, None, self.payload_size,
+                                                        self.checksum, self.byte_order, self.mode, self.chunk_size,
+                                                        self.codec, self.level))
+        self.output.seek(end_position)
 
+    def __enter__(self):
+        return self
 
-        
-    
-    
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
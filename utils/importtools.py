@@ -0,0 +1,46 @@
+import importlib
+import importlib.util
+
+
+class LazyModule:
+    """
+    Stand-in for a heavy module (NumPy, torch) that imports it on first attribute access, so command line
+    tools that never use it do not pay for importing it at startup. Once imported, the module's attributes
+    are copied onto the stand-in and later lookups cost the same as on the module itself.
+    """
+
+    def __init__(self, name: str):
+        """
+        Parameters:
+        name (str): name of the module to import when first used
+        """
+        self.__dict__["_lazy_name"] = name
+
+    def __getattr__(self, attribute: str):
+        #only called for attributes not found yet, i.e. before the import and for attributes the module creates lazily
+        module = importlib.import_module(self._lazy_name)
+        self.__dict__.update(module.__dict__)
+        return getattr(module, attribute)
+
+    def __repr__(self):
+        return f"LazyModule({self._lazy_name!r})"
+
+    @staticmethod
+    def optional(name: str):
+        """
+        Returns a lazy stand-in for an optional module, finding the module without importing it
+
+        Parameters:
+        name (str): name of the module
+
+        Returns:
+        LazyModule: stand-in importing the module when first used (None if the module is not installed)
+        """
+        try:
+            if importlib.util.find_spec(name) is None:
+                return None
+        except (ImportError, ValueError):
+            #ValueError is raised for modules set to None in sys.modules (i.e. blocked)
+            return None
+
+        return LazyModule(name)
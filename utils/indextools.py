@@ -0,0 +1,307 @@
+import array
+import mmap
+import os
+import struct
+import sys
+from utils.arraytools import ArrayTools
+from utils.bittools import BitTools
+from utils.codectools import CODEC_NONE
+from utils.filetools import MODE_BITMASK, FileReader, FileConstructor, Metadata
+from utils.masktools import MaskTools
+
+#default number of bit masks between two checkpoints of a block index
+DEFAULT_INDEX_INTERVAL = 64
+
+
+class BlockIndex:
+    """
+    Byte offsets of every Nth bit mask of a bit mask encoded file, stored in a sidecar file next to it
+    (file name + '.idx'). Any value can then be found by seeking to the nearest checkpoint and
+    decoding at most N masks.
+
+    Sidecar layout (little-endian): magic b'BMIX', version byte, 3 padding bytes, interval (u64),
+    number of masks (u64), size (u64) and modification time in ns (i64) of the encoded file when the
+    index was saved, then one i64 offset per checkpoint.
+    """
+
+    _magic = b'BMIX'
+    _version = 1
+    _header = struct.Struct('<4sB3xQQQq')
+
+    def __init__(self, offsets, interval: int, num_masks: int):
+        """
+        Parameters:
+        offsets (array.array): offset of every interval-th mask from the start of the file
+        interval (int): number of masks between two checkpoints
+        num_masks (int): total number of masks in the encoded file
+        """
+        self.offsets = offsets
+        self.interval = interval
+        self.num_masks = num_masks
+
+    @staticmethod
+    def index_file_name(file_name: str):
+        """
+        Returns the name of the sidecar index file of an encoded file
+        """
+        return file_name + ".idx"
+
+    @staticmethod
+    def from_mask_offsets(mask_offsets, header_size: int, interval: int):
+        """
+        Creates an index from the positions of all masks in the encoded stream
+
+        Parameters:
+        mask_offsets: positions of every mask relative to the end of the metadata
+        header_size (int): size of the metadata at the start of the file
+        interval (int): number of masks between two checkpoints
+
+        Returns:
+        BlockIndex: index of the file
+        """
+        if interval <= 0:
+            raise Exception("Index interval must be positive")
+
+        offsets = array.array('q', (int(offset) + header_size for offset in mask_offsets[::interval]))
+        return BlockIndex(offsets, interval, len(mask_offsets))
+
+    @staticmethod
+    def build(file_name: str, interval: int=DEFAULT_INDEX_INTERVAL, metadata: Metadata=None):
+        """
+        Builds the index of an existing encoded file with one linear scan over its masks
+
+        Parameters:
+        file_name (str): bit mask encoded binary file
+        interval (int): number of masks between two checkpoints
+        metadata (Metadata): metadata already read from file, read from the file header if not provided
+
+        Returns:
+        BlockIndex: index of the file
+        """
+        with open(file_name, 'rb') as f:
+            if metadata is None:
+                metadata = FileReader.read_metadata(f)
+
+            if not metadata.is_encoded or metadata.mode != MODE_BITMASK or metadata.codec != CODEC_NONE:
+                raise Exception("File provided is not a bit mask encoded binary file")
+
+            f.seek(metadata.header_size)
+            encoded_bytes = f.read()
+
+        mask_offsets = MaskTools.mask_offsets(encoded_bytes, metadata.num_size)
+        return BlockIndex.from_mask_offsets(mask_offsets, metadata.header_size, interval)
+
+    @staticmethod
+    def load(file_name: str):
+        """
+        Loads the sidecar index of an encoded file
+
+        Parameters:
+        file_name (str): bit mask encoded binary file (not the index file)
+
+        Returns:
+        BlockIndex: index of the file, or None if there is no index or it does not match the file
+        """
+        index_file = BlockIndex.index_file_name(file_name)
+        if not os.path.exists(index_file):
+            return None
+
+        with open(index_file, 'rb') as f:
+            header = f.read(BlockIndex._header.size)
+            offsets_bytes = f.read()
+
+        if len(header) != BlockIndex._header.size:
+            return None
+
+        magic, version, interval, num_masks, file_size, file_mtime = BlockIndex._header.unpack(header)
+        if magic != BlockIndex._magic or version != BlockIndex._version:
+            return None
+
+        #index is stale if the encoded file changed since it was saved
+        file_stats = os.stat(file_name)
+        if file_size != file_stats.st_size or file_mtime != file_stats.st_mtime_ns:
+            return None
+
+        offsets = array.array('q')
+        offsets.frombytes(offsets_bytes)
+        if sys.byteorder == "big":
+            offsets.byteswap()
+
+        return BlockIndex(offsets, interval, num_masks)
+
+    @staticmethod
+    def for_file(file_name: str, interval: int=DEFAULT_INDEX_INTERVAL, metadata: Metadata=None):
+        """
+        Loads the index of an encoded file, rebuilding and saving it if it is missing or stale
+
+        Parameters:
+        file_name (str): bit mask encoded binary file
+        interval (int): number of masks between two checkpoints if the index has to be rebuilt
+        metadata (Metadata): metadata already read from file, read from the file header if not provided
+
+        Returns:
+        BlockIndex: index of the file
+        """
+        index = BlockIndex.load(file_name)
+        if index is None:
+            index = BlockIndex.build(file_name, interval, metadata)
+            index.save(file_name)
+
+        return index
+
+    def save(self, file_name: str, fsync: bool=False):
+        """
+        Writes the index to the sidecar file of an encoded file. Must be called after the encoded file is written.
+
+        Parameters:
+        file_name (str): bit mask encoded binary file (not the index file)
+        fsync (bool): flush the index file to disk before it replaces any existing index
+        """
+        offsets = array.array('q', self.offsets)
+        if sys.byteorder == "big":
+            offsets.byteswap()
+
+        file_stats = os.stat(file_name)
+        with FileConstructor.atomic_output(BlockIndex.index_file_name(file_name), fsync) as f:
+            f.write(BlockIndex._header.pack(BlockIndex._magic, BlockIndex._version, self.interval, self.num_masks,
+                                            file_stats.st_size, file_stats.st_mtime_ns))
+            f.write(offsets.tobytes())
+
+
+class EncodedReader:
+    """
+    Random access to the values of a bit mask encoded file through a block index. The file is
+    memory mapped and only the masks between the nearest checkpoint and the requested values are decoded.
+    """
+
+    def __init__(self, file_name: str, index: BlockIndex=None, metadata: Metadata=None):
+        """
+        Parameters:
+        file_name (str): bit mask encoded binary file
+        index (BlockIndex): index of the file, loaded or rebuilt if not provided
+        metadata (Metadata): metadata already read from file, read from the file header if not provided
+        """
+        self.file_name = file_name
+        self._file = open(file_name, 'rb')
+
+        if metadata is None:
+            metadata = FileReader.read_metadata(self._file)
+
+        if not metadata.is_encoded or metadata.mode != MODE_BITMASK or metadata.codec != CODEC_NONE:
+            self._file.close()
+            raise Exception("File provided is not a bit mask encoded binary file")
+
+        self.metadata = metadata
+        self.index = index if index is not None else BlockIndex.for_file(file_name, metadata=metadata)
+        self._length = MaskTools.decoded_length(self.index.num_masks, metadata.last_values)
+        self._steps = [1 + count * metadata.num_size for count in BitTools._popcount_table]
+
+        #an empty file cannot be mapped
+        file_size = os.path.getsize(file_name)
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if file_size > metadata.header_size else None
+
+    @property
+    def mmap(self):
+        """
+        mmap.mmap: the underlying memory map (None for a file without values)
+        """
+        return self._mmap
+
+    def __len__(self):
+        return self._length
+
+    def __getitem__(self, index):
+        """
+        Reads a single value or a contiguous slice of values
+
+        Parameters:
+        index (int or slice): position(s) of values to read
+
+        Returns:
+        int or float: for an integer index
+        numpy.ndarray: for a slice (array.array or list if NumPy is not installed)
+        """
+        if isinstance(index, slice):
+            indices = range(*index.indices(self._length))
+            if not indices:
+                return ArrayTools.zeros(0, self.metadata.chr_rep)
+
+            #decode the contiguous range covering the slice
+            low = min(indices[0], indices[-1])
+            high = max(indices[0], indices[-1]) + 1
+            return self.slice(low, high)[indices[0] - low::indices.step]
+
+        return self.get(index)
+
+    def get(self, position: int):
+        """
+        Reads the value at a position
+
+        Parameters:
+        position (int): index of the value (negative indices count from the end)
+
+        Returns:
+        int or float: value stored at position
+        """
+        if position < 0:
+            position += self._length
+        if not 0 <= position < self._length:
+            raise IndexError("Index out of range")
+
+        return self.slice(position, position + 1)[0]
+
+    def slice(self, start: int, stop: int):
+        """
+        Reads the values from start up to (not including) stop
+
+        Parameters:
+        start (int): index of first value
+        stop (int): index after the last value
+
+        Returns:
+        numpy.ndarray: values in range (array.array or list if NumPy is not installed)
+        """
+        start = max(start, 0)
+        stop = min(stop, self._length)
+        if start >= stop:
+            return ArrayTools.zeros(0, self.metadata.chr_rep)
+
+        first_mask = start // 8
+        last_mask = (stop - 1) // 8
+
+        #hop from the nearest checkpoint to the first mask needed
+        checkpoint = first_mask // self.index.interval
+        position = self.index.offsets[checkpoint]
+        for _ in range(first_mask - checkpoint * self.index.interval):
+            position += self._steps[self._mmap[position]]
+
+        #hop over the masks in the range to find where they end
+        offsets = array.array('q')
+        for _ in range(last_mask - first_mask + 1):
+            offsets.append(position)
+            position += self._steps[self._mmap[position]]
+
+        values = MaskTools.decode_blocks(self._mmap, offsets, self.metadata.chr_rep, position)
+        skip = start - first_mask * 8
+        return FileReader.to_native(values[skip:skip + stop - start], self.metadata)
+
+    def close(self):
+        """
+        Closes the memory map and the file. Values returned by the reader are decoded copies and stay valid.
+        If views over the mapping itself still exist (e.g. a memoryview of mmap), the mapping stays alive
+        and is unmapped when the last of them is deleted.
+        """
+        if self._mmap is not None:
+            try:
+                self._mmap.close()
+            except BufferError:
+                #views still use the mapping, the mmap object unmaps itself once they release it
+                pass
+
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
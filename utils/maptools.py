@@ -0,0 +1,154 @@
+import mmap
+import os
+import struct
+from utils.arraytools import ArrayTools, np
+from utils.filetools import FileReader, Metadata
+
+
+class MappedReader:
+    """
+    Memory maps a decoded binary file so values can be read by index or slice without reading the
+    whole file. Only the pages holding the requested values are loaded by the operating system.
+
+    The mapping is copy-on-write: arrays returned by the reader are writable, but writes never
+    reach the file. Only the element count of the header is checked; the payload checksum is not
+    verified, since that would read the whole file.
+    """
+
+    def __init__(self, file_name: str, metadata: Metadata=None):
+        """
+        Parameters:
+        file_name (str): decoded binary file
+        metadata (Metadata): metadata already read from file, read from the file header if not provided
+        """
+        self.file_name = file_name
+        self._file = open(file_name, 'rb')
+
+        if metadata is None:
+            metadata = FileReader.read_metadata(self._file)
+
+        #if not decoded raise error
+        if metadata.is_encoded:
+            self._file.close()
+            raise Exception("File provided is not a bit mask decoded binary file")
+
+        self.metadata = metadata
+        self.chr_rep = metadata.chr_rep
+        self.num_size = metadata.num_size
+
+        #make sure file is correctly stored (should be divisible by element size)
+        payload_size = os.path.getsize(file_name) - metadata.header_size
+        if payload_size % self.num_size:
+            self._file.close()
+            raise Exception("Elements not correctly stored in binary file")
+
+        self._length = payload_size // self.num_size
+        if metadata.length is not None and metadata.length != self._length:
+            self._file.close()
+            raise Exception("Binary file is truncated or has trailing data")
+
+        self._struct = struct.Struct(self.chr_rep)
+
+        #an empty file cannot be mapped
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_COPY) if payload_size else None
+
+    def __len__(self):
+        return self._length
+
+    def __getitem__(self, index):
+        """
+        Reads a single value or a slice of values
+
+        Parameters:
+        index (int or slice): position(s) of values to read
+
+        Returns:
+        int or float: for an integer index
+        numpy.ndarray: for a slice, a view over the mapped file (array.array or list if NumPy is not installed)
+        """
+        if isinstance(index, slice):
+            if np is not None:
+                return self.array[index]
+
+            indices = range(*index.indices(self._length))
+            if not indices:
+                return ArrayTools.zeros(0, self.chr_rep)
+
+            #only unpack the bytes covering the slice
+            low = min(indices[0], indices[-1])
+            high = max(indices[0], indices[-1]) + 1
+            values = ArrayTools.from_bytes(self._payload_bytes(low, high), self.chr_rep)
+            return FileReader.to_native(values, self.metadata)[indices[0] - low::index.step or 1]
+
+        if index < 0:
+            index += self._length
+        if not 0 <= index < self._length:
+            raise IndexError("Index out of range")
+
+        if not self.metadata.is_native:
+            return FileReader.to_native(ArrayTools.from_bytes(self._payload_bytes(index, index + 1), self.chr_rep), self.metadata)[0]
+
+        return self._struct.unpack_from(self._mmap, self.metadata.header_size + index * self.num_size)[0]
+
+    def _payload_bytes(self, start: int, stop: int):
+        """
+        Returns the bytes holding values from start up to (not including) stop
+        """
+        header_size = self.metadata.header_size
+        return self._mmap[header_size + start * self.num_size:header_size + stop * self.num_size]
+
+    @property
+    def buffer(self):
+        """
+        memoryview: zero-copy view over the packed values (without metadata)
+        """
+        if self._mmap is None:
+            return memoryview(b'')
+
+        return memoryview(self._mmap)[self.metadata.header_size:]
+
+    @property
+    def array(self):
+        """
+        numpy.ndarray: zero-copy array over the mapped values (requires NumPy). Values stored in the
+        other byte order get a non-native dtype.
+        """
+        if np is None:
+            raise Exception("NumPy is required for array access, use buffer instead")
+
+        if self._mmap is None:
+            return ArrayTools.zeros(0, self.chr_rep)
+
+        dtype = ArrayTools.dtype_from_letter(self.chr_rep)
+        if not self.metadata.is_native:
+            dtype = dtype.newbyteorder()
+
+        return np.frombuffer(self._mmap, dtype=dtype, count=self._length, offset=self.metadata.header_size)
+
+    @property
+    def mmap(self):
+        """
+        mmap.mmap: the underlying memory map (None for a file without values)
+        """
+        return self._mmap
+
+    def close(self):
+        """
+        Closes the file and unmaps it. Arrays and views over the mapping that still exist (from array, buffer,
+        slices or TorchConverter.binary_to_tensor) stay valid: they keep the mapping alive, and it is
+        unmapped when the last of them is deleted.
+        """
+        if self._mmap is not None:
+            try:
+                self._mmap.close()
+            except BufferError:
+                #views still use the mapping, the mmap object unmaps itself once they release it
+                pass
+
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
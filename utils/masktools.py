@@ -0,0 +1,469 @@
+import array
+import re
+import struct
+from utils.arraytools import ArrayTools, np
+from utils.bittools import BitTools
+
+
+#finds the next non-zero byte, used to skip runs of empty bit masks
+_non_zero_byte = re.compile(b"[^\\x00]")
+
+
+class MaskTools:
+    @staticmethod
+    def encode(values, chr_rep: str):
+        """
+        Bit mask encodes a sequence of numerical values. Every 8 values are stored as one mask byte
+        (first value in the most significant bit) followed by the non-zero values of that group.
+
+        Parameters:
+        values: list, array.array, NumPy array or other sequence of numerical values
+        chr_rep (str): struct module character representation of data type
+
+        Returns:
+        bytes: interleaved masks and non-zero values (without the metadata byte)
+        """
+        if np is None:
+            return MaskTools._encode_python(values, chr_rep)
+
+        values = ArrayTools.to_array(values, chr_rep).reshape(-1)
+        num_size = values.dtype.itemsize
+
+        #one flag per element, packed 8 at a time (zero padded at the end)
+        non_zero = values != 0
+        masks = np.packbits(non_zero)
+
+        #each block is one mask byte followed by its non-zero values
+        block_sizes = 1 + MaskTools._popcounts(masks) * num_size
+        block_ends = np.cumsum(block_sizes)
+        total_size = int(block_ends[-1]) if len(block_ends) else 0
+
+        #write masks at block starts and non-zero values everywhere else in one pass
+        encoded = np.empty(total_size, dtype=np.uint8)
+        is_mask = np.zeros(total_size, dtype=bool)
+        is_mask[block_ends - block_sizes] = True
+        encoded[is_mask] = masks
+        encoded[~is_mask] = np.ascontiguousarray(values[non_zero]).view(np.uint8)
+
+        return encoded.tobytes()
+
+    @staticmethod
+    def _encode_python(values, chr_rep: str):
+        """
+        Pure Python fallback for encode used when NumPy is not installed
+        """
+        pack = struct.Struct(chr_rep).pack
+        encoded = bytearray()
+
+        for start in range(0, len(values), 8):
+            group = values[start:start + 8]
+
+            #first element of group is stored in the most significant bit
+            bit_mask = 0
+            for i, element in enumerate(group):
+                if element != 0:
+                    bit_mask = BitTools.set_bit(bit_mask, 7 - i)
+
+            encoded.append(bit_mask)
+            for element in group:
+                if element != 0:
+                    encoded += pack(element)
+
+        return bytes(encoded)
+
+    @staticmethod
+    def encode_sparse(indices, values, length: int, chr_rep: str):
+        """
+        Bit mask encodes values given by the positions and values of their non-zero elements, without
+        creating the dense array. Produces the same bytes as encode would for the dense values.
+
+        Parameters:
+        indices: sorted, unique positions of the non-zero values (NumPy array, array.array or list)
+        values: non-zero values at those positions (zeros among them are dropped)
+        length (int): number of values, zeros included
+        chr_rep (str): struct module character representation of data type
+
+        Returns:
+        bytes: interleaved bit masks and non-zero values
+        """
+        num_size = struct.calcsize(chr_rep)
+        num_masks = (length + 7) // 8
+
+        if np is None:
+            return MaskTools._encode_sparse_python(indices, values, num_masks, chr_rep)
+
+        indices = np.asarray(indices, dtype=np.int64)
+        values = ArrayTools.to_array(values, chr_rep)
+        non_zero = values != 0
+        indices = indices[non_zero]
+        values = values[non_zero]
+
+        #set the bit of every non-zero value in its mask (first element in the most significant bit)
+        groups = indices >> 3
+        masks = np.zeros(num_masks, dtype=np.uint8)
+        np.bitwise_or.at(masks, groups, (128 >> (indices & 7)).astype(np.uint8))
+
+        #each block is one mask byte followed by its non-zero values
+        block_sizes = 1 + MaskTools._popcounts(masks) * num_size
+        block_starts = np.cumsum(block_sizes) - block_sizes
+        encoded = np.zeros(int(block_starts[-1] + block_sizes[-1]) if num_masks else 0, dtype=np.uint8)
+        encoded[block_starts] = masks
+
+        #values follow their mask in order, so the rank of a value within its mask gives its place
+        ranks = np.arange(len(indices)) - np.searchsorted(groups, groups)
+        value_starts = block_starts[groups] + 1 + ranks * num_size
+        positions = (value_starts[:, None] + np.arange(num_size)).reshape(-1)
+        encoded[positions] = np.ascontiguousarray(values).view(np.uint8)
+
+        return encoded.tobytes()
+
+    @staticmethod
+    def _encode_sparse_python(indices, values, num_masks: int, chr_rep: str):
+        """
+        Pure Python fallback for encode_sparse used when NumPy is not installed
+        """
+        pack = struct.Struct(chr_rep).pack
+        encoded = bytearray()
+        group = -1
+        mask_position = 0
+
+        for index, value in zip(indices, values):
+            if value == 0:
+                continue
+
+            if index // 8 != group:
+                #empty masks between the previous non-empty mask and this one
+                encoded += bytes(index // 8 - group - 1)
+                group = index // 8
+                mask_position = len(encoded)
+                encoded.append(0)
+
+            encoded[mask_position] = BitTools.set_bit(encoded[mask_position], 7 - index % 8)
+            encoded += pack(value)
+
+        encoded += bytes(num_masks - group - 1)
+        return bytes(encoded)
+
+    @staticmethod
+    def block_offsets(values, chr_rep: str):
+        """
+        Computes where each bit mask will be placed when values are encoded, without encoding them
+
+        Parameters:
+        values: list, array.array or NumPy array of values
+        chr_rep (str): struct module character representation of data type
+
+        Returns:
+        numpy.ndarray: positions of the masks in the encoded stream (array.array if NumPy is not installed)
+        """
+        num_size = struct.calcsize(chr_rep)
+
+        if np is None:
+            offsets = array.array('q')
+            position = 0
+            for start in range(0, len(values), 8):
+                offsets.append(position)
+                position += 1 + sum(1 for element in values[start:start + 8] if element != 0) * num_size
+            return offsets
+
+        values = ArrayTools.to_array(values, chr_rep).reshape(-1)
+        block_sizes = 1 + MaskTools._popcounts(np.packbits(values != 0)) * num_size
+        return np.cumsum(block_sizes) - block_sizes
+
+    @staticmethod
+    def mask_offsets(buffer, num_size: int, start: int=0, end: int=None):
+        """
+        Finds the position of every bit mask in an encoded stream. Each block is one mask byte followed by
+        popcount(mask) values, so positions are found by hopping from mask to mask. Runs of empty masks are
+        skipped in one step.
+
+        Parameters:
+        buffer (bytes-like): interleaved masks and non-zero values
+        num_size (int): size of each value in bytes
+        start (int): position of the first mask in buffer
+        end (int): position where the encoded stream ends (defaults to end of buffer)
+
+        Returns:
+        array.array: positions of the masks in buffer
+        """
+        if end is None:
+            end = len(buffer)
+
+        offsets, position = MaskTools.complete_blocks(buffer, num_size, start, end)
+
+        if position != end:
+            raise Exception("Bit mask encoded data is truncated or corrupted")
+
+        return offsets
+
+    @staticmethod
+    def complete_blocks(buffer, num_size: int, start: int=0, end: int=None):
+        """
+        Finds the position of every bit mask whose block (mask and values) fits completely in the buffer.
+        Used when encoded data arrives in chunks and the last block may be cut off.
+
+        Parameters:
+        buffer (bytes-like): interleaved masks and non-zero values
+        num_size (int): size of each value in bytes
+        start (int): position of the first mask in buffer
+        end (int): position where the available data ends (defaults to end of buffer)
+
+        Returns:
+        array.array: positions of the masks of complete blocks in buffer
+        int: position where the complete blocks end
+        """
+        if end is None:
+            end = len(buffer)
+
+        #bytes give fast integer indexing for the hop loop
+        if not isinstance(buffer, bytes):
+            buffer = bytes(buffer)
+
+        steps = [1 + count * num_size for count in BitTools._popcount_table]
+        offsets = array.array('q')
+        position = start
+
+        while position < end:
+            if buffer[position] == 0:
+                #every byte in a run of zero bytes starting at a mask is itself an empty mask
+                match = _non_zero_byte.search(buffer, position, end)
+                run_end = match.start() if match else end
+                offsets.extend(range(position, run_end))
+                position = run_end
+            else:
+                block_end = position + steps[buffer[position]]
+                if block_end > end:
+                    break
+
+                offsets.append(position)
+                position = block_end
+
+        return offsets, position
+
+    @staticmethod
+    def decoded_length(num_masks: int, last_values: int):
+        """
+        Returns the number of values stored by a number of masks, given the number of values in the last mask
+
+        Parameters:
+        num_masks (int): number of bit masks in the encoded stream
+        last_values (int): values stored in the last mask (0 if the last mask is full)
+
+        Returns:
+        int: number of values stored
+        """
+        if num_masks == 0:
+            return 0
+        if last_values == 0:
+            return num_masks * 8
+
+        return (num_masks - 1) * 8 + last_values
+
+    @staticmethod
+    def decode(buffer, chr_rep: str, last_values: int=0, length: int=None):
+        """
+        Decodes interleaved bit masks and non-zero values. Masks are located first, then the values are
+        scattered into a preallocated zero filled array using the expanded mask bits.
+
+        Parameters:
+        buffer (bytes-like): interleaved masks and non-zero values (without the metadata byte)
+        chr_rep (str): struct module character representation of data type
+        last_values (int): number of values stored in the last mask (0 if the last mask is full)
+        length (int): number of values stored, if recorded in the file header (checked against the masks found)
+
+        Returns:
+        numpy.ndarray: decoded values (array.array or list if NumPy is not installed)
+        """
+        num_size = struct.calcsize(chr_rep)
+        offsets = MaskTools.mask_offsets(buffer, num_size)
+        decoded_length = MaskTools.decoded_length(len(offsets), last_values)
+
+        if length is not None and length != decoded_length:
+            raise Exception("Bit mask encoded data is truncated or corrupted")
+
+        return MaskTools.decode_blocks(buffer, offsets, chr_rep, length=decoded_length)
+
+    @staticmethod
+    def decode_blocks(buffer, offsets, chr_rep: str, end: int=None, length: int=None):
+        """
+        Decodes the complete blocks found by mask_offsets or complete_blocks, producing 8 values per mask
+
+        Parameters:
+        buffer (bytes-like): interleaved masks and non-zero values
+        offsets (array.array): positions of the masks in buffer
+        chr_rep (str): struct module character representation of data type
+        end (int): position where the blocks end (defaults to end of buffer)
+        length (int): number of values to decode if the last mask is not full (defaults to 8 per mask)
+
+        Returns:
+        numpy.ndarray: decoded values, 8 per mask (array.array or list if NumPy is not installed)
+        """
+        if length is None:
+            length = len(offsets) * 8
+
+        if np is None:
+            return MaskTools._decode_python(buffer, offsets, chr_rep, length)
+
+        if not len(offsets):
+            return ArrayTools.zeros(0, chr_rep)
+
+        if end is None:
+            end = len(buffer)
+
+        #only look at the bytes between the first mask and the end of the blocks
+        offsets = np.frombuffer(offsets, dtype=np.int64)
+        encoded = np.frombuffer(buffer, dtype=np.uint8, count=end)[offsets[0]:]
+        offsets = offsets - offsets[0]
+
+        #separate masks from the packed non-zero values
+        is_mask = np.zeros(len(encoded), dtype=bool)
+        is_mask[offsets] = True
+        masks = encoded[offsets]
+        non_zero_values = encoded[~is_mask].view(ArrayTools.dtype_from_letter(chr_rep))
+
+        #scatter non-zero values to the positions of set bits into an array of the exact length
+        values = ArrayTools.zeros(length, chr_rep)
+        values[np.unpackbits(masks, count=length).view(bool)] = non_zero_values
+
+        return values
+
+    @staticmethod
+    def _decode_python(buffer, offsets, chr_rep: str, length: int):
+        """
+        Pure Python fallback for decode_blocks used when NumPy is not installed
+        """
+        unpack_from = struct.Struct(chr_rep).unpack_from
+        num_size = struct.calcsize(chr_rep)
+        values = ArrayTools.zeros(len(offsets) * 8, chr_rep)
+
+        for mask_number, offset in enumerate(offsets):
+            bit_mask = buffer[offset]
+            position = offset + 1
+            for i in range(8):
+                if BitTools.get_bit(bit_mask, 7 - i):
+                    values[mask_number * 8 + i] = unpack_from(buffer, position)[0]
+                    position += num_size
+
+        return values[:length] if length < len(values) else values
+
+    @staticmethod
+    def non_empty_blocks(buffer, num_size: int, start: int=0, end: int=None):
+        """
+        Finds the blocks of non-empty bit masks, counting empty masks without recording them. Used by
+        sparse decoding, which only needs the masks that hold values.
+
+        Parameters:
+        buffer (bytes-like): interleaved masks and non-zero values
+        num_size (int): size of each value in bytes
+        start (int): position of the first mask in buffer
+        end (int): position where the encoded stream ends (defaults to end of buffer)
+
+        Returns:
+        array.array: number (position in the stream of masks) of every non-empty mask
+        array.array: positions of the non-empty masks in buffer
+        int: total number of masks, empty ones included
+        """
+        if end is None:
+            end = len(buffer)
+
+        #bytes give fast integer indexing for the hop loop
+        if not isinstance(buffer, bytes):
+            buffer = bytes(buffer)
+
+        steps = [1 + count * num_size for count in BitTools._popcount_table]
+        mask_numbers = array.array('q')
+        offsets = array.array('q')
+        mask_number = 0
+        position = start
+
+        while position < end:
+            if buffer[position] == 0:
+                #a run of zero bytes is a run of empty masks
+                match = _non_zero_byte.search(buffer, position, end)
+                run_end = match.start() if match else end
+                mask_number += run_end - position
+                position = run_end
+                continue
+
+            mask_numbers.append(mask_number)
+            offsets.append(position)
+            mask_number += 1
+            position += steps[buffer[position]]
+
+        if position != end:
+            raise Exception("Bit mask encoded data is truncated or corrupted")
+
+        return mask_numbers, offsets, mask_number
+
+    @staticmethod
+    def decode_sparse(buffer, chr_rep: str, last_values: int=0, length: int=None):
+        """
+        Decodes interleaved bit masks and non-zero values into the positions and values of the non-zero
+        values, without creating the decoded array
+
+        Parameters:
+        buffer (bytes-like): interleaved masks and non-zero values (without the metadata byte)
+        chr_rep (str): struct module character representation of data type
+        last_values (int): number of values stored in the last mask (0 if the last mask is full)
+        length (int): number of values stored, if recorded in the file header (checked against the masks found)
+
+        Returns:
+        numpy.ndarray: int64 positions of the non-zero values (array.array of 'q' if NumPy is not installed)
+        numpy.ndarray: non-zero values (array.array or list if NumPy is not installed)
+        """
+        num_size = struct.calcsize(chr_rep)
+        mask_numbers, offsets, num_masks = MaskTools.non_empty_blocks(buffer, num_size)
+        decoded_length = MaskTools.decoded_length(num_masks, last_values)
+
+        if length is not None and length != decoded_length:
+            raise Exception("Bit mask encoded data is truncated or corrupted")
+
+        if np is None:
+            return MaskTools._decode_sparse_python(buffer, mask_numbers, offsets, chr_rep)
+
+        encoded = np.frombuffer(buffer, dtype=np.uint8)
+        mask_numbers = np.frombuffer(mask_numbers, dtype=np.int64)
+        offsets = np.frombuffer(offsets, dtype=np.int64)
+
+        #positions of the set bits of every non-empty mask
+        masks = encoded[offsets]
+        blocks, bits = np.nonzero(np.unpackbits(masks[:, None], axis=1))
+        indices = mask_numbers[blocks] * 8 + bits
+        if len(indices) and indices[-1] >= decoded_length:
+            raise Exception("Bit mask encoded data is corrupted")
+
+        #value bytes follow each mask
+        value_sizes = MaskTools._popcounts(masks) * num_size
+        value_starts = offsets + 1 - (np.cumsum(value_sizes) - value_sizes)
+        positions = np.repeat(value_starts, value_sizes) + np.arange(int(value_sizes.sum()))
+
+        return indices, encoded[positions].view(ArrayTools.dtype_from_letter(chr_rep))
+
+    @staticmethod
+    def _decode_sparse_python(buffer, mask_numbers, offsets, chr_rep: str):
+        """
+        Pure Python fallback for decode_sparse used when NumPy is not installed
+        """
+        unpack_from = struct.Struct(chr_rep).unpack_from
+        num_size = struct.calcsize(chr_rep)
+        indices = array.array('q')
+        values = []
+
+        for mask_number, offset in zip(mask_numbers, offsets):
+            bit_mask = buffer[offset]
+            position = offset + 1
+            for i in range(8):
+                if BitTools.get_bit(bit_mask, 7 - i):
+                    indices.append(mask_number * 8 + i)
+                    values.append(unpack_from(buffer, position)[0])
+                    position += num_size
+
+        return indices, array.array(chr_rep, values) if chr_rep in array.typecodes else values
+
+    @staticmethod
+    def _popcounts(masks):
+        """
+        Returns number of set bits for every byte in a NumPy uint8 array
+        """
+        table = np.array(BitTools._popcount_table, dtype=np.int64)
+        return table[masks]
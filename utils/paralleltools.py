@@ -0,0 +1,225 @@
+import array
+import os
+import struct
+import sys
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from utils.arraytools import ArrayTools, np
+from utils.chunktools import DEFAULT_ADAPTIVE_CHUNK_SIZE
+from utils.codectools import CODEC_NONE
+from utils.encoder import Encoder
+from utils.filetools import MODE_BITMASK, MODE_BITMASK64, FileReader, FileConstructor, Metadata
+from utils.indextools import DEFAULT_INDEX_INTERVAL, BlockIndex
+from utils.masktools import MaskTools
+from utils.widemasktools import WideMaskTools, WideRunJoiner
+
+#default number of values encoded by one worker task
+DEFAULT_SEGMENT_SIZE = 1 << 22
+
+
+class ParallelCoder:
+    """
+    Encodes and decodes large files on several cores. The values are split into segments of whole
+    bit masks, so encoded segments can simply be concatenated and the output is byte-identical to
+    Encoder.encode_bin_file. Workers read their own segment from the file, so only results are sent
+    between processes.
+    """
+
+    @staticmethod
+    def encode_bin_file(file_name: str, workers: int=None, segment_size: int=DEFAULT_SEGMENT_SIZE, metadata: Metadata=None,
+                        output=None, fsync: bool=False, mode: int=MODE_BITMASK,
+                        adaptive_chunk_size: int=DEFAULT_ADAPTIVE_CHUNK_SIZE, codec: int=CODEC_NONE, level: int=None):
+        """
+        Bit mask encodes a decoded binary file using a pool of worker processes
+
+        Parameters:
+        file_name (str): decoded binary file, replaced by its encoded form
+        workers (int): number of worker processes (defaults to number of CPUs, 1 runs in this process)
+        segment_size (int): number of values per worker task, must be a multiple of 8
+        metadata (Metadata): metadata already read from file, read from the file header if not provided
+        output (str or file): encoded file name or writable binary file object, file_name is (atomically) replaced if not provided
+        fsync (bool): flush the encoded file to disk before it replaces any existing file
+        mode (int): MODE_BITMASK, MODE_ADAPTIVE or MODE_BITMASK64 (segment_size must hold whole masks or chunks)
+        adaptive_chunk_size (int): number of values per chunk for MODE_ADAPTIVE
+        codec (int): secondary codec for bit mask mode (segment_size must hold whole frames)
+        level (int): compression level of the codec
+        """
+        #segments must hold whole masks (or chunks or frames) so they can be encoded independently
+        block_size = Encoder.block_size(mode, adaptive_chunk_size, codec)
+        if segment_size <= 0 or segment_size % block_size:
+            raise Exception(f"Segment size must be a positive multiple of {block_size}")
+
+        chunk_size = Encoder.mode_chunk_size(mode, adaptive_chunk_size, codec)
+
+        if metadata is None:
+            metadata = FileReader.metadata_from_binary(file_name)
+
+        if metadata.is_encoded:
+            raise Exception("File provided is not a bit mask decoded binary file")
+
+        payload_size = os.path.getsize(file_name) - metadata.header_size
+        if payload_size % metadata.num_size:
+            raise Exception("Elements not correctly stored in binary file")
+
+        length = payload_size // metadata.num_size
+        if metadata.length is not None and length != metadata.length:
+            raise Exception("Binary file is truncated or has trailing data")
+
+        #byte ranges of each segment in the decoded file
+        segment_bytes = segment_size * metadata.num_size
+        segments = [(start, min(start + segment_bytes, payload_size)) for start in range(0, payload_size, segment_bytes)]
+        tasks = [(file_name, metadata.header_size + start, end - start, metadata.chr_rep, not metadata.is_native, mode,
+                  adaptive_chunk_size, codec, level) for start, end in segments]
+
+        results = ParallelCoder._run(_encode_segment, tasks, workers)
+
+        #runs of empty 64-bit masks can span segments, they are merged so the output matches Encoder.encode_bin_file
+        if mode == MODE_BITMASK64:
+            joiner = WideRunJoiner()
+            encoded_segments = [joiner.join(encoded_bytes, trailing) for encoded_bytes, trailing in results] + [joiner.finish()]
+        else:
+            encoded_segments = [encoded_bytes for encoded_bytes, _ in results]
+
+        #values are encoded in the byte order of this machine, like Encoder.encode_bin_file
+        checksum = 0
+        for encoded_bytes in encoded_segments:
+            checksum = zlib.crc32(encoded_bytes, checksum)
+        header = FileConstructor.create_header(True, metadata.type_letter, length, None, sum(map(len, encoded_segments)),
+                                               checksum, sys.byteorder, mode, chunk_size, codec, level)
+
+        with FileConstructor.open_output(file_name if output is None else output, fsync) as f:
+            f.write(header)
+            for encoded_bytes in encoded_segments:
+                f.write(encoded_bytes)
+
+    @staticmethod
+    def decode_bin_file(file_name: str, workers: int=None, segment_size: int=DEFAULT_SEGMENT_SIZE, metadata: Metadata=None,
+                        output=None, fsync: bool=False):
+        """
+        Decodes a bit mask encoded binary file using a pool of worker processes. Segment boundaries
+        come from the sidecar block index of the file. Without one, the masks are found with one serial
+        scan in this process, which limits the speedup of more workers (save a BlockIndex next to files
+        decoded repeatedly); each worker then gets the positions of its masks instead of scanning again.
+
+        Parameters:
+        file_name (str): bit mask encoded binary file, replaced by its decoded form
+        workers (int): number of worker processes (defaults to number of CPUs, 1 runs in this process)
+        segment_size (int): approximate number of values per worker task
+        metadata (Metadata): metadata already read from file, read from the file header if not provided
+        output (str or file): decoded file name or writable binary file object, file_name is (atomically) replaced if not provided
+        fsync (bool): flush the decoded file to disk before it replaces any existing file
+        """
+        if metadata is None:
+            metadata = FileReader.metadata_from_binary(file_name)
+
+        if not metadata.is_encoded:
+            raise Exception("File provided is not a bit mask encoded binary file")
+        if metadata.mode != MODE_BITMASK or metadata.codec != CODEC_NONE:
+            raise Exception("Parallel decoding is only supported for bit mask mode without a codec")
+
+        #byte offsets of the masks where segments start
+        index = BlockIndex.load(file_name)
+        mask_offsets = None
+        if index is None:
+            with open(file_name, 'rb') as f:
+                f.seek(metadata.header_size)
+                mask_offsets = MaskTools.mask_offsets(f.read(), metadata.num_size)
+            index = BlockIndex.from_mask_offsets(mask_offsets, metadata.header_size, DEFAULT_INDEX_INTERVAL)
+
+        checkpoints_per_segment = max(1, segment_size // (8 * index.interval))
+        masks_per_segment = checkpoints_per_segment * index.interval
+        starts = list(index.offsets[::checkpoints_per_segment])
+        ends = starts[1:] + [os.path.getsize(file_name)]
+
+        tasks = []
+        for position, (start, end) in enumerate(zip(starts, ends)):
+            segment_offsets = None
+            if mask_offsets is not None:
+                segment_offsets = _shift_offsets(mask_offsets[position * masks_per_segment:(position + 1) * masks_per_segment],
+                                                 start - metadata.header_size)
+            tasks.append((file_name, start, end - start, metadata.chr_rep, segment_offsets))
+
+        length = MaskTools.decoded_length(index.num_masks, metadata.last_values)
+        if metadata.length is not None and length != metadata.length:
+            raise Exception("Bit mask encoded data is truncated or corrupted")
+
+        #all segments are decoded before the file is replaced
+        decoded_segments = ParallelCoder._run(_decode_segment, tasks, workers)
+
+        #drop the values past the end of the last bit mask
+        remaining = length * metadata.num_size
+        for position, decoded_bytes in enumerate(decoded_segments):
+            decoded_segments[position] = decoded_bytes[:max(remaining, 0)]
+            remaining -= len(decoded_bytes)
+
+        checksum = 0
+        for decoded_bytes in decoded_segments:
+            checksum = zlib.crc32(decoded_bytes, checksum)
+        header = FileConstructor.create_header(False, metadata.type_letter, length, None, length * metadata.num_size,
+                                               checksum, metadata.byte_order)
+
+        with FileConstructor.open_output(file_name if output is None else output, fsync) as f:
+            f.write(header)
+            for decoded_bytes in decoded_segments:
+                f.write(decoded_bytes)
+
+    @staticmethod
+    def _run(function, tasks: list, workers: int=None):
+        """
+        Runs function on every task, in a process pool unless a single worker is requested
+
+        Returns:
+        list: results in the order of the tasks
+        """
+        if workers is None:
+            workers = os.cpu_count() or 1
+
+        if workers == 1 or len(tasks) <= 1:
+            return [function(*task) for task in tasks]
+
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(function, *zip(*tasks)))
+
+
+def _encode_segment(file_name: str, start: int, size: int, chr_rep: str, swap: bool, mode: int, adaptive_chunk_size: int,
+                    codec: int, level: int):
+    """
+    Worker task: reads size bytes of decoded values at start and returns their encoded bytes, with the
+    number of empty 64-bit mask groups they end with in MODE_BITMASK64 (0 otherwise).
+    Values stored in the other byte order are swapped first, so zeros are found by value
+    (e.g. -0.0 is a zero) exactly as the serial encoder finds them.
+    """
+    with open(file_name, 'rb') as f:
+        f.seek(start)
+        values = ArrayTools.from_bytes(f.read(size), chr_rep)
+
+    if swap:
+        values = ArrayTools.swap_byte_order(values, chr_rep)
+
+    encoded_bytes = Encoder.encode_values(values, chr_rep, mode, adaptive_chunk_size, codec, level)
+    trailing = WideMaskTools.trailing_empty_groups(values) if mode == MODE_BITMASK64 else 0
+    return encoded_bytes, trailing
+
+
+def _decode_segment(file_name: str, start: int, size: int, chr_rep: str, offsets=None):
+    """
+    Worker task: reads size bytes of whole encoded blocks at start and returns their decoded bytes (8 values per mask).
+    The positions of the masks in the segment are found by scanning it, unless already known.
+    """
+    with open(file_name, 'rb') as f:
+        f.seek(start)
+        encoded_bytes = f.read(size)
+
+    if offsets is None:
+        offsets = MaskTools.mask_offsets(encoded_bytes, struct.calcsize(chr_rep))
+    return ArrayTools.to_bytes(MaskTools.decode_blocks(encoded_bytes, offsets, chr_rep), chr_rep)
+
+
+def _shift_offsets(offsets, shift: int):
+    """
+    Returns mask positions relative to the start of a segment
+    """
+    if np is not None:
+        return np.frombuffer(offsets, dtype=np.int64) - shift
+
+    return array.array('q', (offset - shift for offset in offsets))
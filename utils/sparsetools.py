@@ -0,0 +1,215 @@
+import array
+from utils.arraytools import ArrayTools, np
+from utils.chunktools import ChunkTools, DEFAULT_ADAPTIVE_CHUNK_SIZE
+from utils.codectools import CODEC_NONE, CodecTools
+from utils.encoder import StreamEncoder
+from utils.filetools import (DEFAULT_CHUNK_SIZE, MODE_ADAPTIVE, MODE_BITMASK, MODE_BITMASK64, FileConstructor, FileReader,
+                             Metadata)
+from utils.masktools import MaskTools
+from utils.typetools import DataHelper
+from utils.widemasktools import WideMaskTools
+
+
+class SparseTools:
+    """
+    Converts between encoded files and the sparse form of their values: the positions of the non-zero
+    values in the flat array (COO indices) and the values themselves. The masks of an encoded file
+    already hold the positions, so neither direction creates the dense array.
+    """
+
+    @staticmethod
+    def decode_payload(payload, metadata: Metadata):
+        """
+        Decodes the payload of an encoded file into the positions and values of its non-zero values,
+        with the encoding mode recorded in its header
+
+        Parameters:
+        payload (bytes-like): all bytes after the header
+        metadata (Metadata): metadata of the file
+
+        Returns:
+        numpy.ndarray: sorted int64 positions of the non-zero values (array.array of 'q' if NumPy is not installed)
+        numpy.ndarray: non-zero values in the byte order of the file (array.array or list if NumPy is not installed)
+        """
+        if metadata.codec != CODEC_NONE:
+            return CodecTools.decode_sparse(payload, metadata.chr_rep, metadata.length, metadata.codec, metadata.chunk_size)
+        if metadata.mode == MODE_BITMASK:
+            return MaskTools.decode_sparse(payload, metadata.chr_rep, metadata.last_values, metadata.length)
+        if metadata.mode == MODE_ADAPTIVE:
+            return ChunkTools.decode_sparse(payload, metadata.chr_rep, metadata.length, metadata.chunk_size)
+        if metadata.mode == MODE_BITMASK64:
+            return WideMaskTools.decode_sparse(payload, metadata.chr_rep, metadata.length)
+
+        raise Exception(f"Unknown encoding mode {metadata.mode}")
+
+    @staticmethod
+    def from_encoded(file_name: str, metadata: Metadata=None):
+        """
+        From a bit mask encoded .bin file, extracts the positions and values of the non-zero values
+
+        Parameters:
+        file_name (str): encoded .bin file with numerical values in binary form
+        metadata (Metadata): metadata already read from file, read from the file header if not provided
+
+        Returns:
+        numpy.ndarray: sorted int64 positions of the non-zero values (array.array of 'q' if NumPy is not installed)
+        numpy.ndarray: non-zero values (array.array or list if NumPy is not installed), 16-bit patterns for bfloat16
+        int: number of values stored, zeros included
+        """
+        with open(file_name, 'rb') as f:
+            if metadata is None:
+                metadata = FileReader.read_metadata(f)
+
+            if not metadata.is_encoded:
+                raise Exception("File provided is not a bit mask encoded binary file")
+
+            f.seek(metadata.header_size)
+            encoded_bytes = f.read()
+
+        FileReader.verify_payload(encoded_bytes, metadata)
+        indices, values = SparseTools.decode_payload(encoded_bytes, metadata)
+
+        #legacy headers do not record the number of values, the masks do
+        length = metadata.length
+        if length is None:
+            num_masks = MaskTools.non_empty_blocks(encoded_bytes, metadata.num_size)[2]
+            length = MaskTools.decoded_length(num_masks, metadata.last_values)
+
+        return indices, FileReader.to_native(values, metadata), length
+
+    @staticmethod
+    def to_csr(indices, values, shape: tuple):
+        """
+        Converts positions in a flat array of a 2D shape to compressed sparse row arrays, in the order
+        taken by scipy.sparse.csr_matrix((values, columns, row_starts), shape)
+
+        Parameters:
+        indices: sorted positions of the non-zero values in the flat array
+        values: non-zero values
+        shape (tuple): (rows, columns)
+
+        Returns:
+        numpy.ndarray: non-zero values (unchanged)
+        numpy.ndarray: int64 column of every value (array.array of 'q' if NumPy is not installed)
+        numpy.ndarray: int64 position in values of the first value of every row, followed by the number of values
+        """
+        num_rows, num_columns = shape
+
+        if np is not None:
+            indices = np.asarray(indices, dtype=np.int64)
+            row_starts = np.searchsorted(indices, np.arange(num_rows + 1, dtype=np.int64) * num_columns)
+            return values, indices % num_columns, row_starts.astype(np.int64)
+
+        columns = array.array('q', (index % num_columns for index in indices))
+        row_starts = array.array('q', [0] * (num_rows + 1))
+        for index in indices:
+            row_starts[index // num_columns + 1] += 1
+        for row in range(num_rows):
+            row_starts[row + 1] += row_starts[row]
+
+        return values, columns, row_starts
+
+    @staticmethod
+    def sort(indices, values, length: int, chr_rep: str):
+        """
+        Orders the positions and values of non-zero values by position, checking that every position
+        is in range and given once
+
+        Parameters:
+        indices: positions of the non-zero values in the flat array (any order)
+        values: values at those positions
+        length (int): number of values, zeros included
+        chr_rep (str): struct module character representation of data type
+
+        Returns:
+        numpy.ndarray: sorted int64 positions (list if NumPy is not installed)
+        numpy.ndarray: values in the same order (list if NumPy is not installed)
+        """
+        if len(indices) != len(values):
+            raise Exception("Sparse values need exactly one position per value")
+
+        if np is not None:
+            indices = np.asarray(indices, dtype=np.int64)
+            values = ArrayTools.to_array(values, chr_rep)
+            if len(indices) and np.any(indices[1:] <= indices[:-1]):
+                order = np.argsort(indices, kind="stable")
+                indices = indices[order]
+                values = values[order]
+            if len(indices) and (indices[0] < 0 or indices[-1] >= length or np.any(indices[1:] == indices[:-1])):
+                raise Exception("Sparse positions must be unique and within the number of values")
+            return indices, values
+
+        pairs = sorted(zip(indices, values), key=lambda pair: pair[0])
+        indices = [index for index, _ in pairs]
+        if pairs and (indices[0] < 0 or indices[-1] >= length
+                      or any(indices[i] == indices[i + 1] for i in range(len(indices) - 1))):
+            raise Exception("Sparse positions must be unique and within the number of values")
+
+        return indices, [value for _, value in pairs]
+
+    @staticmethod
+    def iter_dense_chunks(indices, values, length: int, chr_rep: str, chunk_size: int=DEFAULT_CHUNK_SIZE):
+        """
+        Yields the dense values a chunk at a time, so encodings that need dense values never hold more
+        than one chunk of them
+
+        Parameters:
+        indices: sorted, unique positions of the non-zero values
+        values: values at those positions
+        length (int): number of values, zeros included
+        chr_rep (str): struct module character representation of data type
+        chunk_size (int): number of values per chunk
+
+        Yields:
+        numpy.ndarray: dense values of a chunk (array.array or list if NumPy is not installed)
+        """
+        first = 0
+        for start in range(0, length, chunk_size):
+            end = min(start + chunk_size, length)
+            chunk = ArrayTools.zeros(end - start, chr_rep)
+
+            if np is not None:
+                last = int(np.searchsorted(indices, end))
+                chunk[indices[first:last] - start] = values[first:last]
+            else:
+                last = first
+                while last < len(indices) and indices[last] < end:
+                    chunk[indices[last] - start] = values[last]
+                    last += 1
+
+            first = last
+            yield chunk
+
+    @staticmethod
+    def to_encoded_file(indices, values, length: int, chr_rep: str, output, fsync: bool=False, mode: int=MODE_BITMASK,
+                        codec: int=CODEC_NONE, level: int=None, adaptive_chunk_size: int=DEFAULT_ADAPTIVE_CHUNK_SIZE):
+        """
+        Writes an encoded binary file from the positions and values of the non-zero values. Bit mask mode
+        without a codec is encoded straight from the sparse values; other modes encode the dense values a
+        chunk at a time.
+
+        Parameters:
+        indices: positions of the non-zero values in the flat array (any order)
+        values: values at those positions
+        length (int): number of values, zeros included
+        chr_rep (str): struct module character representation of data type, or BFLOAT16 for 16-bit patterns
+        output (str or file): encoded file name (written atomically) or writable binary file object
+        fsync (bool): flush a file given by name to disk before it replaces any existing file
+        mode (int): MODE_BITMASK, MODE_ADAPTIVE or MODE_BITMASK64
+        codec (int): secondary codec for bit mask mode
+        level (int): compression level of the codec
+        adaptive_chunk_size (int): number of values per chunk for MODE_ADAPTIVE
+        """
+        storage_letter = DataHelper.storage_letter(chr_rep)
+        indices, values = SparseTools.sort(indices, values, length, storage_letter)
+
+        with FileConstructor.open_output(output, fsync) as f:
+            if mode == MODE_BITMASK and codec == CODEC_NONE:
+                payload = MaskTools.encode_sparse(indices, values, length, storage_letter)
+                f.write(FileConstructor.create_header(True, chr_rep, length, payload))
+                f.write(payload)
+                return
+
+            with StreamEncoder(f, chr_rep, length, mode, adaptive_chunk_size, codec, level) as stream:
+                for chunk in SparseTools.iter_dense_chunks(indices, values, length, storage_letter):
+                    stream.write(chunk)
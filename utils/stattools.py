@@ -0,0 +1,231 @@
+import contextlib
+import threading
+import time
+from utils.arraytools import np
+
+#instrumentation is off unless enabled, instrumented code then only checks this flag
+_enabled = False
+_callbacks = []
+_local = threading.local()
+_disabled = contextlib.nullcontext()
+
+
+class PipelineReport:
+    """
+    Statistics of one encode, decode, convert or read operation: wall time of every stage, bytes read and
+    written, number of values and number of non-zero values. Stages entered several times (e.g. once per
+    chunk when streaming) accumulate their time.
+    """
+
+    def __init__(self, operation: str, file_name: str=None):
+        self.operation = operation
+        self.file_name = file_name
+        self.stages = {}
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self.elements = 0
+        self.non_zero = 0
+        self.seconds = 0.0
+        self.error = None
+
+    @property
+    def density(self):
+        """
+        Returns the fraction of non-zero values (0 if there are no values)
+        """
+        return self.non_zero / self.elements if self.elements else 0.0
+
+    def as_dict(self):
+        """
+        Returns:
+        dict: the report as plain values (JSON serializable)
+        """
+        return {"operation": self.operation, "file": self.file_name, "seconds": self.seconds, "stages": dict(self.stages),
+                "bytes_read": self.bytes_read, "bytes_written": self.bytes_written, "elements": self.elements,
+                "non_zero": self.non_zero, "density": self.density, "error": self.error}
+
+    def __repr__(self):
+        return f"PipelineReport({self.as_dict()!r})"
+
+
+class _Stage:
+    __slots__ = ("report", "name", "start")
+
+    def __init__(self, report: PipelineReport, name: str):
+        self.report = report
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.report.stages[self.name] = self.report.stages.get(self.name, 0.0) + time.perf_counter() - self.start
+
+
+class _Operation:
+    def __init__(self, report: PipelineReport):
+        self.report = report
+
+    def __enter__(self):
+        _local.report = self.report
+        self.start = time.perf_counter()
+        return self.report
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.report.seconds = time.perf_counter() - self.start
+        if exc_type is not None:
+            self.report.error = str(exc_value)
+        _local.report = None
+        _local.last = self.report
+
+        for callback in list(_callbacks):
+            callback(self.report)
+
+
+class StatTools:
+    """
+    Opt-in instrumentation of the encode and decode pipeline. While enabled, every top-level encode,
+    decode, convert or read call produces a PipelineReport, which is passed to the registered callbacks
+    and kept as the last report of the calling thread. Calls made inside another instrumented call add
+    to the report of the outer call.
+    """
+
+    @staticmethod
+    def enable(callback=None):
+        """
+        Turns instrumentation on for all threads
+
+        Parameters:
+        callback (function): optional function called with every finished PipelineReport
+        """
+        global _enabled
+        if callback is not None:
+            StatTools.add_callback(callback)
+        _enabled = True
+
+    @staticmethod
+    def disable():
+        """
+        Turns instrumentation off, leaving the registered callbacks in place
+        """
+        global _enabled
+        _enabled = False
+
+    @staticmethod
+    def is_enabled():
+        return _enabled
+
+    @staticmethod
+    def add_callback(callback):
+        """
+        Registers a function called with every finished PipelineReport (e.g. to feed a metrics system).
+        Callbacks run in the thread that made the call, so they should be quick and thread-safe.
+        """
+        _callbacks.append(callback)
+
+    @staticmethod
+    def remove_callback(callback):
+        _callbacks.remove(callback)
+
+    @staticmethod
+    def last_report():
+        """
+        Returns:
+        PipelineReport: report of the last instrumented call finished in this thread (None if there is none)
+        """
+        return getattr(_local, "last", None)
+
+    @staticmethod
+    def operation(name: str, file_name: str=None):
+        """
+        Context manager collecting a report for a top-level call. Yields the report, or None if
+        instrumentation is disabled or the call is nested inside another instrumented call.
+
+        Parameters:
+        name (str): kind of operation ("encode", "decode", "convert" or "read")
+        file_name (str): file the operation works on
+        """
+        if not _enabled or getattr(_local, "report", None) is not None:
+            return _disabled
+
+        return _Operation(PipelineReport(name, file_name))
+
+    @staticmethod
+    def stage(name: str):
+        """
+        Context manager adding the time spent in its block to a stage of the current report
+
+        Parameters:
+        name (str): name of the stage
+        """
+        if not _enabled:
+            return _disabled
+
+        report = getattr(_local, "report", None)
+        if report is None:
+            return _disabled
+
+        return _Stage(report, name)
+
+    @staticmethod
+    def count(bytes_read: int=0, bytes_written: int=0):
+        """
+        Adds bytes read and written to the current report
+        """
+        if not _enabled:
+            return
+
+        report = getattr(_local, "report", None)
+        if report is not None:
+            report.bytes_read += bytes_read
+            report.bytes_written += bytes_written
+
+    @staticmethod
+    def count_values(values):
+        """
+        Adds the number of values and non-zero values to the current report. Values are only
+        scanned while a report is being collected.
+
+        Parameters:
+        values: numpy.ndarray, array.array or list of values entering the pipeline
+        """
+        if not _enabled:
+            return
+
+        report = getattr(_local, "report", None)
+        if report is None:
+            return
+
+        report.elements += len(values)
+        if np is not None:
+            report.non_zero += int(np.count_nonzero(values))
+        else:
+            report.non_zero += sum(1 for value in values if value != 0)
+
+    @staticmethod
+    def timed(iterable, name: str):
+        """
+        Adds the time spent producing every item of an iterable (e.g. parsing chunks of a CSV file)
+        to a stage of the current report
+
+        Parameters:
+        iterable: iterable whose items are produced lazily
+        name (str): name of the stage
+
+        Returns:
+        iterable: the iterable itself if no report is being collected, otherwise a timed generator
+        """
+        if not _enabled or getattr(_local, "report", None) is None:
+            return iterable
+
+        return StatTools._timed(iter(iterable), name)
+
+    @staticmethod
+    def _timed(iterator, name: str):
+        while True:
+            with StatTools.stage(name):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
@@ -1,10 +1,20 @@
-import torch
-from utils.filetools import *
-from utils.typetools import *
+import math
+from utils.archivetools import ArchiveReader, ArchiveWriter
+from utils.arraytools import np
+from utils.cachetools import DecodedCache
+from utils.codectools import CODEC_NONE
+from utils.filetools import MODE_BITMASK, FileConstructor, FileReader, Metadata
+from utils.importtools import LazyModule
+from utils.maptools import MappedReader
+from utils.sparsetools import SparseTools
+from utils.typetools import BFLOAT16
+
+#torch is only imported once tensors are converted, so importing this module stays cheap
+torch = LazyModule("torch")
 
 class TorchConverter:
     @staticmethod
-    def dtype_to_character(torch_datatype: torch.dtype):
+    def dtype_to_character(torch_datatype: "torch.dtype"):
         """
         Translates a torch data type to a struct module character representation of data type
 
@@ -12,16 +22,22 @@ class TorchConverter:
         torch_datatype (torch.dtype): A torch datatype 
 
         Returns:
-        str: struct module character representation of torch datatype
+        str: struct module character representation of torch datatype (BFLOAT16 for torch.bfloat16)
         """
         torch_types_dict = {
             torch.float16: 'e',
             torch.float32: 'f',
             torch.float64: 'd',
+            torch.bfloat16: BFLOAT16,
             torch.int8: 'b',
             torch.int16: 'h',
             torch.int32: 'i',
-            torch.int64: 'l'
+            torch.int64: 'l',
+            torch.uint8: 'B',
+            torch.uint16: 'H',
+            torch.uint32: 'I',
+            torch.uint64: 'L',
+            torch.bool: '?'
         }
 
         return torch_types_dict[torch_datatype]
@@ -42,59 +58,245 @@ class TorchConverter:
             'e': torch.float16,
             'f': torch.float32,
             'd': torch.float64,
+            BFLOAT16: torch.bfloat16,
             'b': torch.int8,
             'h': torch.int16,
             'i': torch.int32,
-            'l': torch.int64
+            'l': torch.int64,
+            'q': torch.int64,
+            'B': torch.uint8,
+            'H': torch.uint16,
+            'I': torch.uint32,
+            'L': torch.uint64,
+            'Q': torch.uint64,
+            '?': torch.bool
         }
 
         return struct_types_dict[chr_rep]
     
     @staticmethod
-    def tensor_to_binary_file(tensor_values: torch.Tensor, output_file: str=None):
+    def tensor_to_binary_file(tensor_values: "torch.Tensor", output_file: str=None):
         """
-        Writes values in tensor to (non-encoded) binary file
+        Writes values in tensor to (non-encoded) binary file straight from the tensor's memory
 
         Parameters:
         tensor_values (torch.Tensor): tensor to be written to binary file
         output_file (str): output file to 
+
+        Returns:
+        str: name of created binary file
         """
 
-        #convert tensor to list
-        values_list = tensor_values.tolist()
+        values, chr_rep = TorchConverter.tensor_to_array(tensor_values)
+
+        #write metadata byte followed by the tensor's buffer
+        return FileConstructor.list_to_binary_file(values, chr_rep, output_file)
+
+    @staticmethod
+    def tensor_to_array(tensor_values: "torch.Tensor"):
+        """
+        Returns the values of a tensor as a flat NumPy array sharing memory with the tensor where possible
+
+        Parameters:
+        tensor_values (torch.Tensor): tensor of any shape and device
 
-        #get struct module datatype character
+        Returns:
+        numpy.ndarray: flat values (16-bit patterns for bfloat16)
+        str: struct module character representation of the tensor's datatype
+        """
         chr_rep = TorchConverter.dtype_to_character(tensor_values.dtype)
 
-        #create file and return path
-        return FileConstructor.list_to_binary_file(values_list, chr_rep, output_file)
-        
+        #flat contiguous CPU view of tensor (only copies if tensor is not already laid out that way)
+        flat_values = tensor_values.detach().cpu().contiguous().reshape(-1)
+
+        #NumPy has no bfloat16, its bit patterns are used instead
+        if flat_values.dtype == torch.bfloat16:
+            flat_values = flat_values.view(torch.uint16)
+
+        return flat_values.numpy(), chr_rep
+
+    @staticmethod
+    def save_state_dict(state_dict: dict, output, workers: int=None, mode: int=MODE_BITMASK, codec: int=CODEC_NONE,
+                        level: int=None, fsync: bool=False):
+        """
+        Writes every tensor of a state dict, with its shape and dtype, to one archive (see ArchiveWriter)
+
+        Parameters:
+        state_dict (dict): tensors by name
+        output (str or file): archive file name (written atomically) or writable binary file object
+        workers (int): number of threads encoding tensors (defaults to number of CPUs)
+        mode (int): encoding mode of the tensors (MODE_BITMASK, MODE_ADAPTIVE or MODE_BITMASK64)
+        codec (int): secondary codec of the tensors in bit mask mode
+        level (int): compression level of the codec
+        fsync (bool): flush an archive given by name to disk before it replaces any existing file
+        """
+        with ArchiveWriter(output, workers, mode, codec, level, fsync) as archive:
+            for name, tensor_values in state_dict.items():
+                values, chr_rep = TorchConverter.tensor_to_array(tensor_values)
+                archive.add(name, values, chr_rep, tuple(tensor_values.shape))
+
+    @staticmethod
+    def load_tensor(archive: ArchiveReader, name: str):
+        """
+        Decodes one tensor of an open archive, without reading the other tensors
+
+        Parameters:
+        archive (ArchiveReader): open archive
+        name (str): name of the tensor
+
+        Returns:
+        torch.tensor: tensor with its stored shape and dtype
+        """
+        tensor_dtype = TorchConverter.character_to_dtype(archive.entries[name]["dtype"])
+        values = archive.load(name)
+        return TorchConverter.array_to_tensor(values.reshape(-1), tensor_dtype).reshape(archive.shape(name))
+
+    @staticmethod
+    def load_state_dict(file_name: str, names: list=None):
+        """
+        Reads the tensors of an archive written by save_state_dict
+
+        Parameters:
+        file_name (str): archive file
+        names (list): names of the tensors to read (defaults to all)
+
+        Returns:
+        dict: tensors by name, in the order they were written
+        """
+        with ArchiveReader(file_name) as archive:
+            return {name: TorchConverter.load_tensor(archive, name) for name in (names or archive.names())}
+
 
 
     @staticmethod
-    def binary_to_tensor(file_name: str):
+    def binary_to_tensor(file_name: str, metadata: Metadata=None, use_mmap: bool=False, cache: DecodedCache=None):
         """
         Reads numerical values from binary file and converts them to tensor
 
         Parameters:
         file_name (str): binary file with float or integer values 
+        metadata (Metadata): metadata already read from file, read from the file header if not provided
+        use_mmap (bool): for decoded files, back the tensor by a copy-on-write memory map of the file so
+                         pages are only read when values are used
+        cache (DecodedCache): cache of decoded values, so a file loaded repeatedly is only decoded once.
+                              The tensor gets its own copy of the cached values.
 
         Returns:
         torch.tensor: tensor with values stored in binary file
         """
 
         #get datatype
-        chr_rep = FileReader.metadata_from_binary(file_name)[4]
-        tensor_dtype = TorchConverter.character_to_dtype(chr_rep)
+        if metadata is None:
+            metadata = FileReader.metadata_from_binary(file_name)
+        tensor_dtype = TorchConverter.character_to_dtype(metadata.type_letter)
 
-        #get values
-        values_list = FileReader.get_list(file_name)
+        #torch cannot use values stored in the other byte order in place
+        if use_mmap and not metadata.is_encoded and metadata.is_native:
+            with MappedReader(file_name, metadata) as reader:
+                if not len(reader):
+                    return torch.empty(0, dtype=tensor_dtype)
 
-        #convert to tensor
-        new_tensor = torch.tensor(values_list, dtype=tensor_dtype)
-        
-        #return tensor
-        return new_tensor
-        
+                #array view keeps the mapping alive after the reader is closed
+                return TorchConverter.array_to_tensor(reader.array, tensor_dtype)
 
-    
+        #cached values are shared and read-only, copying them is still much cheaper than decoding
+        if cache is not None:
+            return TorchConverter.array_to_tensor(cache.get_array(file_name, metadata).copy(), tensor_dtype)
+
+        #get values as an array (decoded straight from the mask/value stream for encoded files)
+        values = FileReader.get_array(file_name, metadata)
+
+        #tensor shares memory with the array
+        return TorchConverter.array_to_tensor(values, tensor_dtype)
+
+    @staticmethod
+    def binary_to_sparse_tensor(file_name: str, shape: tuple=None, layout=None,
+                                metadata: Metadata=None):
+        """
+        Reads the non-zero values of an encoded binary file straight into a sparse tensor, without creating
+        the dense tensor
+
+        Parameters:
+        file_name (str): encoded binary file
+        shape (tuple): shape of the tensor (defaults to a flat shape)
+        layout (torch.layout): torch.sparse_coo (default), or torch.sparse_csr for 2D shapes
+        metadata (Metadata): metadata already read from file, read from the file header if not provided
+
+        Returns:
+        torch.tensor: coalesced sparse tensor with the values stored in the binary file
+        """
+        if layout is None:
+            layout = torch.sparse_coo
+        if metadata is None:
+            metadata = FileReader.metadata_from_binary(file_name)
+        tensor_dtype = TorchConverter.character_to_dtype(metadata.type_letter)
+
+        indices, values, length = SparseTools.from_encoded(file_name, metadata)
+        if shape is None:
+            shape = (length,)
+        shape = tuple(shape)
+        if math.prod(shape) != length:
+            raise Exception(f"Shape {shape} does not match the {length} values of the file")
+
+        values = TorchConverter.array_to_tensor(values, tensor_dtype)
+
+        #positions are sorted, unique and in range, so the tensor is already coalesced and valid
+        if layout == torch.sparse_csr:
+            if len(shape) != 2:
+                raise Exception("Compressed sparse row tensors must be 2D")
+            _, columns, row_starts = SparseTools.to_csr(indices, values, shape)
+            return torch.sparse_csr_tensor(torch.from_numpy(row_starts), torch.from_numpy(columns), values, shape,
+                                           check_invariants=False)
+
+        if layout != torch.sparse_coo:
+            raise Exception(f"Sparse layout {layout} is not supported")
+
+        coordinates = torch.from_numpy(np.stack(np.unravel_index(indices, shape)))
+        return torch.sparse_coo_tensor(coordinates, values, shape, is_coalesced=True, check_invariants=False)
+
+    @staticmethod
+    def sparse_tensor_to_binary_file(tensor_values: "torch.Tensor", output, mode: int=MODE_BITMASK, codec: int=CODEC_NONE,
+                                     level: int=None, fsync: bool=False):
+        """
+        Writes a sparse tensor to an encoded binary file from its non-zero values, without creating the dense tensor
+
+        Parameters:
+        tensor_values (torch.Tensor): sparse COO or CSR tensor (or a dense tensor)
+        output (str or file): encoded file name (written atomically) or writable binary file object
+        mode (int): MODE_BITMASK, MODE_ADAPTIVE or MODE_BITMASK64
+        codec (int): secondary codec for bit mask mode
+        level (int): compression level of the codec
+        fsync (bool): flush a file given by name to disk before it replaces any existing file
+        """
+        shape = tuple(tensor_values.shape)
+        if tensor_values.layout == torch.strided:
+            tensor_values = tensor_values.to_sparse()
+        elif tensor_values.layout != torch.sparse_coo:
+            tensor_values = tensor_values.to_sparse_coo()
+
+        #coalescing sorts positions and sums duplicates
+        tensor_values = tensor_values.detach().cpu().coalesce()
+        values, chr_rep = TorchConverter.tensor_to_array(tensor_values.values())
+        indices = np.ravel_multi_index(tuple(tensor_values.indices().numpy()), shape) if len(values) else np.zeros(0, np.int64)
+
+        SparseTools.to_encoded_file(indices, values, math.prod(shape), chr_rep, output, fsync, mode, codec, level)
+
+    @staticmethod
+    def array_to_tensor(values, tensor_dtype: "torch.dtype"):
+        """
+        Wraps a NumPy array of stored values in a tensor of the given dtype without copying
+
+        Parameters:
+        values (numpy.ndarray): values as stored in a binary file (16-bit patterns for bfloat16)
+        tensor_dtype (torch.dtype): dtype of the tensor
+
+        Returns:
+        torch.tensor: tensor sharing memory with values
+        """
+        tensor = torch.from_numpy(values)
+
+        #bfloat16 values are reinterpreted from their bit patterns, not converted
+        if tensor_dtype == torch.bfloat16:
+            return tensor.view(torch.bfloat16)
+
+        return tensor.to(tensor_dtype)
@@ -1,7 +1,10 @@
+#type letter of bfloat16 values, which have no struct module letter and are stored as their 16-bit patterns
+BFLOAT16 = 'E'
+
 class DataHelper:
     
     @staticmethod
-    def letter_from_size(is_float: bool, bytes_size: int):
+    def letter_from_size(is_float: bool, bytes_size: int, is_signed: bool=True):
         """ 
         From a size and data type, provides the appropriate letter used by struct module to 
         represent a numerial data type
@@ -9,16 +12,24 @@ class DataHelper:
         Parameters:
         is_float (bool): True for floats and False for integers
         bytes_size (int): the number of bytes used to represent the number
+        is_signed (bool): False for unsigned integers
 
         Returns:
         str: One character that is used by struct module to represent the data type  
         """
-        #dictionaries with sizes
+        #dictionaries with sizes ('q' and 'Q' are 8 bytes on every machine, unlike 'l' and 'L')
         integer_letter_from_size = {
             1: 'b',
             2: 'h',
             4: 'i',
-            8: 'l'
+            8: 'q'
+        }
+
+        unsigned_letter_from_size = {
+            1: 'B',
+            2: 'H',
+            4: 'I',
+            8: 'Q'
         }
 
         float_letter_from_size = {
@@ -30,6 +41,8 @@ class DataHelper:
         #return based on data type
         if is_float:
             return float_letter_from_size[bytes_size]
+        elif not is_signed:
+            return unsigned_letter_from_size[bytes_size]
         else:
             return integer_letter_from_size[bytes_size]
     
@@ -43,7 +56,7 @@ class DataHelper:
         chr_rep (str): The one character representation used by struct module to represent data type
 
         Returns:
-        str: 'int' if integer or 'float' if float
+        str: 'int' if integer, 'float' if float or 'bool' if boolean
         """
 
         #dictionary with types
@@ -52,16 +65,52 @@ class DataHelper:
             'h': 'int',
             'i': 'int',
             'l': 'int',
+            'q': 'int',
+            'B': 'int',
+            'H': 'int',
+            'I': 'int',
+            'L': 'int',
+            'Q': 'int',
+            '?': 'bool',
             'e': 'float',
             'f': 'float',
-            'd': 'float'
+            'd': 'float',
+            BFLOAT16: 'float'
         }
 
-        #return int or float
+        #return int, float or bool
         return dict_type_from_letter[chr_rep]
+
+    @staticmethod
+    def is_signed(chr_rep: str):
+        """
+        Returns whether a data type holds negative values
+
+        Parameters:
+        chr_rep (str): The one character representation used by struct module to represent data type
+
+        Returns:
+        bool: False for unsigned integers and booleans, True otherwise
+        """
+        return chr_rep not in ('B', 'H', 'I', 'L', 'Q', '?')
+
+    @staticmethod
+    def storage_letter(chr_rep: str):
+        """
+        Returns the struct module character used to store values of a data type. Every type is stored as
+        itself except bfloat16, which is stored as unsigned 16-bit integers holding its bit patterns.
+
+        Parameters:
+        chr_rep (str): struct module character representation of data type, or BFLOAT16
+
+        Returns:
+        str: struct module character representation of the stored values
+        """
+        return 'H' if chr_rep == BFLOAT16 else chr_rep
     
+    #unsigned integers use the indices left free by signed integers, booleans and bfloat16 need an extended header
     _float_letter_from_metadata = ['e', 'f', 'd']
-    _int_letter_from_metadata = ['b', 'h', 'i', 'l']
+    _int_letter_from_metadata = ['b', 'h', 'i', 'l', 'B', 'H', 'I', 'L']
 
     @staticmethod
     def letter_from_metadata(is_float: bool, index: int):
@@ -98,6 +147,8 @@ class DataHelper:
 
         #determine whether float or int
         num_type = DataHelper.type_from_letter(chr_rep)
+        if chr_rep not in DataHelper._float_letter_from_metadata + DataHelper._int_letter_from_metadata:
+            raise Exception(f"Values of type {chr_rep!r} can only be stored with an extended header")
 
         #return appropriate index
         if num_type == 'float':
@@ -0,0 +1,522 @@
+import array
+import struct
+from utils.arraytools import ArrayTools, np
+from utils.bittools import BitTools
+
+#number of values covered by one mask
+WIDE_MASK_SIZE = 64
+
+#an empty mask is followed by the number of consecutive empty masks it stands for (little-endian u32)
+_run_length = struct.Struct('<I')
+_empty_mask = bytes(8)
+
+
+class WideMaskTools:
+    """
+    Bit mask encoding with 64-bit masks and run-length coded empty masks. Every 64 values are stored
+    as an 8-byte mask (first value in the most significant bit of the first byte) followed by the
+    non-zero values of that group. A run of groups without non-zero values is stored as a single
+    empty mask followed by a u32 count of the groups in the run.
+
+    Compared to 8-bit masks, very sparse data needs 8 times fewer masks and long zero regions cost
+    12 bytes, so both the encoded size and the number of blocks walked by the decoder shrink.
+    """
+
+    @staticmethod
+    def encode(values, chr_rep: str):
+        """
+        Encodes values with 64-bit masks and run-length coded empty masks
+
+        Parameters:
+        values: list, array.array, NumPy array or other sequence of numerical values
+        chr_rep (str): struct module character representation of data type
+
+        Returns:
+        bytes: encoded blocks (without the file header)
+        """
+        if np is None:
+            return WideMaskTools._encode_python(values, chr_rep)
+
+        values = ArrayTools.to_array(values, chr_rep).reshape(-1)
+        num_size = values.dtype.itemsize
+        if not len(values):
+            return b''
+
+        #one flag per element, packed 64 at a time (zero padded at the end)
+        non_zero = values != 0
+        num_groups = -(-len(values) // WIDE_MASK_SIZE)
+        masks = np.zeros(num_groups * 8, dtype=np.uint8)
+        packed = np.packbits(non_zero)
+        masks[:len(packed)] = packed
+        masks = masks.reshape(num_groups, 8)
+
+        table = np.array(BitTools._popcount_table, dtype=np.int64)
+        counts = table[masks].sum(axis=1)
+
+        #an empty group starts a run unless the previous group is empty too
+        empty = counts == 0
+        run_starts = empty & ~np.concatenate(([False], empty[:-1]))
+        run_ids = np.cumsum(run_starts) - 1
+        run_lengths = np.bincount(run_ids[empty], minlength=int(run_starts.sum()))
+
+        #bytes written for each group: mask and values, mask and run length, or nothing inside a run
+        sizes = np.where(empty, np.where(run_starts, 8 + _run_length.size, 0), 8 + counts * num_size)
+        starts = np.cumsum(sizes) - sizes
+
+        encoded = np.zeros(int(sizes.sum()), dtype=np.uint8)
+        is_header = np.zeros(len(encoded), dtype=bool)
+
+        mask_positions = starts[~empty][:, None] + np.arange(8)
+        encoded[mask_positions] = masks[~empty]
+        is_header[mask_positions] = True
+
+        run_positions = starts[run_starts][:, None] + np.arange(8 + _run_length.size)
+        encoded[run_positions[:, 8:]] = run_lengths.astype('<u4').view(np.uint8).reshape(-1, _run_length.size)
+        is_header[run_positions] = True
+
+        encoded[~is_header] = np.ascontiguousarray(values[non_zero]).view(np.uint8)
+
+        return encoded.tobytes()
+
+    @staticmethod
+    def _encode_python(values, chr_rep: str):
+        """
+        Pure Python fallback for encode used when NumPy is not installed
+        """
+        pack = struct.Struct(chr_rep).pack
+        encoded = bytearray()
+        run = 0
+
+        for start in range(0, len(values), WIDE_MASK_SIZE):
+            group = values[start:start + WIDE_MASK_SIZE]
+
+            #first element of group is stored in the most significant bit
+            mask = 0
+            for i, element in enumerate(group):
+                if element != 0:
+                    mask |= 1 << (63 - i)
+
+            if mask == 0:
+                run += 1
+                continue
+
+            if run:
+                encoded += _empty_mask + _run_length.pack(run)
+                run = 0
+
+            encoded += mask.to_bytes(8, "big")
+            for element in group:
+                if element != 0:
+                    encoded += pack(element)
+
+        if run:
+            encoded += _empty_mask + _run_length.pack(run)
+
+        return bytes(encoded)
+
+    @staticmethod
+    def trailing_empty_groups(values):
+        """
+        Returns the number of groups of 64 values at the end of values without any non-zero value
+        (the last group can hold fewer than 64 values)
+
+        Parameters:
+        values: numpy.ndarray, array.array or list of values
+
+        Returns:
+        int: number of empty groups the encoded values end with
+        """
+        num_groups = -(-len(values) // WIDE_MASK_SIZE)
+
+        if np is not None:
+            non_zero = np.flatnonzero(np.asarray(values) != 0)
+            last = int(non_zero[-1]) if len(non_zero) else -1
+        else:
+            last = len(values) - 1
+            while last >= 0 and values[last] == 0:
+                last -= 1
+
+        return num_groups - (last // WIDE_MASK_SIZE + 1)
+
+    @staticmethod
+    def complete_blocks(buffer, num_size: int, start: int=0, end: int=None):
+        """
+        Finds every block (mask and values, or empty mask and run length) that fits completely in the buffer
+
+        Parameters:
+        buffer (bytes-like): encoded blocks
+        num_size (int): size of each value in bytes
+        start (int): position of the first block in buffer
+        end (int): position where the available data ends (defaults to end of buffer)
+
+        Returns:
+        array.array: positions of the blocks in buffer
+        array.array: number of groups each block covers (1 for a mask block, the run length for empty masks)
+        int: position where the complete blocks end
+        """
+        if end is None:
+            end = len(buffer)
+
+        #bytes give fast slicing for the hop loop
+        if not isinstance(buffer, bytes):
+            buffer = bytes(buffer)
+
+        offsets = array.array('q')
+        groups = array.array('q')
+        position = start
+
+        while position + 8 <= end:
+            mask = buffer[position:position + 8]
+            if mask == _empty_mask:
+                block_end = position + 8 + _run_length.size
+                if block_end > end:
+                    break
+                run = _run_length.unpack_from(buffer, position + 8)[0]
+                if run == 0:
+                    raise Exception("Bit mask encoded data is corrupted")
+            else:
+                block_end = position + 8 + int.from_bytes(mask, "big").bit_count() * num_size
+                if block_end > end:
+                    break
+                run = 1
+
+            offsets.append(position)
+            groups.append(run)
+            position = block_end
+
+        return offsets, groups, position
+
+    @staticmethod
+    def decode(buffer, chr_rep: str, length: int):
+        """
+        Decodes 64-bit mask encoded blocks
+
+        Parameters:
+        buffer (bytes-like): encoded blocks (without the file header)
+        chr_rep (str): struct module character representation of data type
+        length (int): number of values stored
+
+        Returns:
+        numpy.ndarray: decoded values (array.array or list if NumPy is not installed)
+        """
+        offsets, groups, position = WideMaskTools.complete_blocks(buffer, struct.calcsize(chr_rep))
+        if position != len(buffer) or sum(groups) != -(-length // WIDE_MASK_SIZE):
+            raise Exception("Bit mask encoded data is truncated or corrupted")
+
+        return WideMaskTools.decode_blocks(buffer, offsets, groups, chr_rep, length, position)
+
+    @staticmethod
+    def decode_blocks(buffer, offsets, groups, chr_rep: str, length: int, end: int=None):
+        """
+        Decodes the complete blocks found by complete_blocks into a preallocated zero filled array
+
+        Parameters:
+        buffer (bytes-like): encoded blocks
+        offsets (array.array): positions of the blocks in buffer
+        groups (array.array): number of groups each block covers
+        chr_rep (str): struct module character representation of data type
+        length (int): number of values to decode (at most 64 per group)
+        end (int): position where the blocks end (defaults to end of buffer)
+
+        Returns:
+        numpy.ndarray: decoded values (array.array or list if NumPy is not installed)
+        """
+        if np is None:
+            return WideMaskTools._decode_python(buffer, offsets, groups, chr_rep, length)
+
+        values = ArrayTools.zeros(length, chr_rep)
+        if not len(offsets):
+            return values
+
+        if end is None:
+            end = len(buffer)
+
+        offsets = np.frombuffer(offsets, dtype=np.int64)
+        groups = np.frombuffer(groups, dtype=np.int64)
+        encoded = np.frombuffer(buffer, dtype=np.uint8, count=end)[offsets[0]:]
+        offsets = offsets - offsets[0]
+
+        #index of the first value of every block
+        first_values = (np.cumsum(groups) - groups) * WIDE_MASK_SIZE
+
+        #mask and run length bytes are not values
+        masks = encoded[offsets[:, None] + np.arange(8)]
+        is_run = ~masks.any(axis=1)
+        is_header = np.zeros(len(encoded), dtype=bool)
+        is_header[offsets[:, None] + np.arange(8)] = True
+        is_header[offsets[is_run][:, None] + 8 + np.arange(_run_length.size)] = True
+        non_zero_values = encoded[~is_header].view(ArrayTools.dtype_from_letter(chr_rep))
+
+        #scatter non-zero values to the positions of set bits
+        blocks, bits = np.nonzero(np.unpackbits(masks[~is_run], axis=1))
+        positions = first_values[~is_run][blocks] + bits
+        if len(positions) and positions[-1] >= length:
+            raise Exception("Bit mask encoded data is corrupted")
+        values[positions] = non_zero_values
+
+        return values
+
+    @staticmethod
+    def decode_sparse(buffer, chr_rep: str, length: int):
+        """
+        Decodes 64-bit mask encoded blocks into the positions and values of the non-zero values, without
+        creating the decoded array
+
+        Parameters:
+        buffer (bytes-like): encoded blocks (without the file header)
+        chr_rep (str): struct module character representation of data type
+        length (int): number of values stored
+
+        Returns:
+        numpy.ndarray: int64 positions of the non-zero values (array.array of 'q' if NumPy is not installed)
+        numpy.ndarray: non-zero values (array.array or list if NumPy is not installed)
+        """
+        num_size = struct.calcsize(chr_rep)
+        offsets, groups, position = WideMaskTools.complete_blocks(buffer, num_size)
+        if position != len(buffer) or sum(groups) != -(-length // WIDE_MASK_SIZE):
+            raise Exception("Bit mask encoded data is truncated or corrupted")
+
+        if np is None:
+            return WideMaskTools._decode_sparse_python(buffer, offsets, groups, chr_rep)
+
+        encoded = np.frombuffer(buffer, dtype=np.uint8)
+        offsets = np.frombuffer(offsets, dtype=np.int64)
+        groups = np.frombuffer(groups, dtype=np.int64)
+        first_values = (np.cumsum(groups) - groups) * WIDE_MASK_SIZE
+
+        #runs of empty masks hold no values
+        masks = encoded[offsets[:, None] + np.arange(8)]
+        is_run = ~masks.any(axis=1)
+        offsets = offsets[~is_run]
+        masks = masks[~is_run]
+
+        #positions of the set bits of every non-empty mask
+        blocks, bits = np.nonzero(np.unpackbits(masks, axis=1))
+        indices = first_values[~is_run][blocks] + bits
+        if len(indices) and indices[-1] >= length:
+            raise Exception("Bit mask encoded data is corrupted")
+
+        #value bytes follow each mask
+        table = np.array(BitTools._popcount_table, dtype=np.int64)
+        value_sizes = table[masks].sum(axis=1) * num_size
+        value_starts = offsets + 8 - (np.cumsum(value_sizes) - value_sizes)
+        positions = np.repeat(value_starts, value_sizes) + np.arange(int(value_sizes.sum()))
+
+        return indices, encoded[positions].view(ArrayTools.dtype_from_letter(chr_rep))
+
+    @staticmethod
+    def _decode_sparse_python(buffer, offsets, groups, chr_rep: str):
+        """
+        Pure Python fallback for decode_sparse used when NumPy is not installed
+        """
+        unpack_from = struct.Struct(chr_rep).unpack_from
+        num_size = struct.calcsize(chr_rep)
+        indices = array.array('q')
+        values = []
+        first_value = 0
+
+        for offset, run in zip(offsets, groups):
+            mask = int.from_bytes(buffer[offset:offset + 8], "big")
+            position = offset + 8
+
+            for i in range(WIDE_MASK_SIZE if mask else 0):
+                if mask & (1 << (63 - i)):
+                    indices.append(first_value + i)
+                    values.append(unpack_from(buffer, position)[0])
+                    position += num_size
+
+            first_value += run * WIDE_MASK_SIZE
+
+        return indices, array.array(chr_rep, values) if chr_rep in array.typecodes else values
+
+    @staticmethod
+    def _decode_python(buffer, offsets, groups, chr_rep: str, length: int):
+        """
+        Pure Python fallback for decode_blocks used when NumPy is not installed
+        """
+        unpack_from = struct.Struct(chr_rep).unpack_from
+        num_size = struct.calcsize(chr_rep)
+        values = ArrayTools.zeros(length, chr_rep)
+        first_value = 0
+
+        for offset, run in zip(offsets, groups):
+            mask = int.from_bytes(buffer[offset:offset + 8], "big")
+            position = offset + 8
+
+            #empty masks only move past their run of zero values
+            for i in range(WIDE_MASK_SIZE if mask else 0):
+                if mask & (1 << (63 - i)):
+                    values[first_value + i] = unpack_from(buffer, position)[0]
+                    position += num_size
+
+            first_value += run * WIDE_MASK_SIZE
+
+        return values
+
+
+class WideRunJoiner:
+    """
+    Joins 64-bit mask encoded pieces of consecutive values that were encoded one at a time (by worker
+    processes or a stream encoder). A run of empty masks ending one piece is merged with the run starting
+    the next piece, so the joined blocks are byte-identical to encoding all values at once. The run
+    ending the latest piece is held back until the next piece or finish.
+    """
+
+    def __init__(self):
+        self._run = 0
+
+    def join(self, encoded, trailing_groups: int):
+        """
+        Returns the blocks of the next piece, merged with the run held back from the previous piece
+
+        Parameters:
+        encoded (bytes): encoded blocks of a piece of whole groups (only the last piece can end in a partial group)
+        trailing_groups (int): number of empty groups the piece ends with (see WideMaskTools.trailing_empty_groups)
+
+        Returns:
+        bytes: blocks to write
+        """
+        if not encoded:
+            return b''
+
+        #a piece always starts with a block, so an empty mask at its start is a run
+        start = 0
+        if encoded[:8] == _empty_mask:
+            start = 8 + _run_length.size
+            self._run += _run_length.unpack_from(encoded, 8)[0]
+            if start == len(encoded):
+                return b''
+
+        end = len(encoded) - (8 + _run_length.size if trailing_groups else 0)
+        if not start and not self._run and end == len(encoded):
+            self._run = trailing_groups
+            return encoded
+
+        joined = WideRunJoiner._run_blocks(self._run) + encoded[start:end]
+        self._run = trailing_groups
+        return joined
+
+    def finish(self):
+        """
+        Returns:
+        bytes: the run held back from the last piece (empty if it did not end with a run)
+        """
+        blocks = WideRunJoiner._run_blocks(self._run)
+        self._run = 0
+        return blocks
+
+    @staticmethod
+    def _run_blocks(groups: int):
+        #a run longer than the largest run length is stored as several runs
+        max_run = (1 << (8 * _run_length.size)) - 1
+        return b''.join(_empty_mask + _run_length.pack(min(groups - start, max_run)) for start in range(0, groups, max_run))
+
+
+class WideStreamDecoder:
+    """
+    Decodes 64-bit mask encoded data that arrives in pieces, with the same interface as StreamDecoder.
+    Bytes of a block cut off at the end of a piece are kept until the next piece arrives.
+    """
+
+    def __init__(self, chr_rep: str, length: int):
+        """
+        Parameters:
+        chr_rep (str): struct module character representation of data type
+        length (int): number of values stored
+        """
+        self.chr_rep = chr_rep
+        self.length = length
+        self._num_size = struct.calcsize(chr_rep)
+        self._position = 0
+        self._leftover = b''
+
+    def feed(self, data):
+        """
+        Decodes every block completed by data
+
+        Parameters:
+        data (bytes-like): next piece of encoded blocks
+
+        Returns:
+        numpy.ndarray: decoded values (array.array or list if NumPy is not installed)
+        """
+        buffer = self._leftover + bytes(data)
+        offsets, groups, end = WideMaskTools.complete_blocks(buffer, self._num_size)
+        self._leftover = buffer[end:]
+
+        #the last group can hold fewer than 64 values
+        count = min(sum(groups) * WIDE_MASK_SIZE, self.length - self._position)
+        if count < 0 or (count == 0 and len(offsets)):
+            raise Exception("Bit mask encoded data is corrupted")
+
+        self._position += count
+        return WideMaskTools.decode_blocks(buffer, offsets, groups, self.chr_rep, count, end)
+
+    def iter_feed(self, data, max_values: int=None):
+        """
+        Decodes every block completed by data, a batch of blocks of at most max_values values at a time.
+        A run of empty masks takes 12 bytes but stands for up to 2^32 groups, so runs longer than a batch
+        are created as zeros a piece at a time. The generator must be exhausted before more data is fed.
+
+        Parameters:
+        data (bytes-like): next piece of encoded blocks
+        max_values (int): maximum number of values per yielded array (None yields all values at once)
+
+        Yields:
+        numpy.ndarray: decoded values (array.array or list if NumPy is not installed)
+        """
+        if max_values is None:
+            yield self.feed(data)
+            return
+
+        buffer = self._leftover + bytes(data)
+        offsets, groups, end = WideMaskTools.complete_blocks(buffer, self._num_size)
+        self._leftover = buffer[end:]
+
+        count = min(sum(groups) * WIDE_MASK_SIZE, self.length - self._position)
+        if count < 0 or (count == 0 and len(offsets)):
+            raise Exception("Bit mask encoded data is corrupted")
+
+        #consecutive blocks are decoded together until the batch would exceed max_values
+        max_groups = max(max_values // WIDE_MASK_SIZE, 1)
+        first = 0
+        batch_groups = 0
+        for i, run in enumerate(groups):
+            if batch_groups and batch_groups + run > max_groups:
+                yield from self._decode_batch(buffer, offsets[first:i], groups[first:i], batch_groups, offsets[i],
+                                              max_values)
+                first = i
+                batch_groups = 0
+
+            if run > max_groups:
+                batch_count = min(run * WIDE_MASK_SIZE, self.length - self._position)
+                self._position += batch_count
+                yield from ArrayTools.iter_zeros(batch_count, self.chr_rep, max_values)
+                first = i + 1
+                continue
+
+            batch_groups += run
+
+        if batch_groups:
+            yield from self._decode_batch(buffer, offsets[first:], groups[first:], batch_groups, end, max_values)
+
+    def _decode_batch(self, buffer, offsets, groups, batch_groups: int, end: int, max_values: int):
+        """
+        Decodes consecutive blocks ending at end, split into pieces of at most max_values values
+        """
+        count = min(batch_groups * WIDE_MASK_SIZE, self.length - self._position)
+        self._position += count
+        yield from ArrayTools.split(WideMaskTools.decode_blocks(buffer, offsets, groups, self.chr_rep, count, end),
+                                    max_values)
+
+    def finish(self):
+        """
+        Checks that all data has been fed
+
+        Returns:
+        numpy.ndarray: empty array, all values are returned by feed
+        """
+        if self._leftover or self._position != self.length:
+            raise Exception("Bit mask encoded data is truncated or corrupted")
+
+        return ArrayTools.zeros(0, self.chr_rep)
@@ -1,22 +1,51 @@
+from utils.arraytools import ArrayTools
+from utils.cachetools import DecodedCache
 from utils.filetools import FileReader
+from utils.indextools import BlockIndex, EncodedReader
+from utils.maptools import MappedReader
 import sys
 
 
 if __name__ == "__main__":
+    #optional directory of decoded files shared between runs: --cache DIR
+    cache = None
+    if "--cache" in sys.argv:
+        position = sys.argv.index("--cache")
+        cache = DecodedCache(cache_dir=sys.argv[position + 1])
+        del sys.argv[position:position + 2]
+
     file_name = sys.argv[1]
+    file_type, metadata = FileReader.get_file_info(file_name)
+
+    if file_type == "csv":
+        #every row is read, as compressor.py encodes every row; a trailing 'i' reads integers
+        is_float = len(sys.argv) < 3 or sys.argv[2] != "i"
+        values = FileReader.list_from_csv(file_name, is_float, rows=None)
+
+    else:
+        #optional start and stop index of values to show for binary files
+        start = int(sys.argv[2]) if len(sys.argv) > 2 else None
+        stop = int(sys.argv[3]) if len(sys.argv) > 3 else None
+        value_range = slice(start, stop)
 
-    if FileReader.get_file_type(file_name) == "csv":
-        try:
-            if sys.argv[2] == "i":
-                values = FileReader.list_from_csv(file_name, False)
-        except IndexError:
-                values = FileReader.list_from_csv(file_name)
-    
-    else:     
-        #get list of values
-        values = FileReader.get_list(file_name)
+        if file_type == "decoded":
+            #map file so only the requested values are read
+            with MappedReader(file_name, metadata) as reader:
+                values = ArrayTools.to_list(reader[value_range])
+        elif file_type == "encoded" and len(sys.argv) > 2 and BlockIndex.load(file_name):
+            #block index lets only the masks around the requested values be decoded
+            with EncodedReader(file_name, metadata=metadata) as reader:
+                values = ArrayTools.to_list(reader[value_range])
+        elif cache is not None:
+            #decoded once, later runs map the decoded file from the cache
+            values = ArrayTools.to_list(cache.get_array(file_name, metadata)[value_range])
+        else:
+            #get list of values
+            values = FileReader.get_list(file_name)
+            if values:
+                values = values[value_range]
 
     if values:
         print(values)
     else:
-        print("ERROR: Incompatible file")
\ No newline at end of file
+        print("ERROR: Incompatible file")